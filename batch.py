@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeopleFlowVisualization
+                                 A QGIS plugin
+ This plugin visualize people flow
+                             -------------------
+        begin                : 2022-10-07
+        copyright            : (C) 2022 by MLIT
+        email                : trial@MILT
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ 抽出条件の組み合わせごとの一括出力
+
+ 組み合わせごとの分析は画面と同じ分析処理(ダイアログの analyze_001 など)で行い、
+ ここでは組み合わせの作成と出力ファイル名を扱う
+"""
+
+import itertools
+import re
+
+from .dataset import Condition, parse_filter
+
+# 一括出力するHTMLの上限数
+MAX_REPORTS = 1000
+
+
+def combinations(data, filter_list):
+    """プルダウンの入力から出力する組み合わせのリストを作る
+
+    複数の値・範囲を入力した項目は該当する値ごとに分け、1つの値の項目はその値、ALLの項目は絞り込まない。
+    戻り値は [{項目名: 値}] (ALLの項目は含まない)
+    """
+    choices = []
+    for cnt, text in enumerate(filter_list):
+        name = "option" + str(cnt+1)
+        condition = parse_filter(text)
+        if condition is None:
+            continue
+        if isinstance(condition, Condition):
+            values = condition.select(data.unique(name))
+        else:
+            values = [condition]
+        choices.append([(name, value) for value in values])
+    return [dict(items) for items in itertools.product(*choices)]
+
+
+def filter_texts(filter_list, filters):
+    """組み合わせ({項目名: 値})をプルダウンの入力(filter_list と同じ形式)に戻す(ALLの項目はそのまま)"""
+    return [str(filters.get("option" + str(cnt+1), text)) for cnt, text in enumerate(filter_list)]
+
+
+def report_name(page, filters, used):
+    """出力ファイル名(分析処理の番号と条件の値をつなげ、ファイル名に使えない文字は置き換える)
+
+    置き換えた結果が出力済みの名前(used、大文字・小文字は区別しない)と同じ場合は "_2", "_3" … を付ける。
+    決めた名前は used に追加する
+    """
+    parts = [str(value) for name, value in sorted(filters.items(), key=lambda item: int(item[0][6:]))]
+    base = re.sub(r'[\\/:*?"<>|\s]', "-", "_".join([page] + parts))
+    name = base + ".html"
+    number = 2
+    while name.lower() in used:
+        name = "{}_{}.html".format(base, number)
+        number += 1
+    used.add(name.lower())
+    return name
@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeopleFlowVisualization
+                                 A QGIS plugin
+ This plugin visualize people flow
+                             -------------------
+        begin                : 2022-10-07
+        copyright            : (C) 2022 by MLIT
+        email                : trial@MILT
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ 読み込み済みデータのキャッシュ(列ごとの.npyファイル)
+
+ 同じファイルを再度開いたときは、CSVの解析を行わずに .npy をメモリマップで開く
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from .dataset import Dataset
+
+
+def user_cache_dir(name):
+    """プラグインのデータの保存先のフォルダ
+
+    QGISのユーザープロファイルの cache フォルダの下に作る(QGIS外ではOSのキャッシュフォルダ)。
+    プラグインのフォルダは更新・再インストールで削除されるため使わない
+    """
+    try:
+        from qgis.core import QgsApplication
+        base = QgsApplication.qgisSettingsDirPath()
+    except ImportError:
+        base = ""
+    if base:
+        return os.path.join(base, "cache", "PeopleFlowVisualization", name)
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "PeopleFlowVisualization", name)
+
+
+def setting_bytes(name, default):
+    """QGISの設定(詳細設定の PeopleFlowVisualization/name、単位はMB)のバイト数
+
+    QGIS外・未設定・数値でない場合は default(バイト数)
+    """
+    try:
+        from qgis.core import QgsSettings
+    except ImportError:
+        return default
+    value = QgsSettings().value("PeopleFlowVisualization/" + name, None)
+    try:
+        return int(float(value) * 1024 * 1024)
+    except (TypeError, ValueError):
+        return default
+
+
+def log_warning(message):
+    """QGISのログに警告を出力する(QGIS外では何もしない)"""
+    try:
+        from qgis.core import Qgis, QgsMessageLog
+    except ImportError:
+        return
+    QgsMessageLog.logMessage(message, "PeopleFlowVisualization", Qgis.Warning)
+
+
+# キャッシュの保存先
+CACHE_DIR = user_cache_dir("cache")
+# キャッシュ全体の上限サイズ(超えた場合は使われていない順に削除する)
+MAX_CACHE_BYTES = 10 * 1024 * 1024 * 1024
+# 内容のハッシュに使うファイル先頭・末尾のバイト数
+HASH_BYTES = 1024 * 1024
+# 保存形式を変えた場合は上げる
+CACHE_VERSION = 3
+# キャッシュを使うかどうか
+ENABLED = True
+
+META_FILE = "meta.json"
+
+
+def fingerprint(path, *extra):
+    """パス・サイズ・更新日時・先頭と末尾の内容からキャッシュのキーを作る"""
+    stat = os.stat(path)
+    h = hashlib.sha1()
+    h.update(repr((os.path.abspath(path), stat.st_size, stat.st_mtime_ns, CACHE_VERSION) + extra).encode("utf-8"))
+    with open(path, mode='rb') as f:
+        h.update(f.read(HASH_BYTES))
+        if stat.st_size > HASH_BYTES * 2:
+            f.seek(-HASH_BYTES, os.SEEK_END)
+            h.update(f.read(HASH_BYTES))
+    return h.hexdigest()
+
+
+def entry_dir(key):
+    return os.path.join(CACHE_DIR, key)
+
+
+def load(key):
+    """キャッシュがあれば Dataset を返す(数値・番号の列はメモリマップで開く)。無ければNone"""
+    if not ENABLED:
+        return None
+    path = entry_dir(key)
+    meta_path = os.path.join(path, META_FILE)
+    if not os.path.isfile(meta_path):
+        return None
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta["version"] != CACHE_VERSION:
+            return None
+
+        columns = {}
+        categories = {}
+        for i, name in enumerate(meta["header"] + meta["extra"]):
+            kind = meta["columns"][name]
+            values = np.load(os.path.join(path, "{}.npy".format(i)), mmap_mode='r')
+            if kind == "array":
+                columns[name] = values
+            else:
+                uniques = np.load(os.path.join(path, "{}.uniques.npy".format(i))).astype(object)
+                if kind == "category":
+                    columns[name] = values
+                    categories[name] = uniques
+                else:
+                    columns[name] = uniques[values]
+
+        # 使用日時を更新する(削除の順番に使う)
+        os.utime(meta_path, None)
+    except Exception:
+        shutil.rmtree(path, ignore_errors=True)
+        return None
+
+    data = Dataset(meta["kind"], meta["header"], columns, categories)
+    data.fingerprint = key
+    return data
+
+
+def save(key, data):
+    """Dataset をキャッシュに保存する
+
+    失敗しても読み込み処理は続ける(原因はQGISのログに出力し、書きかけのフォルダは削除する)
+    """
+    if not ENABLED:
+        return
+    path = entry_dir(key)
+    if os.path.isdir(path):
+        return
+    tmp = None
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix=".tmp-", dir=CACHE_DIR)
+        # ヘッダー以外に読み込み時に作成した項目(UNIX時間など)も保存する
+        extra = [name for name in data.columns if name not in data.header]
+        meta = {"version": CACHE_VERSION, "kind": data.kind, "header": data.header, "extra": extra,
+                "rows": len(data), "columns": {}}
+        for i, name in enumerate(data.header + extra):
+            values = data.columns[name]
+            if name in data.categories:
+                kind = "category"
+                uniques = data.categories[name]
+            elif values.dtype == object:
+                # 文字列はユニーク値と番号に分けて保存する
+                kind = "strings"
+                values, uniques = pd.factorize(values)
+            else:
+                kind = "array"
+                uniques = None
+            np.save(os.path.join(tmp, "{}.npy".format(i)), np.asarray(values))
+            if uniques is not None:
+                np.save(os.path.join(tmp, "{}.uniques.npy".format(i)), np.array([str(v) for v in uniques], dtype=str))
+            meta["columns"][name] = kind
+
+        with open(os.path.join(tmp, META_FILE), mode="w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        tmp = None
+    except Exception as e:
+        log_warning("キャッシュを保存できませんでした({}): {}".format(CACHE_DIR, e))
+    finally:
+        if tmp is not None:
+            shutil.rmtree(tmp, ignore_errors=True)
+    evict()
+
+
+def evict(max_bytes=None):
+    """キャッシュ全体が上限サイズを超えていれば、最後に使われた日時が古いものから削除する"""
+    if max_bytes is None:
+        max_bytes = MAX_CACHE_BYTES
+    if not os.path.isdir(CACHE_DIR):
+        return
+    entries = []
+    total = 0
+    for name in os.listdir(CACHE_DIR):
+        path = os.path.join(CACHE_DIR, name)
+        meta_path = os.path.join(path, META_FILE)
+        if name.startswith(".") or not os.path.isfile(meta_path):
+            continue
+        size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+        entries.append((os.path.getmtime(meta_path), size, path))
+        total += size
+
+    for used, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        # 開いているファイルは削除できない場合がある(その場合は次回に削除する)
+        shutil.rmtree(path, ignore_errors=True)
+        if not os.path.isdir(path):
+            total -= size
+
+
+def clear():
+    shutil.rmtree(CACHE_DIR, ignore_errors=True)
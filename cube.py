@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeopleFlowVisualization
+                                 A QGIS plugin
+ This plugin visualize people flow
+                             -------------------
+        begin                : 2022-10-07
+        copyright            : (C) 2022 by MLIT
+        email                : trial@MILT
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ メッシュ人流データの集計キューブ(meshcode x option1..N ごとの value の合計)
+
+ 読み込み時に1回だけ作成し、抽出条件を変えたときはキューブの絞り込みと合計のみで結果を求める
+"""
+
+import numpy as np
+import pandas as pd
+
+from .dataset import MESH, Dataset, concat
+
+
+class MeshCube(object):
+    """meshcode, option1..N の組み合わせごとに value を合計した Dataset を保持する
+
+    行の並びは元のデータで組み合わせが最初に現れた順
+    """
+
+    def __init__(self, data):
+        self.data = data
+
+    def __len__(self):
+        return len(self.data)
+
+    def slice(self, filters):
+        """{項目名: 値} の等価条件(ALLの項目は指定しない)で絞り込み、meshcode ごとに合計した Dataset を返す
+
+        結果の option1..N は各メッシュで最初に現れた行の値(native:aggregate の first_value と同じ)。
+        行の並びはメッシュが最初に現れた順
+        """
+        return self.data.aggregate_rows("meshcode", "sum", self.data.mask(filters))
+
+    def append(self, other):
+        """追加で読み込んだデータのキューブを結合した新しいキューブを返す
+
+        追加分は読み込み時に集計済みのため全体は集計し直さず、既存の組み合わせの行には value を加算し、
+        新しい組み合わせの行のみ後ろに追加する
+        """
+        return MeshCube(merge(self.data, other.data))
+
+
+def group(data):
+    """meshcode, option1..N の番号の組み合わせごとに value を合計した Dataset(値の無い行は0として合計する)"""
+    names = data.header[:-1]
+    frame = pd.DataFrame({name: data.codes(name) for name in names}, columns=names)
+    frame["value"] = data.column("value")
+    grouped = frame.groupby(names, sort=False)["value"].sum().reset_index()
+    columns = {name: grouped[name].to_numpy(dtype=np.int32) for name in names}
+    columns["value"] = grouped["value"].to_numpy(dtype=np.float64)
+    result = Dataset(MESH, data.header, columns, data.categories)
+    result.build_index()
+    return result
+
+
+def merge(base, delta):
+    """組み合わせごとに集計した2つの Dataset を、group() で全行を集計し直した場合と同じ並びの Dataset にまとめる"""
+    names = base.header[:-1]
+    result = concat(MESH, base.header, [base.parts(), delta.parts()])
+    count = len(base)
+    keys = pd.MultiIndex.from_arrays([result.codes(name) for name in names])
+    positions = keys[:count].get_indexer(keys[count:])
+    matched = np.flatnonzero(positions >= 0)
+    values = result.columns["value"]
+    values[positions[matched]] += values[count + matched]
+    keep = np.ones(len(result), dtype=bool)
+    keep[count + matched] = False
+    columns = {name: column[keep] for name, column in result.columns.items()}
+    merged = Dataset(MESH, base.header, columns, result.categories)
+    merged.build_index()
+    return merged
+
+
+def join_rows(data, mask, alist, aggregated=None):
+    """分析処理(001)でメッシュに結合する行と、result.csv に出力する行を返す
+
+    alist(1つの値に絞り込まない項目)があれば meshcode ごとに value を合計した行(native:aggregate と同じ)、
+    無ければ抽出した行のうち meshcode ごとに最初の行(joinattributestable の最初に一致した地物と同じ)を結合する。
+    aggregated は集計キューブで合計済みの行(alist がある場合のみ指定する)。
+    戻り値は (結合する行の Dataset, result.csv に出力する Dataset)。result.csv が抽出した行そのものの場合はNone
+    """
+    if aggregated is not None:
+        return aggregated, aggregated
+    if len(alist) != 0:
+        rows = data.aggregate_rows("meshcode", "sum", mask)
+        return rows, rows
+    return data.aggregate_rows("meshcode", "first", mask), None
+
+
+def join_layer(mesh_layer, joined):
+    """メッシュのレイヤ('sptial')の地物に joined の value を結合したメモリレイヤ(meshcode, value)を作成する
+
+    値の無いメッシュは NULL(joinattributestable の DISCARD_NONMATCHING=False と同じ)
+    """
+    from qgis.PyQt.QtCore import QVariant
+    from qgis.core import QgsVectorLayer, QgsField, QgsFeature
+
+    values = pd.Series(joined.column("value"), index=joined.column("meshcode"))
+    features = list(mesh_layer.getFeatures())
+    meshcodes = [feat["meshcode"] for feat in features]
+    mesh_values = values.reindex(meshcodes).to_numpy()
+
+    result = QgsVectorLayer('Polygon?crs=epsg:4326', 'result', 'memory')
+    result.setProviderEncoding('UTF-8')
+    provider = result.dataProvider()
+    provider.setEncoding('UTF-8')
+    provider.addAttributes([QgsField("meshcode", QVariant.String), QgsField("value", QVariant.Double)])
+    result.updateFields()
+    out_features = []
+    for feat, meshcode, value in zip(features, meshcodes, mesh_values):
+        out = QgsFeature(result.fields())
+        out.setGeometry(feat.geometry())
+        out.setAttributes([meshcode, None if np.isnan(value) else float(value)])
+        out_features.append(out)
+    provider.addFeatures(out_features)
+    result.updateExtents()
+    return result
+
+
+def build(data):
+    """メモリ上の Dataset からキューブを作成する(一時保存したデータはSQLiteで集計するためNone)"""
+    if not isinstance(data, Dataset):
+        return None
+    return MeshCube(group(data))
@@ -0,0 +1,564 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeopleFlowVisualization
+                                 A QGIS plugin
+ This plugin visualize people flow
+                             -------------------
+        begin                : 2022-10-07
+        copyright            : (C) 2022 by MLIT
+        email                : trial@MILT
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ 読み込んだ人流データを列ごとの配列で保持する
+"""
+
+import hashlib
+
+import numpy as np
+import pandas as pd
+from dateutil import tz
+
+# データの種類
+MESH = "mesh"       # メッシュ人流データ(001)
+SENSOR = "sensor"   # 計測データ(002)
+OD = "od"           # 移動滞在ログデータ(003)
+LOG = "log"         # ログデータ(003-2)
+
+# 文字列以外で保持する項目
+FLOAT_COLUMNS = ("value", "lat", "lon")
+# ビットマップ索引を作成する項目の値の種類の上限(超える項目は番号を比較して抽出する)
+MAX_BITMAP_VALUES = 256
+# 複数の値の条件でビットマップを合わせる値の数の上限(超える場合は番号の対応表で抽出する)
+MAX_BITMAP_UNION = 8
+# プルダウンに入力する抽出条件の区切り(複数の値・範囲)
+VALUE_SEPARATORS = (",", "、")
+RANGE_SEPARATORS = ("～", "~")
+
+
+def is_category(name):
+    """辞書(ユニーク値)と番号で保持する項目(meshcode, id, option1..N)"""
+    return name in ("meshcode", "id") or name.startswith("option")
+
+
+def encode(values):
+    """値の配列を (ユニーク値の配列(昇順), 番号の配列) にする"""
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object), sort=True)
+    return np.asarray(uniques, dtype=object), codes.astype(np.int32)
+
+
+def merge_encoded(parts):
+    """(ユニーク値, 番号) のリストを1つの辞書と番号の配列にまとめる"""
+    if len(parts) == 0:
+        return np.array([], dtype=object), np.array([], dtype=np.int32)
+    categories = np.unique(np.concatenate([uniques for uniques, codes in parts]))
+    codes = np.concatenate([np.searchsorted(categories, uniques).astype(np.int32)[codes]
+                            for uniques, codes in parts])
+    return categories, codes
+
+
+def extend_categories(categories, uniques, codes):
+    """辞書(昇順)に追加分の値 (ユニーク値, 番号) を加える
+
+    戻り値は (新しい辞書, 既存の番号から新しい番号への対応表(番号が変わらない場合はNone), 追加分の新しい番号)。
+    既存の行の値は変換し直さず、番号が変わる場合も対応表で付け替えるだけにする
+    """
+    merged = np.unique(np.concatenate([categories, uniques]))
+    remap = None
+    if len(merged) != len(categories):
+        positions = np.searchsorted(merged, categories).astype(np.int32)
+        if np.any(positions != np.arange(len(categories))):
+            remap = positions
+    return merged, remap, np.searchsorted(merged, uniques).astype(np.int32)[codes]
+
+
+def append_bitmaps(bitmaps, rows, codes, count, remap=None):
+    """rows 行分のビットマップに、追加の行(番号 codes)のビットを加えたビットマップ(番号数 count)を返す
+
+    既存の行のビットは作り直さず、番号が変わった値(remap)はビットマップの行を移し、新しい値の既存の行は0とする
+    """
+    result = np.zeros((count, (rows + len(codes) + 7) // 8), dtype=np.uint8)
+    targets = remap if remap is not None else np.arange(len(bitmaps))
+    result[targets, :bitmaps.shape[1]] = bitmaps
+    start, offset = divmod(rows, 8)
+    for code in range(count):
+        bits = codes == code
+        if offset:
+            # 途中まで使われている最後のバイトは、既存の行のビットとつなげて詰め直す
+            bits = np.concatenate([np.unpackbits(result[code, start:start + 1])[:offset].astype(bool), bits])
+        result[code, start:] = np.packbits(bits)
+    return result
+
+
+def build_bitmaps(codes, count):
+    """番号の配列から、番号ごとに該当する行を1ビットで表したビットマップ(番号数 x 行数/8 の配列)を作る"""
+    bitmaps = np.empty((count, (len(codes) + 7) // 8), dtype=np.uint8)
+    for code in range(count):
+        bitmaps[code] = np.packbits(codes == code)
+    return bitmaps
+
+
+class Condition(object):
+    """プルダウンに入力した複数の値(A,B,C)または範囲(2019～2020、片側は省略可)の抽出条件"""
+
+    def __init__(self, text, values=None, low=None, high=None):
+        self.text = text
+        self.values = values
+        self.low = low
+        self.high = high
+
+    def select(self, candidates):
+        """項目の値(candidates)のうち条件に該当する値のリスト"""
+        candidates = [str(value) for value in candidates]
+        if self.text in candidates:
+            # 区切り文字を含む値そのものが入力された場合
+            return [self.text]
+        if self.values is not None:
+            wanted = set(self.values)
+            return [value for value in candidates if value in wanted]
+        bounds = [bound for bound in (self.low, self.high) if bound]
+        numbers = pd.to_numeric(pd.Series(candidates + bounds, dtype=object), errors="coerce")
+        if len(bounds) > 0 and not numbers.iloc[len(candidates):].isna().any():
+            # 範囲が数値の場合は数値として比較する(数値でない値は該当しない)
+            keys = numbers.iloc[:len(candidates)].tolist()
+            low = float(self.low) if self.low else None
+            high = float(self.high) if self.high else None
+        else:
+            keys = candidates
+            low = self.low or None
+            high = self.high or None
+        return [value for value, key in zip(candidates, keys)
+                if key == key and (low is None or key >= low) and (high is None or key <= high)]
+
+
+def parse_filter(text):
+    """プルダウンの入力を抽出条件にする(ALL・未入力はNone、1つの値は文字列、それ以外は Condition)"""
+    text = text.strip()
+    if text == "" or text == "ALL":
+        return None
+    for separator in RANGE_SEPARATORS:
+        if separator in text:
+            low, high = text.split(separator, 1)
+            return Condition(text, low=low.strip(), high=high.strip())
+    for separator in VALUE_SEPARATORS:
+        if separator in text:
+            return Condition(text, values=[value.strip() for value in text.split(separator) if value.strip()])
+    return text
+
+
+def concat(kind, header, chunks):
+    """列の辞書(辞書変換した項目は (ユニーク値, 番号))のリストを1つの Dataset にまとめる"""
+    columns = {}
+    categories = {}
+    for name in header:
+        if is_category(name):
+            categories[name], columns[name] = merge_encoded([chunk[name] for chunk in chunks])
+        elif len(chunks) == 0:
+            columns[name] = np.array([], dtype=(np.float64 if name in FLOAT_COLUMNS else object))
+        else:
+            columns[name] = np.concatenate([chunk[name] for chunk in chunks])
+    return Dataset(kind, header, columns, categories)
+
+
+# 計測データ(002)の year,month,day,hour,minute から作成する日時の項目(ヘッダーには含めない)
+DATETIME = "datetime"
+# 集計キーとして使う計測日付(DATETIMEの日付部分)
+DATE = "date"
+# 集計キーにした場合の文字列の形式
+DATE_FORMATS = {DATE: "%Y/%m/%d", DATETIME: "%Y/%m/%d %H:%M"}
+
+
+def compose_datetime(year, month, day, hour, minute):
+    """年・月・日・時・分(文字列)の列を数値演算でまとめて datetime64[m] の配列にする
+
+    戻り値は (日時の配列, 有効な日時の行をTrueとした配列)。無効な行は NaT になる
+    """
+    parts = [pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").to_numpy(dtype=np.float64)
+             for values in (year, month, day, hour, minute)]
+    valid = np.ones(len(parts[0]), dtype=bool)
+    for values in parts:
+        valid &= np.isfinite(values)
+        valid &= np.floor(values) == values
+    y, mo, d, h, mi = [np.where(valid, values, 1).astype(np.int64) for values in parts]
+    valid &= (y >= 1) & (y <= 9999) & (mo >= 1) & (mo <= 12)
+    valid &= (h >= 0) & (h <= 23) & (mi >= 0) & (mi <= 59)
+
+    y = np.where(valid, y, 1970)
+    mo = np.where(valid, mo, 1)
+    month_start = ((y - 1970) * 12 + (mo - 1)).astype("datetime64[M]")
+    first_day = month_start.astype("datetime64[D]")
+    days_in_month = ((month_start + 1).astype("datetime64[D]") - first_day).astype(np.int64)
+    valid &= (d >= 1) & (d <= days_in_month)
+
+    d = np.where(valid, d, 1)
+    result = (first_day + (d - 1).astype("timedelta64[D]")).astype("datetime64[m]")
+    result = result + (h * 60 + mi).astype("timedelta64[m]")
+    result[~valid] = np.datetime64("NaT")
+    return result, valid
+
+
+# ログデータ(003-2)の timestamp から作成するUNIX時間(ミリ秒)の項目(ヘッダーには含めない)
+EPOCH_MS = "epoch_ms"
+# 日時として解釈できなかった timestamp のUNIX時間
+INVALID_EPOCH_MS = np.iinfo(np.int64).min
+# 時差を指定した日時の末尾(時刻に続く Z, +09:00 など)
+ZONE_SUFFIX = r"\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?\s*(?:Z|[+-]\d{2}(?::?\d{2})?)$"
+
+
+def parse_timestamps(values, timezone=None):
+    """timestamp の文字列(ISO 8601形式、末尾の " UTC" は協定世界時)をUNIX時間(ミリ秒)の int64 配列にする
+
+    戻り値は (UNIX時間の配列, 有効な行をTrueとした配列)。無効な行は INVALID_EPOCH_MS になる。
+    " UTC" を除いた文字列を最初の行の形式でまとめて変換し、形式の異なる行だけを1行ずつ変換する。
+    時差の無い日時は、変更前(QDateTime)と同じくコンピュータのタイムゾーン(timezone で変更できる)の日時とする
+    """
+    text = pd.Series(values, dtype=object)
+    utc = text.str.endswith(" UTC", na=False)
+    if utc.any():
+        text = text.where(~utc, text.str.slice(0, -4))
+    parsed = pd.to_datetime(text, utc=True, errors="coerce")
+    retry = parsed.isna() & (text != "")
+    if retry.any():
+        parsed[retry] = [pd.to_datetime(value, utc=True, errors="coerce") for value in text[retry]]
+    naive = parsed.notna() & ~utc & ~text.str.contains(ZONE_SUFFIX, na=False)
+    if naive.any():
+        local = parsed[naive].dt.tz_localize(None).dt.tz_localize(
+            timezone if timezone is not None else tz.tzlocal(),
+            ambiguous=np.ones(int(naive.sum()), dtype=bool), nonexistent="shift_forward")
+        parsed[naive] = local.dt.tz_convert("UTC")
+    valid = parsed.notna().to_numpy()
+    result = np.full(len(text), INVALID_EPOCH_MS, dtype=np.int64)
+    result[valid] = parsed[valid].dt.tz_localize(None).to_numpy(dtype="datetime64[ms]").astype(np.int64)
+    return result, valid
+
+
+def format_datetime(values, fmt):
+    """datetime64の配列を文字列にする(同じ日時は1回だけ変換する)"""
+    codes, uniques = pd.factorize(values)
+    return pd.DatetimeIndex(uniques).strftime(fmt).to_numpy(dtype=object)[codes]
+
+
+def od_crosstab(totals):
+    """origin・destinationごとの合計(aggregate(['origin', 'destination']) の結果)から移動滞在ログ(003)の集計表を作る
+
+    戻り値は (合計の表(行: origin, 列: destination), origin別の割合の表, destination別の割合の表)。
+    割合はoriginとdestinationが異なる組のみで求め、該当する組が無い場合はNone
+    (変更前の pd.crosstab(..., aggfunc=np.sum, normalize='index') と同じ値)
+    """
+    cross = totals.unstack()
+    origins = totals.index.get_level_values(0)
+    destinations = totals.index.get_level_values(1)
+    moved = totals[origins != destinations]
+    if len(moved) == 0:
+        return cross, None, None
+    return cross, row_shares(moved.unstack()), row_shares(moved.swaplevel().unstack())
+
+
+def log_segments(frame):
+    """ログ(id, time, lat, lon の DataFrame)を id ごとに時刻順に並べ、隣り合う2点の区間のリストにする
+
+    id の番号(vendor)はデータに最初に現れた順(変更前と同じ)で、同じ時刻の点は元の行の順とする。
+    戻り値は (区間のリスト, 区間の終点の時刻の最小値, 最大値)
+    """
+    segments = []
+    time_min = 99999999999999999
+    time_max = 0
+    for i, (user_id, group) in enumerate(frame.groupby("id", sort=False)):
+        group = group.sort_values("time", kind='mergesort')
+        lon = group["lon"].tolist()
+        lat = group["lat"].tolist()
+        times = group["time"].tolist()
+        for j in range(1, len(times)):
+            segments.append({"vendor": i, "path": [[lon[j-1], lat[j-1]], [lon[j], lat[j]]],
+                             "timestamps": [times[j-1], times[j]]})
+            time_max = max(time_max, times[j])
+            time_min = min(time_min, times[j])
+    return segments, time_min, time_max
+
+
+def row_shares(table):
+    """表の各行を行の合計に対する割合にする(値の無いセル・合計が0の行は0)"""
+    table = table.fillna(0)
+    return table.div(table.sum(axis=1), axis=0).fillna(0)
+
+
+def source_keys(data):
+    """データを構成するファイルのキーのリスト(キーの無いデータは空)"""
+    if data.sources:
+        return list(data.sources)
+    return [data.fingerprint] if data.fingerprint is not None else []
+
+
+def already_loaded(base, delta):
+    """追加するデータ(delta)のファイルが、読み込み済みのデータ(base)に含まれているかどうか"""
+    keys = set(source_keys(base))
+    return any(key in keys for key in source_keys(delta))
+
+
+class Dataset(object):
+    """列名をキーとしたnumpy配列で人流データを保持する
+
+    meshcode, option1..N は読み込み時にユニーク値の辞書(categories)と番号(columns)に変換し、
+    項目の候補・抽出条件は辞書を使ってデータを走査せずに求める。
+    option1..N は読み込み時に値ごとのビットマップ索引(bitmaps)を作成し、抽出条件はビットマップのANDで求める。
+    QGISのレイヤは表示・出力が必要になったときに to_layer() で作成する
+    """
+
+    def __init__(self, kind, header, columns, categories=None):
+        self.kind = kind
+        self.header = list(header)
+        self.columns = columns
+        self.categories = categories if categories is not None else {}
+        self.fingerprint = None     # 読み込んだファイルのキー(cache.fingerprint)
+        self.sources = []           # 複数のファイルを結合した場合の各ファイルのキー(source_keys で参照する)
+        self.bitmaps = {}           # 項目名: 値の番号ごとのビットマップ(build_index で作成)
+
+    def __len__(self):
+        if len(self.header) == 0:
+            return 0
+        return len(self.columns[self.header[0]])
+
+    def column(self, name, mask=None):
+        values = self.columns[name]
+        if mask is not None:
+            values = values[mask]
+        if name in self.categories:
+            values = self.categories[name][values]
+        return values
+
+    def codes(self, name, mask=None):
+        """辞書変換した項目の番号を返す"""
+        values = self.columns[name]
+        if mask is not None:
+            values = values[mask]
+        return values
+
+    def code(self, name, value):
+        """辞書変換した項目の値に対応する番号(存在しない場合は-1)"""
+        categories = self.categories[name]
+        i = np.searchsorted(categories, value)
+        if i < len(categories) and categories[i] == value:
+            return int(i)
+        return -1
+
+    def option_names(self):
+        return [name for name in self.header if name.startswith("option")]
+
+    def unique(self, name, mask=None):
+        """項目のユニーク値を文字列のリストで返す"""
+        if name in self.categories:
+            categories = self.categories[name]
+            if mask is None:
+                return categories.tolist()
+            used = np.bincount(self.columns[name][mask], minlength=len(categories)) > 0
+            return categories[used].tolist()
+        values = pd.unique(self.column(name, mask))
+        return sorted(str(v) for v in values)
+
+    def build_index(self):
+        """option1..N のビットマップ索引を作成する(値の種類が多い項目は作成しない)"""
+        for name in self.option_names():
+            count = len(self.categories[name])
+            if name not in self.bitmaps and count <= MAX_BITMAP_VALUES:
+                self.bitmaps[name] = build_bitmaps(self.columns[name], count)
+
+    def filter_codes(self, name, value):
+        """抽出条件(値または Condition)に該当する辞書の番号の配列"""
+        if isinstance(value, Condition):
+            values = value.select(self.categories[name])
+        else:
+            values = [value]
+        codes = np.array([self.code(name, v) for v in values], dtype=np.int64)
+        return codes[codes >= 0]
+
+    def mask(self, filters):
+        """{項目名: 値または Condition} の条件をすべて満たす行をTrueとした配列を返す
+
+        ビットマップ索引のある項目は、項目内の値のビットマップのOR・項目間のANDで求め、最後に行ごとの配列に戻す。
+        該当する値が多い項目は番号の対応表で求める(値の数によらず1回の走査)
+        """
+        packed = None
+        result = np.ones(len(self), dtype=bool)
+        for name, value in filters.items():
+            if name not in self.categories:
+                result &= (self.columns[name] == value)
+                continue
+            codes = self.filter_codes(name, value)
+            if len(codes) == 0:
+                return np.zeros(len(self), dtype=bool)
+            if name in self.bitmaps and len(codes) <= MAX_BITMAP_UNION:
+                bitmap = np.bitwise_or.reduce(self.bitmaps[name][codes], axis=0)
+                packed = bitmap if packed is None else np.bitwise_and(packed, bitmap, out=packed)
+            else:
+                selected = np.zeros(len(self.categories[name]), dtype=bool)
+                selected[codes] = True
+                result &= selected[self.columns[name]]
+        if packed is not None:
+            result &= np.unpackbits(packed, count=len(self)).view(bool)
+        return result
+
+    def add_datetime(self):
+        """year,month,day,hour,minute から日時の項目(DATETIME)を作成する。すべて有効な日時ならTrue"""
+        row_date, valid = compose_datetime(*[self.column(name) for name in ("year", "month", "day", "hour", "minute")])
+        if not valid.all():
+            return False
+        self.columns[DATETIME] = row_date
+        return True
+
+    def datetime_range(self):
+        """日時の項目の (最小値, 最大値)"""
+        values = self.columns[DATETIME]
+        return values.min().item(), values.max().item()
+
+    def add_timestamps(self):
+        """timestamp からUNIX時間(ミリ秒)の項目(EPOCH_MS)を作成する"""
+        self.columns[EPOCH_MS] = parse_timestamps(self.column("timestamp"))[0]
+
+    def key_column(self, key, mask=None):
+        if key in DATE_FORMATS:
+            return format_datetime(self.column(DATETIME, mask), DATE_FORMATS[key])
+        return self.column(key, mask)
+
+    def aggregate(self, keys, how="sum", mask=None, period=None):
+        """keys の値ごとに value を集計した Series を返す(並びは最初に現れた順)
+
+        keys には項目名のほか DATE, DATETIME(計測日時の文字列)を指定できる。
+        how は "sum"(合計)または "last"(後の行の値)、period=(開始, 終了) は計測日時で絞り込む
+        """
+        if period is not None:
+            times = self.columns[DATETIME]
+            in_period = (times >= np.datetime64(period[0])) & (times <= np.datetime64(period[1]))
+            mask = in_period if mask is None else (mask & in_period)
+        frame = pd.DataFrame({key: self.key_column(key, mask) for key in keys}, columns=list(keys))
+        frame["value"] = self.column("value", mask)
+        return frame.groupby(keys[0] if len(keys) == 1 else list(keys), sort=False)["value"].agg(how)
+
+    def aggregate_rows(self, key, how="sum", mask=None):
+        """key の値ごとに1行にまとめた Dataset を返す(並びは最初に現れた順)
+
+        value は how="sum" なら合計(値の無い行は0とする)、"first" なら最初の行の値。
+        その他の項目は最初の行の値(native:aggregate の first_value と同じ)
+        """
+        rows = np.arange(len(self)) if mask is None else np.flatnonzero(mask)
+        groups, uniques = pd.factorize(self.codes(key, rows))
+        first = np.unique(groups, return_index=True)[1]
+        selected = rows[first]
+        columns = {name: self.columns[name][selected] for name in self.header}
+        if how == "sum":
+            values = self.column("value", rows)
+            columns["value"] = np.bincount(groups, weights=np.where(np.isnan(values), 0.0, values),
+                                           minlength=len(uniques))
+        return Dataset(self.kind, self.header, columns, self.categories)
+
+    def parts(self):
+        """loader で他のデータと結合するための列の辞書(辞書変換した項目は (辞書, 番号))"""
+        return {name: ((self.categories[name], self.columns[name]) if name in self.categories
+                       else self.columns[name]) for name in self.header}
+
+    def append(self, other):
+        """項目が同じ Dataset を後ろに追加した新しい Dataset を返す
+
+        辞書は追加分の値だけを既存の辞書に加えて拡張し(既存の行は変換し直さない)、
+        ビットマップ索引は追加分の行のビットだけを作成して後ろにつなげる。
+        ヘッダー以外の項目(日時など)も両方にあれば結合する。同じファイルを含むデータは追加できない
+        """
+        if other.header != self.header:
+            raise ValueError("header")
+        if already_loaded(self, other):
+            raise ValueError("duplicate")
+        columns = {}
+        categories = {}
+        bitmaps = {}
+        for name in self.columns:
+            if name in self.categories:
+                merged, remap, codes = extend_categories(self.categories[name], other.categories[name],
+                                                         other.columns[name])
+                history = self.columns[name] if remap is None else remap[self.columns[name]]
+                columns[name] = np.concatenate([history, codes])
+                categories[name] = merged
+                if name in self.bitmaps and len(merged) <= MAX_BITMAP_VALUES:
+                    bitmaps[name] = append_bitmaps(self.bitmaps[name], len(self), codes, len(merged), remap)
+            elif name in other.columns:
+                columns[name] = np.concatenate([self.columns[name], other.columns[name]])
+        result = Dataset(self.kind, self.header, columns, categories)
+        result.bitmaps = bitmaps
+        if self.fingerprint is not None and other.fingerprint is not None:
+            result.fingerprint = hashlib.sha1((self.fingerprint + other.fingerprint).encode("ascii")).hexdigest()
+        result.sources = source_keys(self) + source_keys(other)
+        return result
+
+    def iter_rows(self, names, size):
+        """(先頭の行番号, 列の辞書) を size 行ずつ返す"""
+        for start in range(0, len(self), size):
+            rows = slice(start, start + size)
+            yield start, {name: self.column(name, rows) for name in names}
+
+    def take(self, mask):
+        """該当する行のみの Dataset(ヘッダー以外の項目も含む)"""
+        result = Dataset(self.kind, self.header, {name: values[mask] for name, values in self.columns.items()},
+                         self.categories)
+        if self.bitmaps:
+            result.build_index()
+        return result
+
+    def drop_unused(self):
+        """使われていない値を辞書から除いた Dataset(行を除いた後、項目の候補に残らないようにする)"""
+        columns = dict(self.columns)
+        categories = {}
+        for name, values in self.categories.items():
+            used = np.bincount(columns[name], minlength=len(values)) > 0
+            if not used.all():
+                columns[name] = (np.cumsum(used) - 1).astype(np.int32)[columns[name]]
+                values = values[used]
+            categories[name] = values
+        if all(len(categories[name]) == len(values) for name, values in self.categories.items()):
+            return self
+        result = Dataset(self.kind, self.header, columns, categories)
+        result.fingerprint = self.fingerprint
+        if self.bitmaps:
+            result.build_index()
+        return result
+
+    def to_frame(self, mask=None, columns=None):
+        if columns is None:
+            columns = self.header
+        return pd.DataFrame({name: self.column(name, mask) for name in columns}, columns=columns)
+
+    def to_layer(self, name="csv", mask=None):
+        """属性テーブルのみのメモリレイヤを作成する(プロジェクトには追加しない)"""
+        from qgis.PyQt.QtCore import QVariant
+        from qgis.core import QgsVectorLayer, QgsField, QgsFeature
+
+        layer = QgsVectorLayer('None', name, 'memory')
+        layer.setProviderEncoding('UTF-8')
+        provider = layer.dataProvider()
+        provider.setEncoding('UTF-8')
+
+        fields = []
+        for col in self.header:
+            if col in FLOAT_COLUMNS:
+                fields.append(QgsField(col, QVariant.Double))
+            elif col == "timestamp":
+                fields.append(QgsField(col, QVariant.DateTime))
+            else:
+                fields.append(QgsField(col, QVariant.String))
+        provider.addAttributes(fields)
+        layer.updateFields()
+
+        values = [self.column(col, mask).tolist() for col in self.header]
+        features = []
+        for row in zip(*values):
+            feat = QgsFeature()
+            feat.setAttributes(list(row))
+            features.append(feat)
+        provider.addFeatures(features)
+        layer.updateExtents()
+        return layer
@@ -0,0 +1,751 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeopleFlowVisualization
+                                 A QGIS plugin
+ This plugin visualize people flow
+                             -------------------
+        begin                : 2022-10-07
+        copyright            : (C) 2022 by MLIT
+        email                : trial@MILT
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ 人流データ(CSV)の読み込み処理
+"""
+
+import contextlib
+import csv
+import gzip
+import hashlib
+import io
+import itertools
+import os
+import time
+import warnings
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from chardet.universaldetector import UniversalDetector
+
+try:
+    import pyarrow.parquet as pq
+    import pyarrow.ipc as ipc
+except ImportError:
+    pq = None
+    ipc = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from . import cache
+from . import parallel
+from . import staging
+from .dataset import MESH, LOG, FLOAT_COLUMNS, is_category, encode, concat
+
+# 文字コード判定で1回に渡すバイト数
+SNIFF_BYTES = 64 * 1024
+# 文字コード判定で先頭から読む最大バイト数(確定しない場合は末尾も判定する)
+SNIFF_MAX_BYTES = 8 * 1024 * 1024
+# 1回に読み込む行数
+CHUNK_ROWS = 200000
+# プレビューで先頭から読む行数
+PREVIEW_ROWS = 10000
+# プレビューでファイル全体から無作為に選んで読む行数(非圧縮のCSVのみ)
+PREVIEW_SAMPLES = 10000
+# このサイズ以上のファイルは全件の読み込み前にプレビューを表示する
+PREVIEW_MIN_BYTES = 100 * 1024 * 1024
+
+# 拡張子ごとのファイル形式(CSV以外はpyarrowで列単位に読み込む)
+FILE_FORMATS = {
+    ".csv": "csv",
+    ".parquet": "parquet",
+    ".pq": "parquet",
+    ".arrow": "ipc",
+    ".feather": "ipc",
+    ".ipc": "ipc",
+}
+# 圧縮形式(中身はCSVとして扱う)
+COMPRESSIONS = {
+    ".gz": "gzip",
+    ".zst": "zstd",
+    ".zip": "zip",
+}
+# ファイル選択ダイアログのフィルタ
+FILE_PATTERNS = " ".join(["*" + ext for ext in FILE_FORMATS] + ["*.csv" + ext for ext in COMPRESSIONS if ext != ".zip"] + ["*.zip"])
+
+
+class LoadError(Exception):
+    """読み込み時のチェックエラー(メッセージボックスのタイトルと本文を持つ)"""
+
+    def __init__(self, title, message):
+        super(LoadError, self).__init__(message)
+        self.title = title
+        self.message = message
+
+    def __reduce__(self):
+        # ワーカープロセスから受け渡せるようにする
+        return (LoadError, (self.title, self.message))
+
+
+class LoadCancelled(Exception):
+    """読み込みがキャンセルされた"""
+
+
+class LoadStats(object):
+    """読み込み件数と処理時間(プレビューの場合は推定の全件数も持つ)"""
+
+    def __init__(self, rows=0, seconds=0.0, nbytes=0, cached=False, preview=False, estimated_rows=None):
+        self.rows = rows
+        self.seconds = seconds
+        self.nbytes = nbytes
+        self.cached = cached
+        self.preview = preview
+        self.estimated_rows = estimated_rows
+
+    @property
+    def rows_per_sec(self):
+        if self.seconds <= 0:
+            return float(self.rows)
+        return self.rows / self.seconds
+
+    def __str__(self):
+        if self.preview:
+            text = "プレビュー {:,}件".format(self.rows)
+            if self.estimated_rows is not None:
+                text += " / 推定 全{:,}件".format(int(self.estimated_rows))
+            return text
+        text = "{:,}件 / {:.1f}秒 ({:,.0f}件/秒)".format(self.rows, self.seconds, self.rows_per_sec)
+        if self.cached:
+            text += " キャッシュ"
+        return text
+
+
+def normalize_encoding(encoding):
+    """chardetの判定結果を読み込み用の文字コード名に変換する"""
+    if encoding == "utf-8":
+        return "utf-8"
+    elif encoding == "SHIFT_JIS":
+        return "cp932"
+    elif encoding == "CP932":
+        return "cp932"
+    elif encoding == "Windows-1252":
+        return "cp932"
+    elif encoding == "ascii":
+        return "cp932"
+    elif encoding == "UTF-8-SIG":
+        return "utf-8-sig"
+    return "error:" + str(encoding)
+
+
+# 文字コード判定結果のキャッシュ {(パス, サイズ, 更新日時): 文字コード}
+_encoding_cache = {}
+
+
+def sniff_encoding(raw, size=None):
+    """ファイルの先頭から少しずつ判定し、確定した時点で打ち切る
+
+    先頭 SNIFF_MAX_BYTES で確定しない場合は、ファイル末尾の同じ量も判定に加える
+    (size はファイルサイズ。圧縮ファイルなど末尾へ移動できない場合はNone)
+    """
+    detector = UniversalDetector()
+    nbytes = 0
+    while nbytes < SNIFF_MAX_BYTES and not detector.done:
+        b = raw.read(SNIFF_BYTES)
+        if not b:
+            break
+        detector.feed(b)
+        nbytes += len(b)
+
+    if not detector.done and size is not None:
+        if size > nbytes + SNIFF_MAX_BYTES:
+            # 行の途中から読まないよう、次の改行以降を渡す
+            raw.seek(size - SNIFF_MAX_BYTES)
+            raw.readline()
+            while not detector.done:
+                b = raw.read(SNIFF_BYTES)
+                if not b:
+                    break
+                detector.feed(b)
+        elif size > nbytes:
+            detector.feed(raw.read())
+
+    detector.close()
+    return normalize_encoding(detector.result['encoding'])
+
+
+def detect_encoding(path):
+    """ファイルの文字コードを判定する(同じファイルは判定結果を再利用する)"""
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    encoding = _encoding_cache.get(key)
+    if encoding is None:
+        with open_input(path) as (stream, source):
+            encoding = sniff_encoding(stream, stat.st_size if stream is source else None)
+        _encoding_cache[key] = encoding
+    return encoding
+
+
+def compression(path):
+    """拡張子から圧縮形式(gzip/zstd/zip)を返す。圧縮されていなければNone"""
+    return COMPRESSIONS.get(os.path.splitext(path)[1].lower())
+
+
+def file_format(path):
+    """拡張子からファイル形式(csv/parquet/ipc)を返す(圧縮ファイルはcsv)"""
+    if compression(path) is not None:
+        return "csv"
+    return FILE_FORMATS.get(os.path.splitext(path)[1].lower(), "csv")
+
+
+@contextlib.contextmanager
+def open_input(path):
+    """ファイルをバイナリで開き (読み込み用ストリーム, 元のファイル) を返す
+
+    gzip/zstd/zip(1ファイルのみ格納)は一時ファイルを作らずに展開しながら読む。
+    進捗は元のファイルの tell() (圧縮後のバイト数)で求める
+    """
+    source = open(path, mode='rb')
+    stream = None
+    try:
+        kind = compression(path)
+        if kind == "gzip":
+            stream = gzip.GzipFile(fileobj=source, mode='rb')
+        elif kind == "zstd":
+            if zstandard is None:
+                raise LoadError("ファイル読み込み", "zstd形式の読み込みにはzstandardが必要です")
+            stream = zstandard.ZstdDecompressor().stream_reader(source)
+        elif kind == "zip":
+            archive = zipfile.ZipFile(source)
+            members = [info for info in archive.infolist() if not info.is_dir()]
+            if len(members) != 1:
+                raise LoadError("ファイル読み込み", "zipファイルにはCSVファイルを1つだけ格納してください")
+            stream = archive.open(members[0])
+        else:
+            stream = source
+        yield stream, source
+    finally:
+        if stream is not None and stream is not source:
+            stream.close()
+        source.close()
+
+
+def is_csv(path):
+    return file_format(path) == "csv"
+
+
+def _require_pyarrow():
+    if pq is None:
+        raise LoadError("ファイル読み込み", "Parquet/Arrow形式の読み込みにはpyarrowが必要です")
+
+
+def _open_ipc(path):
+    """Arrow IPC のファイル形式・ストリーム形式のどちらも開く"""
+    try:
+        return ipc.open_file(path)
+    except Exception:
+        return ipc.open_stream(path)
+
+
+def read_header(path, encoding=None):
+    """ファイルの項目名を返す(Parquet/Arrowはスキーマから取得し、pandasのindex列は除く)"""
+    fmt = file_format(path)
+    if fmt == "csv":
+        with open_input(path) as (stream, source):
+            f = io.TextIOWrapper(stream, encoding=encoding, newline='')
+            try:
+                return next(csv.reader(f))
+            except UnicodeDecodeError as e:
+                raise decode_error(e)
+
+    _require_pyarrow()
+    if fmt == "parquet":
+        names = pq.ParquetFile(path).schema_arrow.names
+    else:
+        names = _open_ipc(path).schema.names
+    return [name for name in names if not name.startswith("__index_level_")]
+
+
+def check_mesh_header(header):
+    """メッシュ人流データのヘッダー(meshcode,option1..N,value)を確認する"""
+    if len(header) != len(set(header)):
+        raise LoadError("CSVフォーマットチェック", "項目名が重複しています")
+    if len(header) < 2:
+        raise LoadError("CSVフォーマットチェック", "フィールド数が異なります")
+    if header[0] != "meshcode":
+        raise LoadError("CSVフォーマットチェック", "CSVの形式が異なります(meshcode)")
+    if header[-1] != "value":
+        raise LoadError("CSVフォーマットチェック", "CSVの形式が異なります(value)")
+    for i in range(len(header) - 2):
+        if header[i + 1] != "option" + str(i + 1):
+            raise LoadError("CSVフォーマットチェック", "CSVの形式が異なります(option)")
+    if len(header) > 12:
+        raise LoadError("CSVフォーマットチェック", "フィールド数が異なります")
+
+
+def iter_chunks(f, header):
+    """ヘッダー行を読み終えたファイルから型変換済みのDataFrameを順に返す
+
+    数値の項目(value,lat,lon)は文字列で読んでから変換し、数値に変換できない値・空欄はNaNにする
+    (1回の読み込みで全行を変換し、値の確認は読み込み後に validation で行う)
+    """
+    try:
+        reader = pd.read_csv(f, header=None, names=header, dtype=str, index_col=False,
+                             na_filter=False, chunksize=CHUNK_ROWS)
+        while True:
+            # 先頭の行の項目数が多い場合、pandasは警告を出して切り捨てるためエラーにする
+            with warnings.catch_warnings():
+                warnings.simplefilter("error", pd.errors.ParserWarning)
+                chunk = next(reader, None)
+            if chunk is None:
+                break
+            for name in header:
+                if name in FLOAT_COLUMNS:
+                    chunk[name] = pd.to_numeric(chunk[name], errors="coerce").astype(np.float64)
+            yield chunk
+    except (pd.errors.ParserError, pd.errors.ParserWarning):
+        raise LoadError("CSVフォーマットチェック", "フィールド数が異なります")
+    except UnicodeDecodeError as e:
+        raise decode_error(e)
+
+
+def decode_error(error):
+    """文字コードの変換に失敗した場合の LoadError(置き換えずに読み込みを中止する)"""
+    return LoadError("CSVフォーマットチェック", "文字コード(" + error.encoding + ")で読み込めない文字があります")
+
+
+def arrow_column(array, name):
+    """Arrowの列をCSV読み込み時と同じ型(value,lat,lonは数値、それ以外は文字列)の配列にする
+
+    値の無いセルは数値の列ではNaN、文字列の列では空文字にする(CSVの空欄と同じ扱い)
+    """
+    values = array.to_pandas(integer_object_nulls=True, date_as_object=True)
+    if name in FLOAT_COLUMNS:
+        return pd.to_numeric(values, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+    values = values.astype(object)
+    return values.where(values.notna(), "").map(str).to_numpy(dtype=object)
+
+
+def iter_batches(path, header):
+    """Parquet/Arrowから必要な列だけを読み込み、(列の辞書, 件数, 全件数)を順に返す"""
+    _require_pyarrow()
+    if file_format(path) == "parquet":
+        pf = pq.ParquetFile(path)
+        num_rows = pf.metadata.num_rows
+        batches = pf.iter_batches(batch_size=CHUNK_ROWS, columns=header)
+    else:
+        reader = _open_ipc(path)
+        num_rows = None
+        batches = reader
+        if hasattr(reader, "num_record_batches"):
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+
+    for batch in batches:
+        names = batch.schema.names
+        columns = {name: arrow_column(batch.column(names.index(name)), name) for name in header}
+        yield columns, batch.num_rows, num_rows
+
+
+def encode_chunk(header, chunk):
+    """DataFrameまたは列の辞書を、meshcode・optionを (ユニーク値, 番号) にした列の辞書にする"""
+    return {name: (encode(chunk[name]) if is_category(name) else np.asarray(chunk[name])) for name in header}
+
+
+def read_columnar(path, kind, header=None, callback=None):
+    """Parquet/Arrow を列単位で読み込み Dataset を返す(CSVの解析は行わない)"""
+    start = time.perf_counter()
+    total = os.path.getsize(path)
+    if header is None:
+        header = read_header(path)
+
+    chunks = []
+    rows = 0
+    for columns, count, num_rows in iter_batches(path, header):
+        chunks.append(encode_chunk(header, columns))
+        rows += count
+        if callback is not None:
+            pos = total if not num_rows else int(total * rows / num_rows)
+            callback(pos, total, rows)
+
+    stats = LoadStats(rows, time.perf_counter() - start, total)
+    return concat(kind, header, chunks), stats
+
+
+def read_cached(path, key, callback=None):
+    """キャッシュがあれば (Dataset, LoadStats) を返す。無ければNone"""
+    start = time.perf_counter()
+    data = cache.load(key)
+    if data is None:
+        return None
+    total = os.path.getsize(path)
+    if callback is not None:
+        callback(total, total, len(data))
+    return data, LoadStats(len(data), time.perf_counter() - start, total, cached=True)
+
+
+def read_file(path, kind, encoding=None, callback=None):
+    """拡張子に応じてCSVまたはParquet/Arrowを読み込み Dataset を返す
+
+    読み込んだ結果はキャッシュに保存し、同じファイルは次回からキャッシュを開く
+    """
+    key = cache.fingerprint(path, kind, encoding)
+    if is_csv(path) and staging.should_stage(path):
+        return read_staged(path, kind, key, encoding, callback)
+    result = read_cached(path, key, callback)
+    if result is not None:
+        result[0].build_index()
+        return result
+
+    if is_csv(path):
+        data, stats = read_csv(path, kind, encoding, callback)
+    else:
+        data, stats = read_columnar(path, kind, callback=callback)
+    add_derived_columns(data)
+    cache.save(key, data)
+    data.fingerprint = key
+    data.build_index()
+    return data, stats
+
+
+def add_derived_columns(data):
+    """読み込み時に作成しておく項目(ログデータの timestamp のUNIX時間)"""
+    if data.kind == LOG:
+        data.add_timestamps()
+
+
+def read_csv(path, kind, encoding, callback=None):
+    """文字コード・ヘッダー確認済みのCSVを読み込み Dataset を返す"""
+    start = time.perf_counter()
+    total = os.path.getsize(path)
+
+    with open_input(path) as (stream, source):
+        f = io.TextIOWrapper(stream, encoding=encoding, newline='')
+        header = next(csv.reader([f.readline()]))
+        chunks = []
+        rows = 0
+        for chunk in iter_chunks(f, header):
+            chunks.append(encode_chunk(header, chunk))
+            rows += len(chunk)
+            if callback is not None:
+                callback(source.tell(), total, rows)
+
+    stats = LoadStats(rows, time.perf_counter() - start, total)
+    return concat(kind, header, chunks), stats
+
+
+def read_staged(path, kind, key, encoding, callback=None):
+    """大きなCSVをSQLiteに一時保存し (StagedDataset, LoadStats) を返す(同じファイルは一時保存済みのものを開く)"""
+    start = time.perf_counter()
+    total = os.path.getsize(path)
+    data = staging.open_store(key)
+    if data is not None:
+        if callback is not None:
+            callback(total, total, len(data))
+        return data, LoadStats(len(data), time.perf_counter() - start, total, cached=True)
+
+    with open_input(path) as (stream, source):
+        f = io.TextIOWrapper(stream, encoding=encoding, newline='')
+        header = next(csv.reader([f.readline()]))
+        writer = staging.StoreWriter(key, kind, header)
+        try:
+            for chunk in iter_chunks(f, header):
+                writer.write(chunk)
+                if callback is not None:
+                    callback(source.tell(), total, writer.rows)
+            data = writer.finish()
+        finally:
+            writer.close()
+
+    return data, LoadStats(len(data), time.perf_counter() - start, total)
+
+
+def should_preview(paths):
+    """全件の読み込み前にプレビューを表示するかどうか(複数のファイルは合計のサイズで判定する)"""
+    if isinstance(paths, str):
+        paths = [paths]
+    return sum(os.path.getsize(path) for path in paths) >= PREVIEW_MIN_BYTES
+
+
+def sample_lines(f, start, size, count, seed=0):
+    """バイナリで開いたファイルの start 以降の無作為な位置から、その直後の行を最大 count 行読む
+
+    全件を読まずにファイル全体から行を選ぶ(長い行ほど選ばれやすいため、おおよその標本として使う)
+    """
+    lines = {}
+    if size <= start:
+        return []
+    rng = np.random.default_rng(seed)
+    for offset in np.sort(rng.integers(start, size, count)):
+        f.seek(int(offset))
+        # 途中から始まる行は読み飛ばす
+        f.readline()
+        pos = f.tell()
+        if pos in lines:
+            continue
+        line = f.readline()
+        if line.strip():
+            lines[pos] = line if line.endswith(b"\n") else line + b"\n"
+    return [lines[pos] for pos in sorted(lines)]
+
+
+def parse_lines(text, header):
+    """CSVの行(文字列)を型変換済みのDataFrameにする(数値に変換できない値はNaN)"""
+    for chunk in iter_chunks(io.StringIO(text), header):
+        return chunk
+    return pd.DataFrame({name: np.array([], dtype=(np.float64 if name in FLOAT_COLUMNS else object))
+                         for name in header}, columns=header)
+
+
+def read_preview(path, kind, encoding=None, rows=PREVIEW_ROWS, samples=PREVIEW_SAMPLES):
+    """先頭の行(rows 行)と、ファイル全体から無作為に選んだ行(最大 samples 行)で Dataset を作る(全件の読み込み前の確認用)
+
+    戻り値は (Dataset, LoadStats)。圧縮ファイルは先頭の行のみ、Parquet/Arrowは最初のまとまりのみ使う。
+    文字コードで変換できない行があれば、全件の読み込みと同じく LoadError にする
+    """
+    start = time.perf_counter()
+    total = os.path.getsize(path)
+    header = read_header(path, encoding)
+
+    if not is_csv(path):
+        chunks = []
+        estimated_rows = 0
+        for columns, count, num_rows in iter_batches(path, header):
+            chunks.append(encode_chunk(header, columns))
+            estimated_rows = num_rows
+            break
+        data = concat(kind, header, chunks)
+        add_derived_columns(data)
+        return data, LoadStats(len(data), time.perf_counter() - start, total, preview=True,
+                               estimated_rows=estimated_rows or len(data))
+
+    estimated_rows = None
+    with open_input(path) as (stream, source):
+        if stream is source:
+            header_bytes = len(source.readline())
+            lines = list(itertools.islice(iter(source.readline, b""), rows))
+            lines += sample_lines(source, source.tell(), total, samples)
+            if len(lines) > 0:
+                estimated_rows = (total - header_bytes) * len(lines) / sum(len(line) for line in lines)
+            try:
+                text = b"".join(lines).decode(encoding or "utf-8")
+            except UnicodeDecodeError as e:
+                raise decode_error(e)
+        else:
+            f = io.TextIOWrapper(stream, encoding=encoding, newline='')
+            try:
+                f.readline()
+                text = "".join(itertools.islice(f, rows))
+            except UnicodeDecodeError as e:
+                raise decode_error(e)
+
+    data = concat(kind, header, [encode_chunk(header, parse_lines(text, header))])
+    add_derived_columns(data)
+    return data, LoadStats(len(data), time.perf_counter() - start, total, preview=True, estimated_rows=estimated_rows)
+
+
+def preview_mesh(path, rows=PREVIEW_ROWS, samples=PREVIEW_SAMPLES):
+    """メッシュ人流データのプレビュー(確認は load_mesh と同じ)
+
+    戻り値は (Dataset, メッシュコード一覧, LoadStats)
+    """
+    encoding = None
+    if is_csv(path):
+        encoding = detect_encoding(path)
+        if "error" in encoding:
+            raise LoadError("CSVフォーマットチェック", "文字コードが対応していません(" + encoding + ")")
+    check_mesh_header(read_header(path, encoding))
+    data, stats = read_preview(path, MESH, encoding, rows, samples)
+    if len(data) == 0:
+        raise LoadError("CSVチェック", "CSVデータが取得できませんでした")
+    return data, data.unique("meshcode"), stats
+
+
+def preview_mesh_files(paths):
+    """複数のメッシュ人流データのプレビュー(各ファイルから同じ行数ずつ選び、1つのDatasetにまとめる)
+
+    戻り値は preview_mesh と同じ。推定の全件数は各ファイルの推定の合計
+    """
+    if len(paths) == 1:
+        return preview_mesh(paths[0])
+    start = time.perf_counter()
+    results = []
+    for path in paths:
+        try:
+            results.append(preview_mesh(path, max(PREVIEW_ROWS // len(paths), 1),
+                                        max(PREVIEW_SAMPLES // len(paths), 1)))
+        except LoadError as e:
+            raise LoadError(e.title, e.message + "(" + os.path.basename(path) + ")")
+    header = results[0][0].header
+    for path, (data, meshcode_list, stats) in zip(paths, results):
+        if data.header != header:
+            raise LoadError("CSVフォーマットチェック", "ファイルごとに項目が異なります(" + os.path.basename(path) + ")")
+    data = concat(MESH, header, [data.parts() for data, meshcode_list, stats in results])
+    estimated = [stats.estimated_rows for data, meshcode_list, stats in results]
+    stats = LoadStats(len(data), time.perf_counter() - start, sum(os.path.getsize(path) for path in paths), preview=True,
+                      estimated_rows=None if None in estimated else sum(estimated))
+    return data, data.unique("meshcode"), stats
+
+
+def load_mesh(path, callback=None):
+    """メッシュ人流データ(CSV/Parquet/Arrow)を読み込み、抽出用の索引を作成する
+
+    戻り値は (Dataset, メッシュコード一覧, LoadStats)。
+    ここでは文字コードとヘッダーのみ確認し、値(メッシュコード・value)は validation.mesh_rules で全行を確認する
+    """
+    result = read_mesh(path, callback)
+    index_dataset(result[0])
+    return result
+
+
+def index_dataset(data):
+    """メモリ上の Dataset にビットマップ索引を作成する(一時保存したデータはSQLiteの索引を使う)"""
+    if not isinstance(data, staging.StagedDataset):
+        data.build_index()
+
+
+def read_mesh(path, callback=None):
+    """メッシュ人流データを読み込む(索引は作成しない)"""
+    key = cache.fingerprint(path, MESH)
+    if is_csv(path) and staging.should_stage(path):
+        return load_mesh_staged(path, key, callback)
+    result = read_cached(path, key, callback)
+    if result is not None:
+        data, stats = result
+        check_mesh_header(data.header)
+        return data, data.unique("meshcode"), stats
+
+    if is_csv(path):
+        data, meshcode_list, stats = load_mesh_csv(path, callback)
+    else:
+        header = read_header(path)
+        check_mesh_header(header)
+        data, stats = read_columnar(path, MESH, header, callback)
+        if len(data) == 0:
+            raise LoadError("CSVチェック", "CSVデータが取得できませんでした")
+        meshcode_list = data.unique("meshcode")
+    cache.save(key, data)
+    data.fingerprint = key
+    return data, meshcode_list, stats
+
+
+def load_mesh_csv(path, callback=None):
+    """メッシュ人流データを1回の読み込みでヘッダー確認・型変換する
+
+    戻り値は (Dataset, メッシュコード一覧, LoadStats)
+    callback(読み込み済バイト数, ファイルサイズ, 読み込み済件数) は行のまとまりごとに呼ばれる
+    """
+    start = time.perf_counter()
+    total = os.path.getsize(path)
+
+    encoding = detect_encoding(path)
+    if "error" in encoding:
+        raise LoadError("CSVフォーマットチェック", "文字コードが対応していません(" + encoding + ")")
+
+    with open_input(path) as (stream, source):
+        f = io.TextIOWrapper(stream, encoding=encoding, newline='')
+
+        header = next(csv.reader([f.readline()]))
+        check_mesh_header(header)
+
+        chunks = []
+        rows = 0
+        for chunk in iter_chunks(f, header):
+            chunks.append(encode_chunk(header, chunk))
+            rows += len(chunk)
+            if callback is not None:
+                callback(source.tell(), total, rows)
+
+    if rows == 0:
+        raise LoadError("CSVチェック", "CSVデータが取得できませんでした")
+
+    stats = LoadStats(rows, time.perf_counter() - start, total)
+    data = concat(MESH, header, chunks)
+    return data, data.unique("meshcode"), stats
+
+
+def load_mesh_staged(path, key, callback=None):
+    """メッシュ人流データをSQLiteに一時保存して読み込む(確認は load_mesh_csv と同じ)"""
+    encoding = detect_encoding(path)
+    if "error" in encoding:
+        raise LoadError("CSVフォーマットチェック", "文字コードが対応していません(" + encoding + ")")
+    # ヘッダーは一時保存を始める前に確認する
+    check_mesh_header(read_header(path, encoding))
+
+    data, stats = read_staged(path, MESH, key, encoding, callback)
+    if len(data) == 0:
+        raise LoadError("CSVチェック", "CSVデータが取得できませんでした")
+    return data, data.unique("meshcode"), stats
+
+
+def _load_mesh_worker(path, callback=None):
+    """ワーカープロセスで1ファイルを読み込む(エラーメッセージにファイル名を付ける)"""
+    try:
+        # 索引は結合後に作成する
+        return read_mesh(path, callback)
+    except LoadError as e:
+        raise LoadError(e.title, e.message + "(" + os.path.basename(path) + ")")
+
+
+def load_mesh_files(paths, callback=None):
+    """複数のメッシュ人流データ(月別・都道府県別など)を並列に読み込み、1つのDatasetにまとめる
+
+    各ファイルは load_mesh と同じ確認を行い、項目名はすべてのファイルで一致している必要がある
+    callback は各ファイルの行のまとまりごとに、全ファイルの合計のバイト数・件数で呼ばれる。
+    一時保存したファイルがある場合は、1つのファイルの複製に残りのファイルの行を追加してまとめる
+    """
+    if len(paths) == 1:
+        return load_mesh(paths[0], callback)
+
+    start = time.perf_counter()
+    sizes = [os.path.getsize(path) for path in paths]
+    total = sum(sizes)
+    done_bytes = [0] * len(paths)
+    done_rows = [0] * len(paths)
+    finished = set()
+
+    def report():
+        if callback is not None:
+            callback(sum(done_bytes), total, sum(done_rows))
+
+    def progress(i, nbytes, size, rows):
+        # 読み込みが終わった後に届いた進捗は使わない
+        if i not in finished:
+            done_bytes[i] = min(nbytes, sizes[i])
+            done_rows[i] = rows
+            report()
+
+    def complete(i, result):
+        finished.add(i)
+        done_bytes[i] = sizes[i]
+        done_rows[i] = len(result[0])
+        report()
+
+    results = parallel.run(_load_mesh_worker, [(path,) for path in paths], complete, progress)
+
+    header = results[0][0].header
+    for path, (data, meshcode_list, stats) in zip(paths, results):
+        if data.header != header:
+            raise LoadError("CSVフォーマットチェック", "ファイルごとに項目が異なります(" + os.path.basename(path) + ")")
+
+    if any(isinstance(data, staging.StagedDataset) for data, meshcode_list, stats in results):
+        data = staging.merge([data for data, meshcode_list, stats in results])
+    else:
+        data = concat(MESH, header, [data.parts() for data, meshcode_list, stats in results])
+        fingerprints = [result[0].fingerprint for result in results]
+        if None not in fingerprints:
+            data.fingerprint = hashlib.sha1("".join(fingerprints).encode("ascii")).hexdigest()
+            data.sources = fingerprints
+        data.build_index()
+    stats = LoadStats(sum(done_rows), time.perf_counter() - start, total)
+    return data, data.unique("meshcode"), stats
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeopleFlowVisualization
+                                 A QGIS plugin
+ This plugin visualize people flow
+                             -------------------
+        begin                : 2022-10-07
+        copyright            : (C) 2022 by MLIT
+        email                : trial@MILT
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ 複数ファイルの並列処理(ワーカープロセス)
+"""
+
+import multiprocessing
+import os
+import queue
+import sys
+
+from concurrent.futures import (FIRST_COMPLETED, BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor,
+                                wait)
+
+from . import cache
+
+# 進捗の受け取りを確認する間隔(秒)
+PROGRESS_INTERVAL = 0.2
+
+# ワーカープロセスの進捗の送り先(プールの作成時に initializer で設定する)
+_progress_queue = None
+
+
+def python_executable():
+    """ワーカープロセスの起動に使うPython実行ファイルを返す
+
+    QGIS内では sys.executable がQGIS本体を指すため、同じ環境のPythonを探す。
+    見つからない場合はNoneを返す。
+    """
+    if os.path.basename(sys.executable).lower().startswith("python"):
+        return sys.executable
+    candidates = [
+        os.path.join(sys.exec_prefix, "python.exe"),
+        os.path.join(sys.exec_prefix, "pythonw.exe"),
+        os.path.join(sys.exec_prefix, "bin", "python3"),
+        os.path.join(sys.exec_prefix, "bin", "python"),
+    ]
+    for path in candidates:
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def worker_count(jobs):
+    return max(1, min(jobs, os.cpu_count() or 1))
+
+
+def _set_progress_queue(progress_queue):
+    global _progress_queue
+    _progress_queue = progress_queue
+
+
+def executor(jobs, progress_queue=None):
+    """ワーカープロセスのプールを作成する(Pythonが見つからない場合はスレッドで代用する)
+
+    progress_queue はワーカープロセスの進捗の送り先(multiprocessing の Queue、スレッドの場合は使わない)
+    """
+    workers = worker_count(jobs)
+    python = python_executable()
+    if python is None:
+        return ThreadPoolExecutor(max_workers=workers)
+    context = multiprocessing.get_context("spawn")
+    context.set_executable(python)
+    if progress_queue is None:
+        return ProcessPoolExecutor(max_workers=workers, mp_context=context)
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                               initializer=_set_progress_queue, initargs=(progress_queue,))
+
+
+def _call(func, i, args, progress_queue=None):
+    """ワーカーで func(*args, callback=...) を実行し、callback の引数を (i, 引数) として送る"""
+    if progress_queue is None:
+        progress_queue = _progress_queue
+
+    def callback(*values):
+        progress_queue.put((i,) + values)
+
+    return func(*args, callback=callback)
+
+
+def run(func, args_list, callback=None, progress=None):
+    """func(*args) をワーカーで並列に実行し、入力順の結果リストを返す
+
+    callback(完了したargsのindex, 結果) は完了した順に呼ばれ、例外を送出すると残りを中止する。
+    progress を指定した場合は func(*args, callback=...) として呼び、ワーカー内の callback(*values) ごとに
+    progress(index, *values) を呼ぶ(呼び出し元のスレッドで呼ぶため、例外を送出すると残りを中止する)。
+    ワーカープロセスを起動できない(または異常終了した)場合は、残りをこのプロセスのスレッドで実行する
+    """
+    results = [None] * len(args_list)
+    indices = list(range(len(args_list)))
+    progress_queue = None
+    try:
+        if progress is not None:
+            progress_queue = multiprocessing.get_context("spawn").Queue()
+        pool = executor(len(args_list), progress_queue)
+    except OSError:
+        pool = None
+    if pool is not None:
+        indices = _run_pool(pool, func, args_list, indices, results, callback, progress, progress_queue)
+    if len(indices) > 0:
+        cache.log_warning("ワーカープロセスを起動できないため、このプロセスで実行します")
+        pool = ThreadPoolExecutor(max_workers=worker_count(len(indices)))
+        _run_pool(pool, func, args_list, indices, results, callback, progress, None)
+    return results
+
+
+def _run_pool(pool, func, args_list, indices, results, callback, progress, progress_queue):
+    """indices の args をプールで実行して results に格納する
+
+    戻り値はワーカープロセスを起動できない・異常終了したために実行できなかった index のリスト
+    """
+    if progress is not None and isinstance(pool, ThreadPoolExecutor):
+        progress_queue = queue.Queue()
+    remaining = set(indices)
+    try:
+        try:
+            if progress is None:
+                futures = {pool.submit(func, *args_list[i]): i for i in indices}
+            elif isinstance(pool, ThreadPoolExecutor):
+                futures = {pool.submit(_call, func, i, args_list[i], progress_queue): i for i in indices}
+            else:
+                futures = {pool.submit(_call, func, i, args_list[i]): i for i in indices}
+        except (OSError, BrokenExecutor):
+            pool.shutdown(wait=False, cancel_futures=True)
+            return indices
+        pending = set(futures)
+        while len(pending) > 0:
+            finished, pending = wait(pending, timeout=PROGRESS_INTERVAL, return_when=FIRST_COMPLETED)
+            _drain(progress_queue, progress)
+            for future in finished:
+                i = futures[future]
+                try:
+                    results[i] = future.result()
+                except BrokenExecutor:
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    return sorted(remaining)
+                remaining.discard(i)
+                if callback is not None:
+                    callback(i, results[i])
+    except BaseException:
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    pool.shutdown(wait=True)
+    return []
+
+
+def _drain(progress_queue, progress):
+    """受け取った進捗をすべて progress に渡す"""
+    if progress_queue is None:
+        return
+    while True:
+        try:
+            values = progress_queue.get_nowait()
+        except queue.Empty:
+            return
+        progress(*values)
@@ -29,6 +29,7 @@ import csv
 import processing
 import datetime
 import json
+import time
 from urllib.parse import quote
 import pandas as pd
 import re
@@ -42,13 +43,34 @@ from qgis.PyQt.QtWidgets import QMessageBox,QFileDialog,QProgressDialog,QApplica
 from qgis.core import *
 
 from . import worldmesh
-from chardet import detect
+from . import loader
+from . import cube
+from . import dataset
+from . import staging
+from . import tasks
+from . import validation
+from . import results
+from . import batch
 from datetime import timedelta
 
 # This loads your .ui file so that PyQt can populate your plugin with the elements from Qt Designer
 FORM_CLASS, _ = uic.loadUiType(os.path.join(
     os.path.dirname(__file__), 'people_flow_visualization_dialog_base.ui'))
 
+# 分析結果のキャッシュに保存する出力ファイル(プラグインのフォルダからの相対パス)
+RESULT_FILES_001 = ['temp/result.csv', 'temp/result.geojson', 'html/001.html.html']
+RESULT_FILES_002 = ['temp/result_002.geojson', 'html/002.html.html']
+RESULT_FILES_003 = ['temp/result_003.geojson', 'temp/result_003_csv_001.csv', 'temp/result_003_csv_002.csv',
+                    'temp/result_003_csv_003.csv', 'temp/result_003_csv_004.csv', 'temp/origin.geojson',
+                    'temp/destination.geojson', 'html/003.html.html']
+
+# 分析処理(analyze_001, analyze_002, analyze_003)の結果
+ANALYSIS_DONE = 'done'              # 出力ファイルを作成した
+ANALYSIS_RESTORED = 'restored'      # 前回の分析結果を書き戻した
+ANALYSIS_EMPTY = 'empty'            # 該当レコードが無い
+ANALYSIS_FAILED = 'failed'          # クロス集計に失敗した(003)
+# 一括出力の対象のデータの種類
+BATCH_KINDS = {'001': dataset.MESH, '002': dataset.SENSOR, '003': dataset.OD}
 
 class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
 
@@ -72,6 +94,12 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
         self.mesh_index = 0
         self.add_poi = False
         self.meshcode_list = []
+        self.dataset = None     # 読み込んだ人流データ(dataset.Dataset)
+        self.mask = None        # 抽出条件に該当する行
+        self.mask_query = None  # 前回の分析結果を表示した場合の、まだ抽出していない条件(sfilter, where)
+        self.cube = None        # メッシュ人流データの集計キューブ(cube.MeshCube)
+        self.load_task = None   # 実行中の読み込みタスク(tasks.LoadTask)
+        self.results = results.ResultCache(directory=results.RESULT_DIR)   # 分析結果のキャッシュ
         self.setMinimumSize(1024, 700)
         self.setMaximumSize(1024, 700)
         self.filter = {}
@@ -79,7 +107,6 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
         self.place_id_list = []
         self.file_002_sensor_path = None
         self.file_002_jinryu_path = None
-        self.file_002_data_list = []    # 読み込んだCSVデータ(日時を最初のキー)
         self.file_002_point_name_list = {} # 計測点名Dict
         self.file_002_name = ""
         self.date_002_from = None
@@ -91,6 +118,14 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
 
         self.tabWidget.setCurrentIndex(0)
 
+        # 抽出条件のプルダウンは、複数の値(A,B)・範囲(2019～2020)も入力できるようにする
+        for suffix, count in (("", 10), ("_2", 10), ("_3", 5), ("_4", 5)):
+            for cnt in range(count):
+                combo = getattr(self, "cmb_option" + str(cnt+1) + suffix)
+                combo.setEditable(True)
+                combo.setInsertPolicy(QtWidgets.QComboBox.NoInsert)
+                combo.setToolTip("一覧から選択するほか、複数の値(例: 土,日)や範囲(例: 2019～2020、4～)を入力できます")
+
         self.lnk_tebiki.clicked.connect(self.lnk_tebiki_clicked)
         self.lnk_riyo.clicked.connect(self.lnk_riyo_clicked)
         self.lnk_use.clicked.connect(self.lnk_use_clicked)
@@ -197,17 +232,21 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
 
 
         self.btn_meshcsv_load.clicked.connect(self.btn_meshcsv_load_clicked)
+        self.btn_meshcsv_append.clicked.connect(self.btn_meshcsv_append_clicked)
         self.btn_option_load.clicked.connect(self.btn_option_load_clicked)
         self.btn_poi_load.clicked.connect(self.btn_poi_load_clicked)
         self.btn_web_001.clicked.connect(self.web_001_clicked)
+        self.btn_batch_001.clicked.connect(self.batch_001_clicked)
         self.btn_export_html_001.clicked.connect(self.export_html_001_clicked)
         self.btn_export_csv_001.clicked.connect(self.export_csv_001_clicked)
         self.btn_export_geojson_001.clicked.connect(self.export_geojson_001_clicked)
 
         self.btn_002_sensor_read.clicked.connect(self.sensor_read_002_clicked)
         self.btn_002_csv_read.clicked.connect(self.csv_read_002_clicked)
+        self.btn_002_csv_append.clicked.connect(self.csv_append_002_clicked)
         self.btn_option_load_2.clicked.connect(self.btn_option_load_2_clicked)
         self.btn_web_002.clicked.connect(self.web_002_clicked)
+        self.btn_batch_002.clicked.connect(self.batch_002_clicked)
         self.btn_export_html_002.clicked.connect(self.export_html_002_clicked)
         self.btn_export_csv_002.clicked.connect(self.export_csv_002_clicked)
         self.btn_export_geojson_002.clicked.connect(self.export_geojson_002_clicked)
@@ -217,6 +256,7 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
         self.btn_option_load_3.clicked.connect(self.btn_option_load_3_clicked)
 
         self.btn_web_003.clicked.connect(self.web_003_clicked)
+        self.btn_batch_003.clicked.connect(self.batch_003_clicked)
         self.btn_export_html_003.clicked.connect(self.export_html_003_clicked)
         self.btn_export_csv_003.clicked.connect(self.export_csv_003_clicked)
         self.btn_export_geojson_003.clicked.connect(self.export_geojson_003_clicked)
@@ -226,6 +266,8 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
         self.btn_001_5_n.setVisible(False)
         self.lbl_001_2_n.setVisible(False)
         self.lbl_001_5_n.setVisible(False)
+        self.btn_meshcsv_append.setVisible(False)
+        self.btn_002_csv_append.setVisible(False)
 
         self.btn_002_2_n.setVisible(False)
         self.btn_002_3_n.setVisible(False)
@@ -255,9 +297,10 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
 
     def closeEvent(self, event):
         self.closingPlugin.emit()
+        if self.load_task is not None :
+            self.load_task.cancel()
+            self.load_task = None
         # レイヤ削除
-        if len(QgsProject.instance().mapLayersByName('csv')) >= 1 :
-            QgsProject.instance().removeMapLayer(QgsProject.instance().mapLayersByName('csv')[0].id())
         if len(QgsProject.instance().mapLayersByName('sptial')) >= 1 :
             QgsProject.instance().removeMapLayer(QgsProject.instance().mapLayersByName('sptial')[0].id())
         if len(QgsProject.instance().mapLayersByName('result')) >= 1 :
@@ -292,8 +335,6 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
 
     def move_0(self):
         # レイヤ削除
-        if len(QgsProject.instance().mapLayersByName('csv')) >= 1 :
-            QgsProject.instance().removeMapLayer(QgsProject.instance().mapLayersByName('csv')[0].id())
         if len(QgsProject.instance().mapLayersByName('sptial')) >= 1 :
             QgsProject.instance().removeMapLayer(QgsProject.instance().mapLayersByName('sptial')[0].id())
         if len(QgsProject.instance().mapLayersByName('result')) >= 1 :
@@ -305,6 +346,13 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
         if len(QgsProject.instance().mapLayersByName('destination')) >= 1 :
             QgsProject.instance().removeMapLayer(QgsProject.instance().mapLayersByName('destination')[0].id())
         
+        # 実行中の読み込み(プレビュー中の全件の読み込みなど)を中止する
+        if self.load_task is not None :
+            self.load_task.cancel()
+            self.load_task = None
+        self.dataset = None
+        self.mask = None
+        self.cube = None
         self.colName = {}
         self.list_meshcsv.clear()
         self.list_optioncsv.clear()
@@ -323,6 +371,8 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
         self.btn_001_2_n.setVisible(False)
         self.lbl_001_2_n.setVisible(False)
         self.btn_001_5_n.setVisible(False)
+        self.btn_meshcsv_append.setVisible(False)
+        self.btn_002_csv_append.setVisible(False)
         self.lbl_001_5_n.setVisible(False)
 
         self.btn_002_2_n.setVisible(False)
@@ -500,6 +550,136 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
         self.tabWidget.setCurrentIndex(25)
 
    
+    def start_load_task(self, name, func, on_finished, modal=True):
+        """読み込み処理をバックグラウンドで実行し、進捗(%・残り時間)とキャンセルボタンを表示する"""
+        if self.load_task is not None:
+            self.load_task.cancel()
+
+        def finished(task):
+            if self.load_task is not task:
+                # 後から開始した読み込み・リセットで置き換えられたタスクの結果は使わない
+                return
+            self.load_task = None
+            on_finished(task)
+
+        self.load_task = self.run_task(name + 'を読み込んでいます...', name + '読み込み', func, finished, modal)
+
+    def run_task(self, label, description, func, on_finished, modal=True):
+        """func(callback) を LoadTask で実行し、進捗ダイアログ(label)を表示する。終了後に on_finished(task) を呼ぶ"""
+        progress = QProgressDialog(label, 'キャンセル', 0, 100, None)
+        progress.setWindowModality(Qt.ApplicationModal if modal else Qt.NonModal)
+        progress.setWindowFlag(Qt.WindowContextHelpButtonHint, False)
+        progress.setWindowFlag(Qt.WindowCloseButtonHint, False)
+        progress.setAutoClose(False)
+        progress.setAutoReset(False)
+        progress.setMinimumDuration(0)
+        progress.setValue(0)
+
+        def finished(task):
+            progress.close()
+            on_finished(task)
+
+        def update(value):
+            progress.setValue(int(value))
+            progress.setLabelText(label + ' ' + task.status_text())
+
+        task = tasks.LoadTask(description, func, finished)
+        task.progressChanged.connect(update)
+        progress.canceled.connect(task.cancel)
+        QgsApplication.taskManager().addTask(task)
+        progress.show()
+        return task
+
+    def start_load_with_preview(self, name, path, preview, func, on_finished):
+        """大きなファイルは先頭と無作為に選んだ行のプレビューを先に表示し、全件はバックグラウンドで読み込む
+
+        path はファイルのパスまたはパスのリスト(複数のファイルは合計のサイズでプレビューするか決める)。
+
+        プレビューの間も分析(下書きのHTML作成)ができるように、進捗ダイアログはモーダルにしない。
+        全件の読み込みが終わると on_finished が再度呼ばれ、プレビューのデータを置き換える
+        """
+        previewed = False
+        if loader.should_preview(path):
+            try:
+                result = preview()
+            except Exception as e:
+                QgsMessageLog.logMessage(name + "プレビュー: " + str(e), "PeopleFlowVisualization", Qgis.Warning)
+            else:
+                on_finished(tasks.FinishedTask(result))
+                previewed = True
+        self.start_load_task(name, func, on_finished, modal=not previewed)
+
+    def load_message(self, name, stats, detail=False):
+        """読み込み結果のメッセージ(プレビューの場合は全件を読み込み中であることを示す)"""
+        if stats.preview:
+            return name + "のプレビューを表示しています。(" + str(stats) + ") 全件を読み込んでいます..."
+        if detail:
+            return name + "の読み込みに成功しました。(" + str(stats) + ")"
+        return name + "の読み込みに成功しました。"
+
+    def check_load_task(self, task, title, value_message):
+        """読み込みタスクの結果を確認し、失敗・キャンセル時はメッセージを表示してFalseを返す"""
+        if task.exception is None and task.result is not None:
+            return True
+        if task.exception is None or isinstance(task.exception, loader.LoadCancelled):
+            QgsMessageLog.logMessage(title + ": キャンセルしました", "PeopleFlowVisualization", Qgis.Info)
+        elif isinstance(task.exception, loader.LoadError):
+            QMessageBox.warning(None, task.exception.title, task.exception.message)
+        elif isinstance(task.exception, ValueError):
+            QMessageBox.warning(None, "CSVチェック", value_message)
+        else:
+            QMessageBox.warning(None, title, "ファイル読み込み時に問題が発生しました")
+        return False
+
+    def result_key(self, page, filter_list, where, *inputs):
+        """分析結果のキャッシュのキー(読み込んだデータのキーが無い場合(プレビュー中など)はNone)"""
+        if self.dataset is None or self.dataset.fingerprint is None:
+            return None
+        return results.make_key(page, self.dataset.fingerprint, results.normalize_filters(filter_list), where,
+                                self.colName, *inputs)
+
+    def restore_layer(self, path, name=None):
+        """キャッシュから書き戻した分析結果の GeoJSON(path)に合わせて地図を更新する
+
+        前回の分析のレイヤ('result' と name)は今回の結果と一致しないため削除し、name を指定した場合は
+        GeoJSON をメモリ上のレイヤ(name)として追加する。地図の表示範囲は分析結果の範囲に合わせる
+        """
+        for layer_name in ['result'] + ([name] if name is not None else []) :
+            for layer in QgsProject.instance().mapLayersByName(layer_name) :
+                QgsProject.instance().removeMapLayer(layer.id())
+        source = QgsVectorLayer(path, 'restored', 'ogr')
+        if not source.isValid() :
+            return
+        if name is not None :
+            layer = source.materialize(QgsFeatureRequest())
+            layer.setName(name)
+            QgsProject.instance().addMapLayer(layer)
+        self.iface.mapCanvas().setExtent(source.extent())
+        self.iface.mapCanvas().refreshAllLayers()
+
+    def check_rows(self, data, report, error_file, preview=False):
+        """読み込みタスク内で確認した結果(validation.check_result)の確認項目ごとの件数とエラー行の一覧(CSV)を表示する
+
+        エラーのある行を除いて続行する場合はそのデータ(タスク内で作成済み)を、中止する場合はNoneを返す。
+        プレビューはエラーのある行を表示せずに除く(確認は全件の読み込み後に行う)
+        """
+        if len(report.errors) == 0:
+            return data
+        if preview:
+            return report.valid_data
+
+        message = "\n".join(report.messages()) + "\n\nエラー行の一覧: " + errors_path(error_file)
+        message += "\n(番号はヘッダーを除いたデータの件数目で、空行がある場合などはファイルの行番号と異なります)"
+        valid_count = report.valid_count()
+        if valid_count == 0:
+            QMessageBox.warning(None, "CSVチェック", message)
+            return None
+        message += "\n\nエラーのある行を除いた{:,}件で続行しますか？".format(valid_count)
+        answer = QMessageBox.question(None, "CSVチェック", message, QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+        if answer != QMessageBox.Yes:
+            return None
+        return report.valid_data
+
     def btn_meshcsv_load_clicked(self):
         try :
             
@@ -510,271 +690,227 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
                 QMessageBox.warning(None, "メッシュコード選択", "メッシュコードの種類を選択してください")
                 return
                         
-            fname = QFileDialog.getOpenFileName(self, 'ファイル選択', self.default_file_path,"csv (*.csv)")
-            if fname[0]:
+            # 月別・都道府県別などに分かれたファイルは複数選択してまとめて読み込む
+            fnames = QFileDialog.getOpenFileNames(self, 'ファイル選択', self.default_file_path,"csv/parquet/arrow (" + loader.FILE_PATTERNS + ")")
+            if fnames[0]:
 
 
-                self.default_file_path = os.path.dirname(fname[0])
-                progress = QProgressDialog('処理しています...', '', 0, 0, None)
-                progress.setWindowModality(Qt.ApplicationModal)
-                progress.setCancelButton(None)
-                progress.setWindowFlag(Qt.WindowContextHelpButtonHint, False)
-                progress.setWindowFlag(Qt.WindowCloseButtonHint, False)
-                progress.show()
-
-                QApplication.processEvents()
-
-                file_encoding = encodingCheck(fname[0])
-                if "error" in file_encoding :
-                    progress.close()
-                    QMessageBox.warning(None, "CSVフォーマットチェック", "文字コードが対応していません(" + file_encoding +")")
-                    return                
+                self.default_file_path = os.path.dirname(fnames[0][0])
+                # 文字コード判定・ヘッダー確認・値の変換を1回の読み込みで行う(複数ファイルは並列に読み込む)
+                # 値の確認・集計キューブの作成は全件の読み込み後にタスク内で行う(プレビュー中は抽出した行を集計する)
+                index = self.cmb_meshcode.currentIndex()
+                file_names = sorted(fnames[0])
+                self.start_load_with_preview("人流データ", file_names,
+                    lambda: preview_mesh(file_names, index),
+                    lambda callback: load_mesh_with_cube(file_names, index, callback),
+                    lambda task: self.btn_meshcsv_load_loaded(task, file_names, index))
 
-                #ヘッダー確認
-                with open(fname[0], encoding=file_encoding, newline='') as f:
-                    csvreader = csv.reader(f)
-                    header = next(csvreader)
-                
-                if len(header) != len(set(header)) :
-                    progress.close()
-                    QMessageBox.warning(None, "CSVフォーマットチェック", "項目名が重複しています")
-                    return                
+            else :
+                self.list_meshcsv.clear()
+                self.lbl_001_2.setText('')
+                self.btn_001_2_n.setVisible(False)
+                self.lbl_001_2_n.setVisible(False)
+        except :
+            QMessageBox.warning(None, "人流データ読み込み", "ファイル読み込み時に問題が発生しました")
 
-                if len(header) < 2:
-                    QMessageBox.warning(None, "CSVフォーマットチェック", "フィールド数が異なります")
-                    return
-                
-                self.header_count = len(header)
-                if header[0] != "meshcode" :
-                    progress.close()
-                    QMessageBox.warning(None, "CSVフォーマットチェック", "CSVの形式が異なります(meshcode)")
-                    return
+    def btn_meshcsv_load_loaded(self, task, file_names, index):
+        if not self.check_load_task(task, "人流データ読み込み", "フィールド(value)の値を数値として保存できませんでした"):
+            return
+        try:
+            data, meshcode_list, stats, report, mesh_cube = task.result
+            QgsMessageLog.logMessage("人流データ読み込み: " + str(stats), "PeopleFlowVisualization", Qgis.Info)
 
-                if header[self.header_count-1] != "value" :
-                    progress.close()
-                    QMessageBox.warning(None, "CSVフォーマットチェック", "CSVの形式が異なります(value)")
-                    return
+            # データ確認(メッシュコード・valueを全行確認し、エラーがあれば有効な行のみで続行するかを選ぶ)
+            valid = self.check_rows(data, report, 'errors_001.csv', stats.preview)
+            if valid is None :
+                return
+            if valid is not data :
+                meshcode_list = valid.unique('meshcode')
+            self.dataset = valid
+            self.cube = mesh_cube
 
-                for i in range(self.header_count-2):
-                    if header[i+1] != "option" + str(i+1) :
-                        progress.close()
-                        QMessageBox.warning(None, "CSVフォーマットチェック", "CSVの形式が異なります(option)")
-                        return            
-                
-                if len(header) > 12:
-                    progress.close()
-                    QMessageBox.warning(None, "CSVフォーマットチェック", "フィールド数が異なります")
-                    return
+            self.header_count = len(self.dataset.header)
+            self.mask = None
+            self.list_meshcsv.clear()
 
-                self.list_meshcsv.clear()
+            # フィルタ用データ設定
+            option_list = []
+            for cnt in range(self.header_count-2) :
+                option_list.append(self.dataset.unique('option'+str(cnt+1)))
+
+            self.cmb_option1.setVisible(False)
+            self.lbl_option1.setVisible(False)
+            self.cmb_option2.setVisible(False)
+            self.lbl_option2.setVisible(False)
+            self.cmb_option3.setVisible(False)
+            self.lbl_option3.setVisible(False)
+            self.cmb_option4.setVisible(False)
+            self.lbl_option4.setVisible(False)
+            self.cmb_option5.setVisible(False)
+            self.lbl_option5.setVisible(False)
+            self.cmb_option6.setVisible(False)
+            self.lbl_option6.setVisible(False)
+            self.cmb_option7.setVisible(False)
+            self.lbl_option7.setVisible(False)
+            self.cmb_option8.setVisible(False)
+            self.lbl_option8.setVisible(False)
+            self.cmb_option9.setVisible(False)
+            self.lbl_option9.setVisible(False)
+            self.cmb_option10.setVisible(False)
+            self.lbl_option10.setVisible(False)
+
+            self.len = len(option_list)
+
+            if self.len >= 1 : 
+                self.cmb_option1.clear()
+                self.cmb_option1.addItem('ALL')
+                self.cmb_option1.addItems(option_list[0])
+                self.cmb_option1.model().sort(0)
+                self.cmb_option1.setVisible(True)
+                self.lbl_option1.setVisible(True)
+            if self.len >= 2 : 
+                self.cmb_option2.clear()
+                self.cmb_option2.addItem('ALL')
+                self.cmb_option2.addItems(option_list[1])
+                self.cmb_option2.model().sort(0)
+                self.cmb_option2.setVisible(True)
+                self.lbl_option2.setVisible(True)
+            if self.len >= 3 : 
+                self.cmb_option3.clear()
+                self.cmb_option3.addItem('ALL')
+                self.cmb_option3.addItems(option_list[2])
+                self.cmb_option3.model().sort(0)
+                self.cmb_option3.setVisible(True)
+                self.lbl_option3.setVisible(True)
+            if self.len >= 4 : 
+                self.cmb_option4.clear()
+                self.cmb_option4.addItem('ALL')
+                self.cmb_option4.addItems(option_list[3])
+                self.cmb_option4.model().sort(0)
+                self.cmb_option4.setVisible(True)
+                self.lbl_option4.setVisible(True)
+            if self.len >= 5 : 
+                self.cmb_option5.clear()
+                self.cmb_option5.addItem('ALL')
+                self.cmb_option5.addItems(option_list[4])
+                self.cmb_option5.model().sort(0)
+                self.cmb_option5.setVisible(True)
+                self.lbl_option5.setVisible(True)
+            if self.len >= 6 : 
+                self.cmb_option6.clear()
+                self.cmb_option6.addItem('ALL')
+                self.cmb_option6.addItems(option_list[5])
+                self.cmb_option6.model().sort(0)
+                self.cmb_option6.setVisible(True)
+                self.lbl_option6.setVisible(True)
+            if self.len >= 7 : 
+                self.cmb_option7.clear()
+                self.cmb_option7.addItem('ALL')
+                self.cmb_option7.addItems(option_list[6])
+                self.cmb_option7.model().sort(0)
+                self.cmb_option7.setVisible(True)
+                self.lbl_option7.setVisible(True)
+            if self.len >= 8 : 
+                self.cmb_option8.clear()
+                self.cmb_option8.addItem('ALL')
+                self.cmb_option8.addItems(option_list[7])
+                self.cmb_option8.model().sort(0)
+                self.cmb_option8.setVisible(True)
+                self.lbl_option8.setVisible(True)
+            if self.len >= 9 : 
+                self.cmb_option9.clear()
+                self.cmb_option9.addItem('ALL')
+                self.cmb_option9.addItems(option_list[8])
+                self.cmb_option9.model().sort(0)
+                self.cmb_option9.setVisible(True)
+                self.lbl_option9.setVisible(True)
+            if self.len >= 10 : 
+                self.cmb_option10.clear()
+                self.cmb_option10.addItem('ALL')
+                self.cmb_option10.addItems(option_list[9])
+                self.cmb_option10.model().sort(0)
+                self.cmb_option10.setVisible(True)
+                self.lbl_option10.setVisible(True)
+
+            self.mesh_index = index
+            self.meshcode_list = meshcode_list
+
+            self.btn_001_2_n.setVisible(True)
+            self.lbl_001_2_n.setVisible(True)
+            self.btn_meshcsv_append.setVisible(True)
+
+            for file_name in file_names :
+                self.list_meshcsv.addItem(os.path.basename(file_name))
+
+            self.lbl_001_2.setText(self.load_message('人流データ', stats, True))
+
+        except loader.LoadError as e:
+            QMessageBox.warning(None, e.title, e.message)
+        except ValueError as e:
+            QMessageBox.warning(None, "CSVチェック", "フィールド(value)の値を数値として保存できませんでした")
+        except :
+            QMessageBox.warning(None, "人流データ読み込み", "ファイル読み込み時に問題が発生しました")
 
-                if len(QgsProject.instance().mapLayersByName('csv')) >= 1 :
-                    QgsProject.instance().removeMapLayer(QgsProject.instance().mapLayersByName('csv')[0].id())
+    def btn_meshcsv_append_clicked(self):
+        try :
+            if self.dataset is None or self.dataset.kind != dataset.MESH :
+                QMessageBox.warning(None, "人流データ読み込み", "先に人流データを読み込んでください")
+                return
 
-                csvLyr = QgsVectorLayer('None', 'csv', 'memory')
-                csvLyrprov = csvLyr.dataProvider()   
-                csvLyr.setProviderEncoding('UTF-8')
-                csvLyr.dataProvider().setEncoding('UTF-8')   
-                QgsProject.instance().addMapLayers([csvLyr])
+            fnames = QFileDialog.getOpenFileNames(self, 'ファイル選択', self.default_file_path,"csv/parquet/arrow (" + loader.FILE_PATTERNS + ")")
+            if fnames[0]:
+                self.default_file_path = os.path.dirname(fnames[0][0])
+                # 追加分のファイルのみ読み込み・確認する
+                index = self.mesh_index
+                file_names = sorted(fnames[0])
+                self.start_load_task("追加データ",
+                    lambda callback: load_mesh_with_cube(file_names, index, callback),
+                    lambda task: self.btn_meshcsv_append_loaded(task, file_names))
+        except :
+            QMessageBox.warning(None, "人流データ読み込み", "ファイル読み込み時に問題が発生しました")
 
-                csvLyrprov.addAttributes([QgsField("meshcode", QVariant.String)])
-                for i in range(self.header_count-2):
-                    csvLyrprov.addAttributes([QgsField("option" + str(i+1), QVariant.String)])
-                csvLyrprov.addAttributes([QgsField("value", QVariant.Double)])
-                
-                csvLyr.updateFields()
+    def btn_meshcsv_append_loaded(self, task, file_names):
+        if not self.check_load_task(task, "人流データ読み込み", "フィールド(value)の値を数値として保存できませんでした"):
+            return
+        try:
+            delta, meshcode_list, stats, report, delta_cube = task.result
+            QgsMessageLog.logMessage("人流データ追加読み込み: " + str(stats), "PeopleFlowVisualization", Qgis.Info)
 
-                featureList = []
-                with open(fname[0], encoding=file_encoding, newline='') as f:
-                    csvreader = csv.reader(f)
-                    header = next(csvreader)
-                    for row in csvreader:
-                        float(row[self.header_count-1])
-                        feat = QgsFeature()
-                        feat.setAttributes(row)
-                        featureList.append(feat)
-                
-                csvLyr.dataProvider().addFeatures(featureList)        
-                csvLyr.commitChanges()
+            if dataset.already_loaded(self.dataset, delta) :
+                QMessageBox.warning(None, "人流データ読み込み", "読み込み済みのファイルです")
+                return
 
+            # 追加分のみ確認する
+            delta = self.check_rows(delta, report, 'errors_001.csv')
+            if delta is None :
+                return
 
-                meshcode = processing.run("qgis:listuniquevalues", {'INPUT':csvLyr,'FIELDS':['meshcode'],'OUTPUT':'TEMPORARY_OUTPUT'})
-                meshcode_list = []
-                for item in meshcode["OUTPUT"].getFeatures():
-                    meshcode_list.append(str(item.attributes()[0]))
+            if delta.header != self.dataset.header :
+                QMessageBox.warning(None, "CSVフォーマットチェック", "読み込み済みのデータと項目が異なります")
+                return
 
-                if len(meshcode_list) == 0:
-                    progress.close()
-                    QMessageBox.warning(None, "CSVチェック", "CSVデータが取得できませんでした")
-                    return
-                                
-                # メッシュコード検証
-                index = self.cmb_meshcode.currentIndex()
-                for meshcode_list_1 in meshcode_list:
-                    if isonlynum(meshcode_list_1) == False:
-                        progress.close()
-                        QMessageBox.warning(None, "CSVチェック", "メッシュコードに文字列が含まれています")
-                        return
+            # 読み込み済みのデータに結合し、メッシュコード・optionの候補を追加分で更新する
+            self.dataset = staging.append(self.dataset, delta)
+            self.mask = None
+            if self.cube is not None and delta_cube is not None :
+                self.cube = self.cube.append(delta_cube)
+            else :
+                self.cube = None
+            self.meshcode_list = self.dataset.unique('meshcode')
 
-                    if index == 1 :
-                        if len(meshcode_list_1) != 8 :
-                            progress.close()
-                            QMessageBox.warning(None, "CSVチェック", "メッシュコードの桁数が一致しません")
-                            return
-                    if index == 2 :
-                        if len(meshcode_list_1) != 9 :
-                            progress.close()
-                            QMessageBox.warning(None, "CSVチェック", "メッシュコードの桁数が一致しません")
-                            return
-                    if index == 3 :
-                        if len(meshcode_list_1) != 10 :
-                            progress.close()
-                            QMessageBox.warning(None, "CSVチェック", "メッシュコードの桁数が一致しません")
-                            return
-                    if index == 4 :
-                        if len(meshcode_list_1) != 11 :
-                            progress.close()
-                            QMessageBox.warning(None, "CSVチェック", "メッシュコードの桁数が一致しません")
-                            return
-                    if index == 5 :
-                        if len(meshcode_list_1) != 10 :
-                            progress.close()
-                            QMessageBox.warning(None, "CSVチェック", "メッシュコードの桁数が一致しません")
-                            return
-                    if index == 6 :
-                        if len(meshcode_list_1) != 11 :
-                            progress.close()
-                            QMessageBox.warning(None, "CSVチェック", "メッシュコードの桁数が一致しません")
-                            return
+            combos = [self.cmb_option1, self.cmb_option2, self.cmb_option3, self.cmb_option4, self.cmb_option5,
+                      self.cmb_option6, self.cmb_option7, self.cmb_option8, self.cmb_option9, self.cmb_option10]
+            for cnt in range(self.header_count-2) :
+                combos[cnt].clear()
+                combos[cnt].addItem('ALL')
+                combos[cnt].addItems(self.dataset.unique('option'+str(cnt+1)))
+                combos[cnt].model().sort(0)
 
-                # フィルタ用データ設定
-                layer1 = QgsProject.instance().mapLayersByName('csv')[0]
-
-                option_list = []
-                for cnt in range(self.header_count-2) :
-                    option = processing.run("qgis:listuniquevalues", {'INPUT':layer1,'FIELDS':['option'+str(cnt+1)],'OUTPUT':'TEMPORARY_OUTPUT'})
-                    option_list_temp = []
-                    for item in option["OUTPUT"].getFeatures():
-                        option_list_temp.append(item.attributes()[0])
-                    option_list.append(option_list_temp)
-
-
-                self.cmb_option1.setVisible(False)
-                self.lbl_option1.setVisible(False)
-                self.cmb_option2.setVisible(False)
-                self.lbl_option2.setVisible(False)
-                self.cmb_option3.setVisible(False)
-                self.lbl_option3.setVisible(False)
-                self.cmb_option4.setVisible(False)
-                self.lbl_option4.setVisible(False)
-                self.cmb_option5.setVisible(False)
-                self.lbl_option5.setVisible(False)
-                self.cmb_option6.setVisible(False)
-                self.lbl_option6.setVisible(False)
-                self.cmb_option7.setVisible(False)
-                self.lbl_option7.setVisible(False)
-                self.cmb_option8.setVisible(False)
-                self.lbl_option8.setVisible(False)
-                self.cmb_option9.setVisible(False)
-                self.lbl_option9.setVisible(False)
-                self.cmb_option10.setVisible(False)
-                self.lbl_option10.setVisible(False)
-
-                self.len = len(option_list)
-
-                if self.len >= 1 : 
-                    self.cmb_option1.clear()
-                    self.cmb_option1.addItem('ALL')
-                    self.cmb_option1.addItems(option_list[0])
-                    self.cmb_option1.model().sort(0)
-                    self.cmb_option1.setVisible(True)
-                    self.lbl_option1.setVisible(True)
-                if self.len >= 2 : 
-                    self.cmb_option2.clear()
-                    self.cmb_option2.addItem('ALL')
-                    self.cmb_option2.addItems(option_list[1])
-                    self.cmb_option2.model().sort(0)
-                    self.cmb_option2.setVisible(True)
-                    self.lbl_option2.setVisible(True)
-                if self.len >= 3 : 
-                    self.cmb_option3.clear()
-                    self.cmb_option3.addItem('ALL')
-                    self.cmb_option3.addItems(option_list[2])
-                    self.cmb_option3.model().sort(0)
-                    self.cmb_option3.setVisible(True)
-                    self.lbl_option3.setVisible(True)
-                if self.len >= 4 : 
-                    self.cmb_option4.clear()
-                    self.cmb_option4.addItem('ALL')
-                    self.cmb_option4.addItems(option_list[3])
-                    self.cmb_option4.model().sort(0)
-                    self.cmb_option4.setVisible(True)
-                    self.lbl_option4.setVisible(True)
-                if self.len >= 5 : 
-                    self.cmb_option5.clear()
-                    self.cmb_option5.addItem('ALL')
-                    self.cmb_option5.addItems(option_list[4])
-                    self.cmb_option5.model().sort(0)
-                    self.cmb_option5.setVisible(True)
-                    self.lbl_option5.setVisible(True)
-                if self.len >= 6 : 
-                    self.cmb_option6.clear()
-                    self.cmb_option6.addItem('ALL')
-                    self.cmb_option6.addItems(option_list[5])
-                    self.cmb_option6.model().sort(0)
-                    self.cmb_option6.setVisible(True)
-                    self.lbl_option6.setVisible(True)
-                if self.len >= 7 : 
-                    self.cmb_option7.clear()
-                    self.cmb_option7.addItem('ALL')
-                    self.cmb_option7.addItems(option_list[6])
-                    self.cmb_option7.model().sort(0)
-                    self.cmb_option7.setVisible(True)
-                    self.lbl_option7.setVisible(True)
-                if self.len >= 8 : 
-                    self.cmb_option8.clear()
-                    self.cmb_option8.addItem('ALL')
-                    self.cmb_option8.addItems(option_list[7])
-                    self.cmb_option8.model().sort(0)
-                    self.cmb_option8.setVisible(True)
-                    self.lbl_option8.setVisible(True)
-                if self.len >= 9 : 
-                    self.cmb_option9.clear()
-                    self.cmb_option9.addItem('ALL')
-                    self.cmb_option9.addItems(option_list[8])
-                    self.cmb_option9.model().sort(0)
-                    self.cmb_option9.setVisible(True)
-                    self.lbl_option9.setVisible(True)
-                if self.len >= 10 : 
-                    self.cmb_option10.clear()
-                    self.cmb_option10.addItem('ALL')
-                    self.cmb_option10.addItems(option_list[9])
-                    self.cmb_option10.model().sort(0)
-                    self.cmb_option10.setVisible(True)
-                    self.lbl_option10.setVisible(True)
-
-                self.mesh_index = index
-                self.meshcode_list = meshcode_list
-
-                self.btn_001_2_n.setVisible(True)
-                self.lbl_001_2_n.setVisible(True)
-
-                self.list_meshcsv.addItem(os.path.basename(fname[0]))
-
-                self.lbl_001_2.setText('人流データの読み込みに成功しました。')
-                QApplication.processEvents()
-                progress.close()
+            for file_name in file_names :
+                self.list_meshcsv.addItem(os.path.basename(file_name))
 
-            else :
-                self.list_meshcsv.clear()
-                self.lbl_001_2.setText('')
-                self.btn_001_2_n.setVisible(False)
-                self.lbl_001_2_n.setVisible(False)
-        except ValueError as e:
-            progress.close()
-            QMessageBox.warning(None, "CSVチェック", "フィールド(value)の値を数値として保存できませんでした")
+            self.lbl_001_2.setText('追加データの読み込みに成功しました。(' + str(stats) + ' 合計' + "{:,}".format(len(self.dataset)) + '件)')
         except :
-            progress.close()
             QMessageBox.warning(None, "人流データ読み込み", "ファイル読み込み時に問題が発生しました")
 
     def btn_option_load_clicked(self):
@@ -936,8 +1072,6 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
             self.btn_001_5_n.setVisible(False)
             self.lbl_001_5_n.setVisible(False)
 
-            layer1 = QgsProject.instance().mapLayersByName('csv')[0]
-
             QApplication.processEvents()
 
             filter_list = []
@@ -952,93 +1086,201 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
             if self.len >= 9 : filter_list.append(str(self.cmb_option9.currentText()))
             if self.len >= 10 : filter_list.append(str(self.cmb_option10.currentText()))
 
-            sfilter = ""
-            layer1.setSubsetString(sfilter)
-            self.filter = {}
-            alist = []
-            for cnt in range(self.header_count-2) :
-                if cnt == 0:
-                    if filter_list[0] == 'ALL' :
-                        alist.append("option1")
-                    else :
-                        sfilter += "\"option1\" = '%s'" % (filter_list[0])
-                    self.filter["option1"] = [self.colName.get('option1', 'option1'),filter_list[0]]
-                else:
-                    if filter_list[cnt] == 'ALL' :
-                        alist.append("option" + str(cnt+1))
-                    else :
-                        if sfilter == "" :
-                            sfilter +=  "\"option%s\" = '%s'" % (cnt+1,filter_list[cnt])
-                        else:
-                            sfilter +=  " AND \"option%s\" = '%s'" % (cnt+1,filter_list[cnt])
-                    self.filter["option" + str(cnt+1)] = [self.colName.get("option" + str(cnt+1), "option" + str(cnt+1)),filter_list[cnt]]
+            where = self.txt_sql_001.text().strip()
+            status = self.analyze_001(filter_list, where)
+            progress.close()
+            if status == ANALYSIS_EMPTY :
+                QMessageBox.warning(None, "分析処理", "該当レコードがありません")
+                return
+            if status == ANALYSIS_RESTORED :
+                QMessageBox.information(None, "分析処理", "分析処理が完了しました。(前回の分析結果を表示しています)")
+            else :
+                QMessageBox.information(None, "分析処理", "分析処理が完了しました。")
+            self.move_001_6()
+            self.btn_001_5_n.setVisible(True)
+            self.lbl_001_5_n.setVisible(True)
 
+        except staging.QueryError as e:
+            progress.close()
+            QMessageBox.warning(None, "SQL条件", str(e))
+        except:
+            progress.close()
+            QMessageBox.warning(None, "分析処理", "分析処理時に問題が発生しました")
 
-            layer1.setSubsetString(sfilter)
-            if layer1.featureCount() <= 0 :
-                    progress.close()
-                    QMessageBox.warning(None, "分析処理", "該当レコードがありません")
-                    return
-                        
-            QApplication.processEvents()
-            meshcode = processing.run("qgis:listuniquevalues", {'INPUT':layer1,'FIELDS':['meshcode'],'OUTPUT':'TEMPORARY_OUTPUT'})
-            meshcode_list = []
-            for item in meshcode["OUTPUT"].getFeatures():
-                meshcode_list.append(str(item.attributes()[0]))
+    def analyze_001(self, filter_list, where):
+        """プルダウンの入力(filter_list)とSQL条件(where)で分析処理(001)を行い、地図・HTML・CSVを出力する
 
-            self.create_mesh(meshcode_list,self.mesh_index)
+        一括出力も同じ処理で組み合わせごとのHTMLを作成する。戻り値は ANALYSIS_* のいずれか
+        """
+        self.filter = {}
+        alist = []
+        sfilter = {}
+        for cnt in range(self.header_count-2) :
+            condition = dataset.parse_filter(filter_list[cnt])
+            if condition is None :
+                alist.append("option" + str(cnt+1))
+            else :
+                sfilter["option" + str(cnt+1)] = condition
+                # 複数の値・範囲を指定した項目は、ALLと同様に1つの値に絞り込まない項目として扱う
+                if isinstance(condition, dataset.Condition) :
+                    alist.append("option" + str(cnt+1))
+            self.filter["option" + str(cnt+1)] = [self.colName.get("option" + str(cnt+1), "option" + str(cnt+1)),filter_list[cnt]]
+
+        # 同じデータ・抽出条件の分析結果があれば、抽出せずに出力ファイルを書き戻して表示する
+        poi_key = results.file_key(os.path.dirname(__file__) + '/temp/poi.geojson') if self.add_poi else None
+        result_key = self.result_key('001', filter_list, where, self.mesh_index, poi_key)
+        if self.results.restore(result_key) :
+            # メッシュのレイヤは書き戻した結果(値を結合したメッシュ)で置き換える
+            self.restore_layer(os.path.dirname(__file__) + '/temp/result.geojson', 'sptial')
+            self.mask = None
+            return ANALYSIS_RESTORED
+
+        # SQL条件(WHERE句)が入力されていれば、プルダウンの条件と合わせて抽出する
+        # プルダウンの条件のみでALLの項目がある場合は、読み込み時に作成した集計キューブからメッシュごとの合計を求める
+        # (すべて1つの値に絞り込んだ場合は、抽出した行を結合・出力する)
+        aggregated = None
+        if self.cube is not None and not where and len(alist) != 0 :
+            self.mask = None
+            aggregated = self.cube.slice(sfilter)
+            found = len(aggregated) > 0
+        else :
+            self.mask = staging.mask(self.dataset, sfilter, where)
+            found = self.mask.any()
+        if not found :
+            return ANALYSIS_EMPTY
+
+        QApplication.processEvents()
+        if aggregated is not None :
+            meshcode_list = aggregated.unique('meshcode')
+        else :
+            meshcode_list = self.dataset.unique('meshcode', self.mask)
 
-            QApplication.processEvents()
+        self.create_mesh(meshcode_list,self.mesh_index)
 
-            if len(QgsProject.instance().mapLayersByName('result')) >= 1 :
-                QgsProject.instance().removeMapLayer(QgsProject.instance().mapLayersByName('result')[0].id())
+        QApplication.processEvents()
 
-            os.remove(os.path.dirname(__file__) + '/temp/result.gpkg')
+        if len(QgsProject.instance().mapLayersByName('result')) >= 1 :
+            QgsProject.instance().removeMapLayer(QgsProject.instance().mapLayersByName('result')[0].id())
 
-            self.datajoin(alist)
+        os.remove(os.path.dirname(__file__) + '/temp/result.gpkg')
 
-            layer1 = self.iface.addVectorLayer(os.path.dirname(__file__) + '/temp/result.gpkg','result','ogr')
-            # スタイル指定
-            renderer = QgsGraduatedSymbolRenderer() 
-            renderer.setClassAttribute('value') 
-            layer1.setRenderer(renderer)
-            if layer1.featureCount() < 10 :
-                layer1.renderer().updateClasses(layer1, QgsGraduatedSymbolRenderer.EqualInterval, 9)
-            else:
-                layer1.renderer().updateClasses(layer1, QgsGraduatedSymbolRenderer.Jenks, 9)
-            default_style = QgsStyle().defaultStyle()
-            color_ramp = default_style.colorRamp('Reds')
-            layer1.renderer().updateColorRamp(color_ramp)
-            self.iface.layerTreeView().refreshLayerSymbology(layer1.id())
-            self.iface.mapCanvas().refreshAllLayers()
+        self.datajoin(alist, aggregated)
 
-            self.fill_color_attribute_graduatedsymbol_renderer(layer1,"fill")
+        layer1 = self.iface.addVectorLayer(os.path.dirname(__file__) + '/temp/result.gpkg','result','ogr')
+        # スタイル指定
+        renderer = QgsGraduatedSymbolRenderer() 
+        renderer.setClassAttribute('value') 
+        layer1.setRenderer(renderer)
+        if layer1.featureCount() < 10 :
+            layer1.renderer().updateClasses(layer1, QgsGraduatedSymbolRenderer.EqualInterval, 9)
+        else:
+            layer1.renderer().updateClasses(layer1, QgsGraduatedSymbolRenderer.Jenks, 9)
+        default_style = QgsStyle().defaultStyle()
+        color_ramp = default_style.colorRamp('Reds')
+        layer1.renderer().updateColorRamp(color_ramp)
+        self.iface.layerTreeView().refreshLayerSymbology(layer1.id())
+        self.iface.mapCanvas().refreshAllLayers()
 
-            QgsVectorFileWriter.writeAsVectorFormat(
-                layer1,
-                os.path.dirname(__file__) + '/temp/result.geojson',
-                'UTF-8',
-                QgsCoordinateReferenceSystem("EPSG:4326"),
-                'GeoJSON',
-                layerOptions=['id_field=fid']
-            )
-            
-            url = os.path.dirname(__file__)+"/html/001.html"
-            self.replaceData(url,os.path.dirname(__file__) + '/temp/result.geojson',None, False,True)
+        self.fill_color_attribute_graduatedsymbol_renderer(layer1,"fill")
 
-            if len(QgsProject.instance().mapLayersByName('result')) >= 1 :
-                QgsProject.instance().removeMapLayer(QgsProject.instance().mapLayersByName('result')[0].id())
-            
-            progress.close()
-            
-            QMessageBox.information(None, "分析処理", "分析処理が完了しました。")
-            self.move_001_6()
-            self.btn_001_5_n.setVisible(True)
-            self.lbl_001_5_n.setVisible(True)
+        QgsVectorFileWriter.writeAsVectorFormat(
+            layer1,
+            os.path.dirname(__file__) + '/temp/result.geojson',
+            'UTF-8',
+            QgsCoordinateReferenceSystem("EPSG:4326"),
+            'GeoJSON',
+            layerOptions=['id_field=fid']
+        )
+        
+        url = os.path.dirname(__file__)+"/html/001.html"
+        self.replaceData(url,os.path.dirname(__file__) + '/temp/result.geojson',None, False,True)
 
-        except:
+        if len(QgsProject.instance().mapLayersByName('result')) >= 1 :
+            QgsProject.instance().removeMapLayer(QgsProject.instance().mapLayersByName('result')[0].id())
+
+        self.results.store(result_key, RESULT_FILES_001)
+        return ANALYSIS_DONE
+
+    def batch_001_clicked(self):
+        combos = [self.cmb_option1, self.cmb_option2, self.cmb_option3, self.cmb_option4, self.cmb_option5,
+                  self.cmb_option6, self.cmb_option7, self.cmb_option8, self.cmb_option9, self.cmb_option10]
+        self.start_batch('001', combos, self.txt_sql_001.text().strip())
+
+    def start_batch(self, page, combos, where):
+        """プルダウンの入力の組み合わせごとに分析処理(page)を行い、HTMLをフォルダに出力する(一括出力)"""
+        try:
+            if self.dataset is None or self.dataset.kind != BATCH_KINDS[page] :
+                QMessageBox.warning(None, "一括出力", "先に人流データを読み込んでください")
+                return
+            filter_list = [str(combo.currentText()) for combo in combos[:self.len]]
+            jobs = batch.combinations(self.dataset, filter_list)
+            if len(jobs) > batch.MAX_REPORTS :
+                QMessageBox.warning(None, "一括出力", "組み合わせが多すぎます({:,}件、上限{:,}件)".format(len(jobs), batch.MAX_REPORTS))
+                return
+            output_dir = QFileDialog.getExistingDirectory(self, "出力先フォルダ", os.path.expanduser('~') + '/Desktop')
+            if not output_dir :
+                return
+            self.run_batch(page, filter_list, where, jobs, output_dir)
+        except staging.QueryError as e:
+            QMessageBox.warning(None, "SQL条件", str(e))
+        except :
+            QMessageBox.warning(None, "一括出力", "一括出力時に問題が発生しました")
+
+    def run_batch(self, page, filter_list, where, jobs, output_dir):
+        """組み合わせ(jobs)ごとに画面の分析処理と同じ analyze_001 などでHTMLを作成し、output_dir にコピーする
+
+        地図の階級区分・色・表示範囲は画面から分析した場合と同じになる(QGISを使うためメインスレッドで順に行う)
+        """
+        analyze = {'001': self.analyze_001, '002': self.analyze_002, '003': self.analyze_003}[page]
+        progress = QProgressDialog('一括出力しています...', 'キャンセル', 0, len(jobs), None)
+        progress.setWindowModality(Qt.ApplicationModal)
+        progress.setWindowFlag(Qt.WindowContextHelpButtonHint, False)
+        progress.setWindowFlag(Qt.WindowCloseButtonHint, False)
+        progress.show()
+        QApplication.processEvents()
+
+        html_path = os.path.dirname(__file__) + '/html/' + page + '.html.html'
+        used = set()
+        written = 0
+        empty = 0
+        failed = 0
+        try:
+            os.makedirs(output_dir, exist_ok=True)
+            for i, filters in enumerate(jobs) :
+                if progress.wasCanceled() :
+                    break
+                progress.setValue(i)
+                QApplication.processEvents()
+                try:
+                    status = analyze(batch.filter_texts(filter_list, filters), where)
+                except KeyError:
+                    status = ANALYSIS_FAILED
+                if status == ANALYSIS_EMPTY :
+                    empty += 1
+                elif status == ANALYSIS_FAILED :
+                    failed += 1
+                else :
+                    shutil.copyfile(html_path, os.path.join(output_dir, batch.report_name(page, filters, used)))
+                    written += 1
+            canceled = progress.wasCanceled()
             progress.close()
-            QMessageBox.warning(None, "分析処理", "分析処理時に問題が発生しました")
+        except staging.QueryError as e:
+            progress.close()
+            QMessageBox.warning(None, "SQL条件", str(e))
+            return
+        except :
+            progress.close()
+            QMessageBox.warning(None, "一括出力", "一括出力時に問題が発生しました({:,}件出力済み)".format(written))
+            return
+
+        message = "{:,}件のHTMLを出力しました。({})".format(written, output_dir)
+        if empty > 0 :
+            message += "\n該当レコードの無い組み合わせ{:,}件は出力していません。".format(empty)
+        if failed > 0 :
+            message += "\nクロス集計に失敗した組み合わせ{:,}件は出力していません。".format(failed)
+        if canceled :
+            message += "\n途中でキャンセルしました。"
+        QMessageBox.information(None, "一括出力", message)
 
     def export_html_001_clicked(self):
         # ダイアログ表示
@@ -1056,7 +1298,6 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
             QMessageBox.warning(None, "HTML保存", "HTML保存時に問題が発生しました")        
 
     def export_csv_001_clicked(self):
-        layer1 = QgsProject.instance().mapLayersByName('csv')[0]
         output_path = QFileDialog.getSaveFileName(self, "保存先指定",
                                        os.path.expanduser('~') + '/Desktop','CSV(*.csv)')
         try :
@@ -1193,7 +1434,7 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
         try:
 
             (fileName, selectedFilter) = QFileDialog.getOpenFileName(self, '計測データ選択', 
-                                self.default_file_path, "計測データcsv (*.csv)")
+                                self.default_file_path, "計測データ (" + loader.FILE_PATTERNS + ")")
 
             if fileName != None and fileName != "":
                 self.default_file_path = os.path.dirname(fileName)
@@ -1205,15 +1446,15 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
                 progress.show()
 
                 QApplication.processEvents()
-                file_encoding = encodingCheck(fileName)
-                if "error" in file_encoding :
-                    progress.close()
-                    QMessageBox.warning(None, "CSVフォーマットチェック", "文字コードが対応していません(" + file_encoding +")")
-                    return
+                file_encoding = None
+                if loader.is_csv(fileName) :
+                    file_encoding = encodingCheck(fileName)
+                    if "error" in file_encoding :
+                        progress.close()
+                        QMessageBox.warning(None, "CSVフォーマットチェック", "文字コードが対応していません(" + file_encoding +")")
+                        return
                 #ヘッダー確認
-                with open(fileName, encoding=file_encoding, newline='') as f:
-                    csvreader = csv.reader(f)
-                    header = next(csvreader)
+                header = loader.read_header(fileName, file_encoding)
                 
                 if len(header) != len(set(header)) :
                     progress.close()
@@ -1263,219 +1504,239 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
                         QMessageBox.warning(None, "CSVフォーマットチェック", "CSVの形式が異なります(option)")
                         return            
 
-                if sum([1 for _ in open(fileName, encoding=file_encoding, newline='')]) == 1:
-                    progress.close()
-                    QMessageBox.warning(None, "CSVチェック", "CSVデータが取得できませんでした")
-                    return
-                
-                file_path = fileName
-                file_name = file_path[file_path.rfind("/") + 1:]
-                self.lbl_002_filename.setText(file_name)
-                self.file_002_jinryu_path = fileName
-
-                # ファイル読み込み
-                with open(file_path, encoding=file_encoding, newline='') as f:
+                # 計測データ読み込み
+                progress.close()
+                # 値の確認は読み込みタスク内で全行まとめて行う
+                rules = validation.sensor_rules(self.place_id_list)
+                self.start_load_with_preview("計測データ", fileName,
+                    lambda: validation.check_result(loader.read_preview(fileName, dataset.SENSOR, file_encoding), rules),
+                    lambda callback: validation.check_result(
+                        loader.read_file(fileName, dataset.SENSOR, file_encoding, callback),
+                        rules, errors_path('errors_002.csv'), callback),
+                    lambda task: self.csv_read_002_loaded(task, fileName))
 
-                    reader = csv.reader(f)
-                    i=0
-                    for row in reader:
-                        # ヘッダーがある前提でスキップ
-                        if i == 0:
-                            i=i+1
-                            continue
+        except ValueError as e:
+            progress.close()
+            QMessageBox.warning(None, "CSVチェック", "フィールド(value)の値を数値として保存できませんでした")
+        except :
+            progress.close()
+            QMessageBox.warning(None, "人流データ読み込み", "ファイル読み込み時に問題が発生しました")
 
-                        if row[0] == "":
-                            progress.close()
-                            QMessageBox.warning(None, "CSVチェック", "place_idが指定されていません")
-                            return 
-
-                        if not(row[0] in self.place_id_list) :
-                            progress.close()
-                            QMessageBox.warning(None, "CSVチェック", "place_idがセンサーと一致しません")
-                            return 
-
-                        # 日付を取得（カラムごとにきちんと区切っておく）
-                        row_date_str = row[1] + "/" + row[2] + "/" + row[3] + " " + row[4] + ":" + row[5]
-                        try:
-                            row_date = datetime.datetime.strptime(row_date_str, '%Y/%m/%d %H:%M')
-                        except Exception as e:
-                            progress.close()
-                            QMessageBox.warning(None, "CSVチェック", "無効な日付、または日付以外が入力されています")
-                            return 
-
-                        # 日時, 計測点id, 数値(人数)
-                        r_data = [row_date, row[0], row[len(row)-1]]
-                        self.file_002_data_list.append(r_data)
-
-
-                        # 期間のための日時取得
-                        if i==1:
-                            self.date_002_from = row_date
-                            self.date_002_to = row_date
-                        else:
-                            if row_date < self.date_002_from:
-                                self.date_002_from = row_date
-                            if row_date > self.date_002_to:
-                                self.date_002_to = row_date
-                        i=i+1
+    def csv_read_002_loaded(self, task, fileName):
+        if not self.check_load_task(task, "人流データ読み込み", "フィールド(value)の値を数値として保存できませんでした"):
+            return
+        try:
+            data, stats, report = task.result
+            QgsMessageLog.logMessage("計測データ読み込み: " + str(stats), "PeopleFlowVisualization", Qgis.Info)
 
-                # センサーCSV読み込み
-                if len(QgsProject.instance().mapLayersByName('csv')) >= 1 :
-                    QgsProject.instance().removeMapLayer(QgsProject.instance().mapLayersByName('csv')[0].id())
-
-                csvLyr = QgsVectorLayer('None', 'csv', 'memory')
-                csvLyrprov = csvLyr.dataProvider()   
-                csvLyr.setProviderEncoding('UTF-8')
-                csvLyr.dataProvider().setEncoding('UTF-8')   
-                QgsProject.instance().addMapLayers([csvLyr])
-
-                csvLyrprov.addAttributes([QgsField("place_id", QVariant.String)])
-                csvLyrprov.addAttributes([QgsField("year", QVariant.String)])
-                csvLyrprov.addAttributes([QgsField("month", QVariant.String)])
-                csvLyrprov.addAttributes([QgsField("day", QVariant.String)])
-                csvLyrprov.addAttributes([QgsField("hour", QVariant.String)])
-                csvLyrprov.addAttributes([QgsField("minute", QVariant.String)])
-                for i in range(0,self.header_count-7):
-                    csvLyrprov.addAttributes([QgsField("option" + str(i+1), QVariant.String)])
-                csvLyrprov.addAttributes([QgsField("value", QVariant.Double)])
-                    
-                csvLyr.updateFields()
-                file_encoding = encodingCheck(self.file_002_jinryu_path)
+            if len(data) == 0:
+                QMessageBox.warning(None, "CSVチェック", "CSVデータが取得できませんでした")
+                return
+            
+            file_path = fileName
+            file_name = file_path[file_path.rfind("/") + 1:]
+            self.lbl_002_filename.setText(file_name)
+            self.file_002_jinryu_path = fileName
+
+            # データ確認(全行を確認し、エラーがあれば有効な行のみで続行するかを選ぶ)
+            data = self.check_rows(data, report, 'errors_002.csv', stats.preview)
+            if data is None :
+                return
 
-                featureList = []
-                with open(self.file_002_jinryu_path, encoding=file_encoding, newline='') as f:
-                    csvreader = csv.reader(f)
-                    header = next(csvreader)
-                    for row in csvreader:
-                        float(row[self.header_count-1])
-                        feat = QgsFeature()
-                        feat.setAttributes(row)
-                        featureList.append(feat)
-                    
-                csvLyr.dataProvider().addFeatures(featureList)        
-                csvLyr.commitChanges()
-                
-                layer1 = csvLyr
-
-
-                option_list = []
-                for cnt in range(0,self.header_count-7) :
-                    option = processing.run("qgis:listuniquevalues", {'INPUT':layer1,'FIELDS':['option'+str(cnt+1)],'OUTPUT':'TEMPORARY_OUTPUT'})
-                    option_list_temp = []
-                    for item in option["OUTPUT"].getFeatures():
-                        option_list_temp.append(item.attributes()[0])
-                    option_list.append(option_list_temp)
-
-
-                self.cmb_option1_2.setVisible(False)
-                self.lbl_option1_2.setVisible(False)
-                self.cmb_option2_2.setVisible(False)
-                self.lbl_option2_2.setVisible(False)
-                self.cmb_option3_2.setVisible(False)
-                self.lbl_option3_2.setVisible(False)
-                self.cmb_option4_2.setVisible(False)
-                self.lbl_option4_2.setVisible(False)
-                self.cmb_option5_2.setVisible(False)
-                self.lbl_option5_2.setVisible(False)
-                self.cmb_option6_2.setVisible(False)
-                self.lbl_option6_2.setVisible(False)
-                self.cmb_option7_2.setVisible(False)
-                self.lbl_option7_2.setVisible(False)
-                self.cmb_option8_2.setVisible(False)
-                self.lbl_option8_2.setVisible(False)
-                self.cmb_option9_2.setVisible(False)
-                self.lbl_option9_2.setVisible(False)
-                self.cmb_option10_2.setVisible(False)
-                self.lbl_option10_2.setVisible(False)
-
-                self.len = len(option_list)
-
-                if self.len >= 1 : 
-                    self.cmb_option1_2.clear()
-                    self.cmb_option1_2.addItem('ALL')
-                    self.cmb_option1_2.addItems(option_list[0])
-                    self.cmb_option1_2.model().sort(0)
-                    self.cmb_option1_2.setVisible(True)
-                    self.lbl_option1_2.setVisible(True)
-                if self.len >= 2 : 
-                    self.cmb_option2_2.clear()
-                    self.cmb_option2_2.addItem('ALL')
-                    self.cmb_option2_2.addItems(option_list[1])
-                    self.cmb_option2_2.model().sort(0)
-                    self.cmb_option2_2.setVisible(True)
-                    self.lbl_option2_2.setVisible(True)
-                if self.len >= 3 : 
-                    self.cmb_option3_2.clear()
-                    self.cmb_option3_2.addItem('ALL')
-                    self.cmb_option3_2.addItems(option_list[2])
-                    self.cmb_option3_2.model().sort(0)
-                    self.cmb_option3_2.setVisible(True)
-                    self.lbl_option3_2.setVisible(True)
-                if self.len >= 4 : 
-                    self.cmb_option4_2.clear()
-                    self.cmb_option4_2.addItem('ALL')
-                    self.cmb_option4_2.addItems(option_list[3])
-                    self.cmb_option4_2.model().sort(0)
-                    self.cmb_option4_2.setVisible(True)
-                    self.lbl_option4_2.setVisible(True)
-                if self.len >= 5 : 
-                    self.cmb_option5_2.clear()
-                    self.cmb_option5_2.addItem('ALL')
-                    self.cmb_option5_2.addItems(option_list[4])
-                    self.cmb_option5_2.model().sort(0)
-                    self.cmb_option5_2.setVisible(True)
-                    self.lbl_option5_2.setVisible(True)
-                if self.len >= 6 : 
-                    self.cmb_option6_2.clear()
-                    self.cmb_option6_2.addItem('ALL')
-                    self.cmb_option6_2.addItems(option_list[5])
-                    self.cmb_option6_2.model().sort(0)
-                    self.cmb_option6_2.setVisible(True)
-                    self.lbl_option6_2.setVisible(True)
-                if self.len >= 7 : 
-                    self.cmb_option7_2.clear()
-                    self.cmb_option7_2.addItem('ALL')
-                    self.cmb_option7_2.addItems(option_list[6])
-                    self.cmb_option7_2.model().sort(0)
-                    self.cmb_option7_2.setVisible(True)
-                    self.lbl_option7_2.setVisible(True)
-                if self.len >= 8 : 
-                    self.cmb_option8_2.clear()
-                    self.cmb_option8_2.addItem('ALL')
-                    self.cmb_option8_2.addItems(option_list[7])
-                    self.cmb_option8_2.model().sort(0)
-                    self.cmb_option8_2.setVisible(True)
-                    self.lbl_option8_2.setVisible(True)
-                if self.len >= 9 : 
-                    self.cmb_option9_2.clear()
-                    self.cmb_option9_2.addItem('ALL')
-                    self.cmb_option9_2.addItems(option_list[8])
-                    self.cmb_option9_2.model().sort(0)
-                    self.cmb_option9_2.setVisible(True)
-                    self.lbl_option9_2.setVisible(True)
-                if self.len >= 10 : 
-                    self.cmb_option10_2.clear()
-                    self.cmb_option10_2.addItem('ALL')
-                    self.cmb_option10_2.addItems(option_list[9])
-                    self.cmb_option10_2.model().sort(0)
-                    self.cmb_option10_2.setVisible(True)
-                    self.lbl_option10_2.setVisible(True)
-                
-                progress.close()
-                self.lbl_002_read_msg.setText("計測データの読み込みに成功しました。")
+            # 日付を取得（year,month,day,hour,minuteを読み込み時に1回だけ日時の列に変換しておく）
+            data.add_datetime()
+
+            # 期間のための日時取得
+            self.date_002_from, self.date_002_to = data.datetime_range()
+
+            self.dataset = data
+            self.mask = None
+
+            option_list = []
+            for cnt in range(0,self.header_count-7) :
+                option_list.append(self.dataset.unique('option'+str(cnt+1)))
+
+
+            self.cmb_option1_2.setVisible(False)
+            self.lbl_option1_2.setVisible(False)
+            self.cmb_option2_2.setVisible(False)
+            self.lbl_option2_2.setVisible(False)
+            self.cmb_option3_2.setVisible(False)
+            self.lbl_option3_2.setVisible(False)
+            self.cmb_option4_2.setVisible(False)
+            self.lbl_option4_2.setVisible(False)
+            self.cmb_option5_2.setVisible(False)
+            self.lbl_option5_2.setVisible(False)
+            self.cmb_option6_2.setVisible(False)
+            self.lbl_option6_2.setVisible(False)
+            self.cmb_option7_2.setVisible(False)
+            self.lbl_option7_2.setVisible(False)
+            self.cmb_option8_2.setVisible(False)
+            self.lbl_option8_2.setVisible(False)
+            self.cmb_option9_2.setVisible(False)
+            self.lbl_option9_2.setVisible(False)
+            self.cmb_option10_2.setVisible(False)
+            self.lbl_option10_2.setVisible(False)
+
+            self.len = len(option_list)
+
+            if self.len >= 1 : 
+                self.cmb_option1_2.clear()
+                self.cmb_option1_2.addItem('ALL')
+                self.cmb_option1_2.addItems(option_list[0])
+                self.cmb_option1_2.model().sort(0)
+                self.cmb_option1_2.setVisible(True)
+                self.lbl_option1_2.setVisible(True)
+            if self.len >= 2 : 
+                self.cmb_option2_2.clear()
+                self.cmb_option2_2.addItem('ALL')
+                self.cmb_option2_2.addItems(option_list[1])
+                self.cmb_option2_2.model().sort(0)
+                self.cmb_option2_2.setVisible(True)
+                self.lbl_option2_2.setVisible(True)
+            if self.len >= 3 : 
+                self.cmb_option3_2.clear()
+                self.cmb_option3_2.addItem('ALL')
+                self.cmb_option3_2.addItems(option_list[2])
+                self.cmb_option3_2.model().sort(0)
+                self.cmb_option3_2.setVisible(True)
+                self.lbl_option3_2.setVisible(True)
+            if self.len >= 4 : 
+                self.cmb_option4_2.clear()
+                self.cmb_option4_2.addItem('ALL')
+                self.cmb_option4_2.addItems(option_list[3])
+                self.cmb_option4_2.model().sort(0)
+                self.cmb_option4_2.setVisible(True)
+                self.lbl_option4_2.setVisible(True)
+            if self.len >= 5 : 
+                self.cmb_option5_2.clear()
+                self.cmb_option5_2.addItem('ALL')
+                self.cmb_option5_2.addItems(option_list[4])
+                self.cmb_option5_2.model().sort(0)
+                self.cmb_option5_2.setVisible(True)
+                self.lbl_option5_2.setVisible(True)
+            if self.len >= 6 : 
+                self.cmb_option6_2.clear()
+                self.cmb_option6_2.addItem('ALL')
+                self.cmb_option6_2.addItems(option_list[5])
+                self.cmb_option6_2.model().sort(0)
+                self.cmb_option6_2.setVisible(True)
+                self.lbl_option6_2.setVisible(True)
+            if self.len >= 7 : 
+                self.cmb_option7_2.clear()
+                self.cmb_option7_2.addItem('ALL')
+                self.cmb_option7_2.addItems(option_list[6])
+                self.cmb_option7_2.model().sort(0)
+                self.cmb_option7_2.setVisible(True)
+                self.lbl_option7_2.setVisible(True)
+            if self.len >= 8 : 
+                self.cmb_option8_2.clear()
+                self.cmb_option8_2.addItem('ALL')
+                self.cmb_option8_2.addItems(option_list[7])
+                self.cmb_option8_2.model().sort(0)
+                self.cmb_option8_2.setVisible(True)
+                self.lbl_option8_2.setVisible(True)
+            if self.len >= 9 : 
+                self.cmb_option9_2.clear()
+                self.cmb_option9_2.addItem('ALL')
+                self.cmb_option9_2.addItems(option_list[8])
+                self.cmb_option9_2.model().sort(0)
+                self.cmb_option9_2.setVisible(True)
+                self.lbl_option9_2.setVisible(True)
+            if self.len >= 10 : 
+                self.cmb_option10_2.clear()
+                self.cmb_option10_2.addItem('ALL')
+                self.cmb_option10_2.addItems(option_list[9])
+                self.cmb_option10_2.model().sort(0)
+                self.cmb_option10_2.setVisible(True)
+                self.lbl_option10_2.setVisible(True)
+            
+            self.lbl_002_read_msg.setText(self.load_message("計測データ", stats))
+            self.btn_002_csv_append.setVisible(True)
 
-                self.file_002_name = file_name
+            self.file_002_name = file_name
 
-                self.btn_002_3_n.setVisible(True)
-                self.lbl_002_3_n.setVisible(True)
+            self.btn_002_3_n.setVisible(True)
+            self.lbl_002_3_n.setVisible(True)
 
         except ValueError as e:
-            progress.close()
             QMessageBox.warning(None, "CSVチェック", "フィールド(value)の値を数値として保存できませんでした")
         except :
-            progress.close()
             QMessageBox.warning(None, "人流データ読み込み", "ファイル読み込み時に問題が発生しました")
 
+    def csv_append_002_clicked(self):
+        try:
+            if self.dataset is None or self.dataset.kind != dataset.SENSOR :
+                QMessageBox.warning(None, "計測データ読み込み", "先に計測データを読み込んでください")
+                return
+
+            (fileName, selectedFilter) = QFileDialog.getOpenFileName(self, '追加データ選択', 
+                                self.default_file_path, "計測データ (" + loader.FILE_PATTERNS + ")")
+
+            if fileName != None and fileName != "":
+                self.default_file_path = os.path.dirname(fileName)
+                file_encoding = None
+                if loader.is_csv(fileName) :
+                    file_encoding = encodingCheck(fileName)
+                    if "error" in file_encoding :
+                        QMessageBox.warning(None, "CSVフォーマットチェック", "文字コードが対応していません(" + file_encoding +")")
+                        return
+                #ヘッダー確認(読み込み済みのデータと同じ項目であること)
+                header = loader.read_header(fileName, file_encoding)
+                if header != self.dataset.header :
+                    QMessageBox.warning(None, "CSVフォーマットチェック", "読み込み済みのデータと項目が異なります")
+                    return
+
+                rules = validation.sensor_rules(self.place_id_list)
+                self.start_load_task("追加データ",
+                    lambda callback: validation.check_result(
+                        loader.read_file(fileName, dataset.SENSOR, file_encoding, callback),
+                        rules, errors_path('errors_002.csv'), callback),
+                    lambda task: self.csv_append_002_loaded(task, fileName))
+        except :
+            QMessageBox.warning(None, "計測データ読み込み", "ファイル読み込み時に問題が発生しました")
+
+    def csv_append_002_loaded(self, task, fileName):
+        if not self.check_load_task(task, "計測データ読み込み", "フィールド(value)の値を数値として保存できませんでした"):
+            return
+        try:
+            delta, stats, report = task.result
+            QgsMessageLog.logMessage("計測データ追加読み込み: " + str(stats), "PeopleFlowVisualization", Qgis.Info)
+
+            if len(delta) == 0:
+                QMessageBox.warning(None, "CSVチェック", "CSVデータが取得できませんでした")
+                return
+
+            if dataset.already_loaded(self.dataset, delta) :
+                QMessageBox.warning(None, "計測データ読み込み", "読み込み済みのファイルです")
+                return
+
+            # 追加分のみ確認する
+            delta = self.check_rows(delta, report, 'errors_002.csv')
+            if delta is None :
+                return
+
+            delta.add_datetime()
+
+            # 読み込み済みのデータに結合し、optionの候補を追加分で広げる
+            self.dataset = staging.append(self.dataset, delta)
+            self.mask = None
+            # 期間は初回の読み込みと同じく、結合したデータ全体の期間に設定し直す
+            self.date_002_from, self.date_002_to = self.dataset.datetime_range()
+
+            combos = [self.cmb_option1_2, self.cmb_option2_2, self.cmb_option3_2, self.cmb_option4_2, self.cmb_option5_2,
+                      self.cmb_option6_2, self.cmb_option7_2, self.cmb_option8_2, self.cmb_option9_2, self.cmb_option10_2]
+            for cnt in range(self.header_count-7) :
+                combos[cnt].clear()
+                combos[cnt].addItem('ALL')
+                combos[cnt].addItems(self.dataset.unique('option'+str(cnt+1)))
+                combos[cnt].model().sort(0)
+
+            self.lbl_002_filename.setText(self.lbl_002_filename.text() + ", " + os.path.basename(fileName))
+            self.lbl_002_read_msg.setText("追加データの読み込みに成功しました。(合計" + "{:,}".format(len(self.dataset)) + "件)")
+        except :
+            QMessageBox.warning(None, "計測データ読み込み", "ファイル読み込み時に問題が発生しました")
+
     def btn_option_load_2_clicked(self):
         try:
             self.lbl_001_8.setText('')
@@ -1571,7 +1832,6 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
             
             self.btn_002_5_n.setVisible(False)
             self.lbl_002_5_n.setVisible(False)
-            layer1 = QgsProject.instance().mapLayersByName('csv')[0]
             filter_list = []
             if self.len >= 1 : filter_list.append(str(self.cmb_option1_2.currentText()))
             if self.len >= 2 : filter_list.append(str(self.cmb_option2_2.currentText()))
@@ -1584,220 +1844,228 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
             if self.len >= 9 : filter_list.append(str(self.cmb_option9_2.currentText()))
             if self.len >= 10 : filter_list.append(str(self.cmb_option10_2.currentText()))
 
-            sfilter = ""
-            self.filter = {}
+            where = self.txt_sql_002.text().strip()
+            status = self.analyze_002(filter_list, where)
+            progress.close()
+            if status == ANALYSIS_EMPTY :
+                QMessageBox.warning(None, "分析処理", "該当レコードがありません")
+                return
+            if status == ANALYSIS_RESTORED :
+                QMessageBox.information(None, "分析処理", "分析処理が完了しました。(前回の分析結果を表示しています)")
+            else :
+                QMessageBox.information(None, "分析処理", "分析処理が完了しました。")
+            self.move_002_6()
+
+            self.btn_002_5_n.setVisible(True)
+            self.lbl_002_5_n.setVisible(True)
+
+        except staging.QueryError as e:
+            progress.close()
+            QMessageBox.warning(None, "SQL条件", str(e))
+        except :
+            progress.close()
+            QMessageBox.warning(None, "分析処理", "分析処理時に問題が発生しました")
+
+    def analyze_002(self, filter_list, where):
+        """プルダウンの入力(filter_list)とSQL条件(where)で分析処理(002)を行い、地図・HTMLを出力する
+
+        一括出力も同じ処理で組み合わせごとのHTMLを作成する。戻り値は ANALYSIS_* のいずれか
+        """
+        self.filter = {}
+
+        alist = []
+        sfilter = {}
+        for cnt in range(self.header_count-7) :
+            condition = dataset.parse_filter(filter_list[cnt])
+            if condition is None :
+                alist.append("option" + str(cnt+1))
+            else :
+                sfilter["option" + str(cnt+1)] = condition
+                # 複数の値・範囲を指定した項目は、ALLと同様に1つの値に絞り込まない項目として扱う
+                if isinstance(condition, dataset.Condition) :
+                    alist.append("option" + str(cnt+1))
+            self.filter["option" + str(cnt+1)] = [self.colName.get("option" + str(cnt+1), "option" + str(cnt+1)),filter_list[cnt]]
+
+        # 同じデータ・抽出条件・期間の分析結果があれば、抽出せずに出力ファイルを書き戻して表示する
+        # (CSV出力で抽出した行が必要になるため、条件を残しておく)
+        result_key = self.result_key('002', filter_list, where, self.date_002_from, self.date_002_to,
+                                     results.file_key(self.file_002_sensor_path))
+        if self.results.restore(result_key) :
+            self.restore_layer(os.path.dirname(__file__) + '/temp/result_002.geojson')
+            self.mask = None
+            self.mask_query = (sfilter, where)
+            return ANALYSIS_RESTORED
+
+        # SQL条件(WHERE句)が入力されていれば、プルダウンの条件と合わせて抽出する
+        self.mask = staging.mask(self.dataset, sfilter, where)
+        self.mask_query = None
+
+        QApplication.processEvents()
+
+        if not self.mask.any():
+            return ANALYSIS_EMPTY
+
+        #self.lbl_002_07_msg_status.setText("分析実行中")
+        self.datafilter()
+        ########################################
+        # 地図用のGeoJson作成
+
+        ###############################################################
+        # 1.仮レイヤ作成
+        if len(QgsProject.instance().mapLayersByName('result')) >= 1 :
+            QgsProject.instance().removeMapLayer(QgsProject.instance().mapLayersByName('result')[0].id())
+
+        new_layer = QgsVectorLayer("point", "result", "memory")
+
+        QgsProject.instance().addMapLayer(new_layer)
+        prov = new_layer.dataProvider()
+        caps = prov.capabilities()
+        if caps & QgsVectorDataProvider.AddAttributes:
+            prov.addAttributes(
+                [
+                    QgsField('id', QVariant.String),
+                    QgsField('value', QVariant.Int),
+                    QgsField('name', QVariant.String),
+                    QgsField('option1', QVariant.String),
+                    QgsField('option2', QVariant.String),
+                    QgsField('option3', QVariant.String),
+                    QgsField('option4', QVariant.String),
+                    QgsField('option5', QVariant.String)
+                    # QgsField('value', QVariant.Double, len=10,prec=2)
+                ])
+            new_layer.updateFields()
+
+        # 2.CSVから位置情報取得およびレイヤに追加
+        # 人数の最大、最小
+        circle_max = None
+        circle_min = None
+
+        new_layer.startEditing()
+        # for feat in _layer.getFeatures():
+        file_encoding = encodingCheck(self.file_002_sensor_path)
+        with open(self.file_002_sensor_path, encoding=file_encoding, newline='') as f:
+            reader = csv.reader(f)
+            i=0
+            for f_row in reader:
+                # ヘッダーがある前提でスキップ
+                if i == 0:
+                    i=i+1
+                    continue
+
+                if f_row[0] not in self.file_002_point_name_list:
+                    self.file_002_point_name_list[f_row[0]] = f_row[3]
+
+
+                sensor_id = f_row[0]
+                if sensor_id in self.point_geo_features: # file_002_sensor_pathはマスタなので、実データがない場合もある
+                    # lon, latで登録
+                    _geom = QgsGeometry.fromPointXY(QgsPointXY(float(f_row[2]), float(f_row[1])))
+                    feature2 = QgsFeature(new_layer.fields())
+                    feature2.setGeometry(_geom)
+                    feature2[0] = sensor_id
 
-            alist = []
-            for cnt in range(self.header_count-7) :
-                if cnt == 0:
-                    if filter_list[0] == 'ALL' :
-                        alist.append("option1")
-                    else :
-                        sfilter += "\"option1\" = '%s'" % (filter_list[0])
-                    self.filter["option1"] = [self.colName.get('option1', 'option1'),filter_list[0]]
-                else:
-                    if filter_list[cnt] == 'ALL' :
-                        alist.append("option" + str(cnt+1))
-                    else :
-                        if sfilter == "" :
-                            sfilter +=  "\"option%s\" = '%s'" % (cnt+1,filter_list[cnt])
-                        else :    
-                            sfilter +=  " AND \"option%s\" = '%s'" % (cnt+1,filter_list[cnt])
-                    self.filter["option" + str(cnt+1)] = [self.colName.get("option" + str(cnt+1), "option" + str(cnt+1)),filter_list[cnt]]
+                    sensor_value = self.point_geo_features[sensor_id] # value：計測点の集計値
+                    feature2[1] = sensor_value
 
-            layer1.setSubsetString(sfilter)
+                    feature2[2] = f_row[3]
+                    if len(f_row) > 4 :
+                        feature2[3] = f_row[4]
+                    if len(f_row) > 5 :
+                        feature2[4] = f_row[5]
+                    if len(f_row) > 6 :
+                        feature2[5] = f_row[6]
+                    if len(f_row) > 7 :
+                        feature2[6] = f_row[7]
+                    if len(f_row) > 8 :
+                        feature2[7] = f_row[8]
 
-            QApplication.processEvents()
+                    new_layer.addFeature(feature2)
 
-            if layer1.featureCount() <= 0:
-                progress.close()
-                QMessageBox.warning(None, "分析処理", "該当レコードがありません")
-                return  
-            #self.lbl_002_07_msg_status.setText("分析実行中")
-            idx1 = layer1.dataProvider().fields().indexFromName("place_id")
-            idx2 = layer1.dataProvider().fields().indexFromName("year")
-            idx3 = layer1.dataProvider().fields().indexFromName("month")
-            idx4 = layer1.dataProvider().fields().indexFromName("day")
-            idx5 = layer1.dataProvider().fields().indexFromName("hour")
-            idx6 = layer1.dataProvider().fields().indexFromName("minute")
-            idx7 = layer1.dataProvider().fields().indexFromName("value")
-
-            # 日時, 計測点id, 数値(人数)
-            self.file_002_data_list = []
-            for feat in layer1.getFeatures():
-                attribute_map = feat.attributes()
-                value = attribute_map[idx7]
-                # 日付を取得（カラムごとにきちんと区切っておく）
-                row_date_str = attribute_map[idx2] + "/" + attribute_map[idx3] + "/" + attribute_map[idx4] + " " + attribute_map[idx5] + ":" + attribute_map[idx6]
-                row_date = datetime.datetime.strptime(row_date_str, '%Y/%m/%d %H:%M')
-
-                r_data = [row_date, attribute_map[idx1], attribute_map[idx7]]
-                self.file_002_data_list.append(r_data)
-
-            self.datafilter()
-            ########################################
-            # 地図用のGeoJson作成
-
-            ###############################################################
-            # 1.仮レイヤ作成
-            if len(QgsProject.instance().mapLayersByName('result')) >= 1 :
-                QgsProject.instance().removeMapLayer(QgsProject.instance().mapLayersByName('result')[0].id())
-
-            new_layer = QgsVectorLayer("point", "result", "memory")
-
-            QgsProject.instance().addMapLayer(new_layer)
-            prov = new_layer.dataProvider()
-            caps = prov.capabilities()
-            if caps & QgsVectorDataProvider.AddAttributes:
-                prov.addAttributes(
-                    [
-                        QgsField('id', QVariant.String),
-                        QgsField('value', QVariant.Int),
-                        QgsField('name', QVariant.String),
-                        QgsField('option1', QVariant.String),
-                        QgsField('option2', QVariant.String),
-                        QgsField('option3', QVariant.String),
-                        QgsField('option4', QVariant.String),
-                        QgsField('option5', QVariant.String)
-                        # QgsField('value', QVariant.Double, len=10,prec=2)
-                    ])
-                new_layer.updateFields()
-
-            # 2.CSVから位置情報取得およびレイヤに追加
-            # 人数の最大、最小
-            circle_max = None
-            circle_min = None
-
-            new_layer.startEditing()
-            # for feat in _layer.getFeatures():
-            file_encoding = encodingCheck(self.file_002_sensor_path)
-            with open(self.file_002_sensor_path, encoding=file_encoding, newline='') as f:
-                reader = csv.reader(f)
-                i=0
-                for f_row in reader:
-                    # ヘッダーがある前提でスキップ
-                    if i == 0:
-                        i=i+1
-                        continue
-
-                    if f_row[0] not in self.file_002_point_name_list:
-                        self.file_002_point_name_list[f_row[0]] = f_row[3]
-
-
-                    sensor_id = f_row[0]
-                    if sensor_id in self.point_geo_features: # file_002_sensor_pathはマスタなので、実データがない場合もある
-                        # lon, latで登録
-                        _geom = QgsGeometry.fromPointXY(QgsPointXY(float(f_row[2]), float(f_row[1])))
-                        feature2 = QgsFeature(new_layer.fields())
-                        feature2.setGeometry(_geom)
-                        feature2[0] = sensor_id
-
-                        sensor_value = self.point_geo_features[sensor_id] # value：計測点の集計値
-                        feature2[1] = sensor_value
-
-                        feature2[2] = f_row[3]
-                        if len(f_row) > 4 :
-                            feature2[3] = f_row[4]
-                        if len(f_row) > 5 :
-                            feature2[4] = f_row[5]
-                        if len(f_row) > 6 :
-                            feature2[5] = f_row[6]
-                        if len(f_row) > 7 :
-                            feature2[6] = f_row[7]
-                        if len(f_row) > 8 :
-                            feature2[7] = f_row[8]
-
-                        new_layer.addFeature(feature2)
-
-                        if circle_max == None:
+                    if circle_max == None:
+                        circle_max = sensor_value
+                    else:
+                        if sensor_value > circle_max:
                             circle_max = sensor_value
-                        else:
-                            if sensor_value > circle_max:
-                                circle_max = sensor_value
-                        if circle_min == None:
+                    if circle_min == None:
+                        circle_min = sensor_value
+                    else:
+                        if sensor_value < circle_min:
                             circle_min = sensor_value
-                        else:
-                            if sensor_value < circle_min:
-                                circle_min = sensor_value
 
-                    i=i+1
+                i=i+1
 
-            new_layer.commitChanges()
+        new_layer.commitChanges()
 
-            if new_layer.featureCount() <= 0:
-                progress.close()
-                QMessageBox.warning(None, "分析処理", "該当レコードがありません")
-                return
+        if new_layer.featureCount() <= 0:
+            QgsProject.instance().removeMapLayer(new_layer.id())
+            return ANALYSIS_EMPTY
 
-            # 3.geojsonとして出力
-            # ※センサー情報(位置情報)がない場合でも出力
-            QgsVectorFileWriter.writeAsVectorFormat(
-                new_layer,
-                os.path.dirname(__file__) + '/temp/result_002.geojson',
-                'UTF-8',
-                QgsCoordinateReferenceSystem("EPSG:4326"),
-                'GeoJSON'
-            )
+        # 3.geojsonとして出力
+        # ※センサー情報(位置情報)がない場合でも出力
+        QgsVectorFileWriter.writeAsVectorFormat(
+            new_layer,
+            os.path.dirname(__file__) + '/temp/result_002.geojson',
+            'UTF-8',
+            QgsCoordinateReferenceSystem("EPSG:4326"),
+            'GeoJSON'
+        )
 
-            # htmlテンプレートの取得と文字置換
-            url = os.path.dirname(__file__)+"/html/002.html" # htmlテンプレート
-
-            # 計測点独自の情報
-            # 1.計測点のIDリスト文字列
-            # 数値でソートもする
-            point_id_list = list(self.point_geo_features.keys())
-            point_id_int_list = []
-            #for p_id in point_id_list:
-            #    point_id_int_list.append(int(p_id))
-            point_id_int_list = sorted(point_id_int_list)
-
-            point_ids = ','.join("'" + str(s) + "'" for s in point_id_list) # シングルクォーテーションもつける
-
-            # 2.グラフデータ
-            graph_data = self.file_002_term_data_1
-            graph_data_2 = self.file_002_term_data_2
-
-            # 3.地図上の計測点の色
-            # 'graph_item[0], color(graph_item[0]),graph_item[1], color(graph_item[1])'
-            # graph_item:htmlで定義した変数
-            paint_str = ""
-            for i in range(len(self.point_geo_features)):
-                paint_str += 'graph_item[' + str(i) +'], color(graph_item['+ str(i) +']),'
-            paint_str += "'#ccc'" # 不明の場合の色
-
-            # 4.凡例のhtml
-            legend_div = ""
-            for p_id in point_id_list:
-                legend_div += '<div class="grapy_legend"><span id="sp_'+ str(p_id) +'">　</span> ' + self.file_002_point_name_list[str(p_id)] + '</div>'
-
-            self.replaceData(
-                    url, 
-                    os.path.dirname(__file__) + '/temp/result_002.geojson', 
-                    [
-                        point_ids, 
-                        graph_data, 
-                        graph_data_2, 
-                        paint_str,
-                        legend_div,
-                        [circle_max, circle_min] # 円の大きさrangeを決めるため
-                    ],
-                    True,
-                    False
-                    )
-            url = url + ".html" # 置換ファイル
-            QMessageBox.information(None, "分析処理", "分析処理が完了しました。")
-            self.move_002_6()
+        # htmlテンプレートの取得と文字置換
+        url = os.path.dirname(__file__)+"/html/002.html" # htmlテンプレート
+
+        # 計測点独自の情報
+        # 1.計測点のIDリスト文字列
+        # 数値でソートもする
+        point_id_list = list(self.point_geo_features.keys())
+        point_id_int_list = []
+        #for p_id in point_id_list:
+        #    point_id_int_list.append(int(p_id))
+        point_id_int_list = sorted(point_id_int_list)
+
+        point_ids = ','.join("'" + str(s) + "'" for s in point_id_list) # シングルクォーテーションもつける
+
+        # 2.グラフデータ
+        graph_data = self.file_002_term_data_1
+        graph_data_2 = self.file_002_term_data_2
+
+        # 3.地図上の計測点の色
+        # 'graph_item[0], color(graph_item[0]),graph_item[1], color(graph_item[1])'
+        # graph_item:htmlで定義した変数
+        paint_str = ""
+        for i in range(len(self.point_geo_features)):
+            paint_str += 'graph_item[' + str(i) +'], color(graph_item['+ str(i) +']),'
+        paint_str += "'#ccc'" # 不明の場合の色
+
+        # 4.凡例のhtml
+        legend_div = ""
+        for p_id in point_id_list:
+            legend_div += '<div class="grapy_legend"><span id="sp_'+ str(p_id) +'">　</span> ' + self.file_002_point_name_list[str(p_id)] + '</div>'
+
+        self.replaceData(
+                url, 
+                os.path.dirname(__file__) + '/temp/result_002.geojson', 
+                [
+                    point_ids, 
+                    graph_data, 
+                    graph_data_2, 
+                    paint_str,
+                    legend_div,
+                    [circle_max, circle_min] # 円の大きさrangeを決めるため
+                ],
+                True,
+                False
+                )
+        url = url + ".html" # 置換ファイル
+        self.results.store(result_key, RESULT_FILES_002)
+        QgsProject.instance().removeMapLayer(new_layer.id())
 
-            self.btn_002_5_n.setVisible(True)
-            self.lbl_002_5_n.setVisible(True)
-            progress.close()
-            QgsProject.instance().removeMapLayer(new_layer.id())
+        self.iface.mapCanvas().refresh()
+        return ANALYSIS_DONE
 
-            self.iface.mapCanvas().refresh()
-        
-        except :
-            progress.close()
-            QMessageBox.warning(None, "分析処理", "分析処理時に問題が発生しました")
+    def batch_002_clicked(self):
+        combos = [self.cmb_option1_2, self.cmb_option2_2, self.cmb_option3_2, self.cmb_option4_2, self.cmb_option5_2,
+                  self.cmb_option6_2, self.cmb_option7_2, self.cmb_option8_2, self.cmb_option9_2, self.cmb_option10_2]
+        self.start_batch('002', combos, self.txt_sql_002.text().strip())
 
     def export_html_002_clicked(self):
         # ダイアログ表示
@@ -1815,11 +2083,15 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
             QMessageBox.warning(None, "HTML保存", "HTML保存時に問題が発生しました")        
 
     def export_csv_002_clicked(self):
-        layer1 = QgsProject.instance().mapLayersByName('csv')[0]
         output_path = QFileDialog.getSaveFileName(self, "保存先指定",
                                        os.path.expanduser('~') + '/Desktop','CSV(*.csv)')
         try:
             if output_path[0] :                                   
+                if self.mask_query is not None :
+                    # 前回の分析結果を表示した場合は、出力時に抽出する
+                    self.mask = staging.mask(self.dataset, *self.mask_query)
+                    self.mask_query = None
+                layer1 = self.dataset.to_layer('csv', self.mask)
                 QgsVectorFileWriter.writeAsVectorFormat(
                     layer1,
                     output_path[0],
@@ -1955,7 +2227,7 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
     def csv_read_003_clicked(self):
         try:
             (fileName, selectedFilter) = QFileDialog.getOpenFileName(self, '移動滞在ログデータ選択', 
-                                self.default_file_path, "移動滞在ログデータcsv (*.csv)")
+                                self.default_file_path, "移動滞在ログデータ (" + loader.FILE_PATTERNS + ")")
 
             if fileName != None and fileName != "":
                 self.default_file_path = os.path.dirname(fileName)
@@ -1967,15 +2239,15 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
                 progress.show()
 
                 QApplication.processEvents()
-                file_encoding = encodingCheck(fileName)
-                if "error" in file_encoding :
-                    progress.close()
-                    QMessageBox.warning(None, "CSVフォーマットチェック", "文字コードが対応していません(" + file_encoding +")")
-                    return   
+                file_encoding = None
+                if loader.is_csv(fileName) :
+                    file_encoding = encodingCheck(fileName)
+                    if "error" in file_encoding :
+                        progress.close()
+                        QMessageBox.warning(None, "CSVフォーマットチェック", "文字コードが対応していません(" + file_encoding +")")
+                        return   
                 #ヘッダー確認
-                with open(fileName, encoding=file_encoding, newline='') as f:
-                    csvreader = csv.reader(f)
-                    header = next(csvreader)
+                header = loader.read_header(fileName, file_encoding)
                 
                 if len(header) != len(set(header)) :
                     progress.close()
@@ -2038,155 +2310,115 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
                         QMessageBox.warning(None, "CSVフォーマットチェック", "CSVの形式が異なります(option5)")
                         return
 
-                if sum([1 for _ in open(fileName, encoding=file_encoding, newline='')]) == 1:
-                    progress.close()
-                    QMessageBox.warning(None, "CSVチェック", "CSVデータが取得できませんでした")
-                    return
-
-                # ファイル読み込み
-                with open(fileName, encoding=file_encoding, newline='') as f:
-                    reader = csv.reader(f)
-                    i=0
-                    for row in reader:
-                        # ヘッダーがある前提でスキップ
-                        if i == 0:
-                            i=i+1
-                            continue
-                        if row[2] == "":
-                            progress.close()
-                            QMessageBox.warning(None, "CSVチェック", "originが指定されていません")
-                            return 
-                        if row[3] == "":
-                            progress.close()
-                            QMessageBox.warning(None, "CSVチェック", "destinationが指定されていません")
-                            return 
-
-                        if not(row[2] in self.area_id_list) :
-                            progress.close()
-                            QMessageBox.warning(None, "CSVチェック", "originがエリアと一致しません")
-                            return 
-
-                        if not(row[3] in self.area_id_list) :
-                            progress.close()
-                            QMessageBox.warning(None, "CSVチェック", "destinationがエリアと一致しません")
-                            return 
-
-                file_path = fileName
-                file_name = file_path[file_path.rfind("/") + 1:]
-                self.lbl_002_filename_2.setText(file_name)
-
-
-                if len(QgsProject.instance().mapLayersByName('csv')) >= 1 :
-                    QgsProject.instance().removeMapLayer(QgsProject.instance().mapLayersByName('csv')[0].id())
-
-                csvLyr = QgsVectorLayer('None', 'csv', 'memory')
-                csvLyrprov = csvLyr.dataProvider()   
-                csvLyr.setProviderEncoding('UTF-8')
-                csvLyr.dataProvider().setEncoding('UTF-8')   
-                QgsProject.instance().addMapLayers([csvLyr])
+                # ファイル読み込み(値の確認は読み込みタスク内で全行まとめて行う)
+                progress.close()
+                rules = validation.od_rules(self.area_id_list)
+                self.start_load_with_preview("移動滞在ログデータ", fileName,
+                    lambda: validation.check_result(loader.read_preview(fileName, dataset.OD, file_encoding), rules),
+                    lambda callback: validation.check_result(
+                        loader.read_file(fileName, dataset.OD, file_encoding, callback),
+                        rules, errors_path('errors_003.csv'), callback),
+                    lambda task: self.csv_read_003_loaded(task, fileName))
 
-                csvLyrprov.addAttributes([QgsField("time_o", QVariant.String)])
-                csvLyrprov.addAttributes([QgsField("time_d", QVariant.String)])
-                csvLyrprov.addAttributes([QgsField("origin", QVariant.String)])
-                csvLyrprov.addAttributes([QgsField("destination", QVariant.String)])
-                csvLyrprov.addAttributes([QgsField("id", QVariant.String)])
-                csvLyrprov.addAttributes([QgsField("value", QVariant.Double)])                
-                for i in range(0,self.header_count-6):
-                    csvLyrprov.addAttributes([QgsField("option" + str(i+1), QVariant.String)])
-                csvLyr.updateFields()
+        except ValueError as e:
+            progress.close()
+            QMessageBox.warning(None, "CSVチェック", "フィールド(value)の値を数値として保存できませんでした")
 
-                featureList = []
-                with open(fileName, encoding=file_encoding, newline='') as f:
-                    csvreader = csv.reader(f)
-                    header = next(csvreader)
-                    for row in csvreader:
-                        float(row[5])
-                        feat = QgsFeature()
-                        feat.setAttributes(row)
-                        featureList.append(feat)
-                
-                csvLyr.dataProvider().addFeatures(featureList)        
-                csvLyr.commitChanges()
-
-
-                layer1 = csvLyr
-
-                option_list = []
-                for cnt in range(0,self.header_count-6) :
-                    option = processing.run("qgis:listuniquevalues", {'INPUT':layer1,'FIELDS':['option'+str(cnt+1)],'OUTPUT':'TEMPORARY_OUTPUT'})
-                    option_list_temp = []
-                    for item in option["OUTPUT"].getFeatures():
-                        option_list_temp.append(item.attributes()[0])
-                    option_list.append(option_list_temp)
-
-
-                self.cmb_option1_3.setVisible(False)
-                self.lbl_option1_3.setVisible(False)
-                self.cmb_option2_3.setVisible(False)
-                self.lbl_option2_3.setVisible(False)
-                self.cmb_option3_3.setVisible(False)
-                self.lbl_option3_3.setVisible(False)
-                self.cmb_option4_3.setVisible(False)
-                self.lbl_option4_3.setVisible(False)
-                self.cmb_option5_3.setVisible(False)
-                self.lbl_option5_3.setVisible(False)
-
-
-                self.len = len(option_list)
-
-                if self.len >= 1 : 
-                    self.cmb_option1_3.clear()
-                    self.cmb_option1_3.addItem('ALL')
-                    self.cmb_option1_3.addItems(option_list[0])
-                    self.cmb_option1_3.model().sort(0)
-                    self.cmb_option1_3.setVisible(True)
-                    self.lbl_option1_3.setVisible(True)
-                if self.len >= 2 : 
-                    self.cmb_option2_3.clear()
-                    self.cmb_option2_3.addItem('ALL')
-                    self.cmb_option2_3.addItems(option_list[1])
-                    self.cmb_option2_3.model().sort(0)
-                    self.cmb_option2_3.setVisible(True)
-                    self.lbl_option2_3.setVisible(True)
-                if self.len >= 3 : 
-                    self.cmb_option3_3.clear()
-                    self.cmb_option3_3.addItem('ALL')
-                    self.cmb_option3_3.addItems(option_list[2])
-                    self.cmb_option3_3.model().sort(0)
-                    self.cmb_option3_3.setVisible(True)
-                    self.lbl_option3_3.setVisible(True)
-                if self.len >= 4 : 
-                    self.cmb_option4_3.clear()
-                    self.cmb_option4_3.addItem('ALL')
-                    self.cmb_option4_3.addItems(option_list[3])
-                    self.cmb_option4_3.model().sort(0)
-                    self.cmb_option4_3.setVisible(True)
-                    self.lbl_option4_3.setVisible(True)
-                if self.len >= 5 : 
-                    self.cmb_option5_3.clear()
-                    self.cmb_option5_3.addItem('ALL')
-                    self.cmb_option5_3.addItems(option_list[4])
-                    self.cmb_option5_3.model().sort(0)
-                    self.cmb_option5_3.setVisible(True)
-                    self.lbl_option5_3.setVisible(True)
+        except :
+            progress.close()
+            QMessageBox.warning(None, "移動滞在ログデータ読み込み", "ファイル読み込み時に問題が発生しました")
 
+    def csv_read_003_loaded(self, task, fileName):
+        if not self.check_load_task(task, "移動滞在ログデータ読み込み", "フィールド(value)の値を数値として保存できませんでした"):
+            return
+        try:
+            data, stats, report = task.result
+            QgsMessageLog.logMessage("移動滞在ログデータ読み込み: " + str(stats), "PeopleFlowVisualization", Qgis.Info)
 
+            if len(data) == 0:
+                QMessageBox.warning(None, "CSVチェック", "CSVデータが取得できませんでした")
+                return
 
-                progress.close()
+            data = self.check_rows(data, report, 'errors_003.csv', stats.preview)
+            if data is None :
+                return
 
-                self.lbl_002_read_msg_2.setText("移動滞在ログデータの読み込みに成功しました。")
-                
-                self.file_003_name = file_name
+            file_path = fileName
+            file_name = file_path[file_path.rfind("/") + 1:]
+            self.lbl_002_filename_2.setText(file_name)
+
+            self.dataset = data
+            self.mask = None
+
+            option_list = []
+            for cnt in range(0,self.header_count-6) :
+                option_list.append(self.dataset.unique('option'+str(cnt+1)))
+
+
+            self.cmb_option1_3.setVisible(False)
+            self.lbl_option1_3.setVisible(False)
+            self.cmb_option2_3.setVisible(False)
+            self.lbl_option2_3.setVisible(False)
+            self.cmb_option3_3.setVisible(False)
+            self.lbl_option3_3.setVisible(False)
+            self.cmb_option4_3.setVisible(False)
+            self.lbl_option4_3.setVisible(False)
+            self.cmb_option5_3.setVisible(False)
+            self.lbl_option5_3.setVisible(False)
+
+
+            self.len = len(option_list)
+
+            if self.len >= 1 : 
+                self.cmb_option1_3.clear()
+                self.cmb_option1_3.addItem('ALL')
+                self.cmb_option1_3.addItems(option_list[0])
+                self.cmb_option1_3.model().sort(0)
+                self.cmb_option1_3.setVisible(True)
+                self.lbl_option1_3.setVisible(True)
+            if self.len >= 2 : 
+                self.cmb_option2_3.clear()
+                self.cmb_option2_3.addItem('ALL')
+                self.cmb_option2_3.addItems(option_list[1])
+                self.cmb_option2_3.model().sort(0)
+                self.cmb_option2_3.setVisible(True)
+                self.lbl_option2_3.setVisible(True)
+            if self.len >= 3 : 
+                self.cmb_option3_3.clear()
+                self.cmb_option3_3.addItem('ALL')
+                self.cmb_option3_3.addItems(option_list[2])
+                self.cmb_option3_3.model().sort(0)
+                self.cmb_option3_3.setVisible(True)
+                self.lbl_option3_3.setVisible(True)
+            if self.len >= 4 : 
+                self.cmb_option4_3.clear()
+                self.cmb_option4_3.addItem('ALL')
+                self.cmb_option4_3.addItems(option_list[3])
+                self.cmb_option4_3.model().sort(0)
+                self.cmb_option4_3.setVisible(True)
+                self.lbl_option4_3.setVisible(True)
+            if self.len >= 5 : 
+                self.cmb_option5_3.clear()
+                self.cmb_option5_3.addItem('ALL')
+                self.cmb_option5_3.addItems(option_list[4])
+                self.cmb_option5_3.model().sort(0)
+                self.cmb_option5_3.setVisible(True)
+                self.lbl_option5_3.setVisible(True)
+
+
+
+
+            self.lbl_002_read_msg_2.setText(self.load_message("移動滞在ログデータ", stats))
+            
+            self.file_003_name = file_name
 
-                self.btn_003_3_n.setVisible(True)
-                self.lbl_003_3_n.setVisible(True)
+            self.btn_003_3_n.setVisible(True)
+            self.lbl_003_3_n.setVisible(True)
 
         except ValueError as e:
-            progress.close()
             QMessageBox.warning(None, "CSVチェック", "フィールド(value)の値を数値として保存できませんでした")
 
         except :
-            progress.close()
             QMessageBox.warning(None, "移動滞在ログデータ読み込み", "ファイル読み込み時に問題が発生しました")
 
     def btn_option_load_3_clicked(self):
@@ -2274,7 +2506,6 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
 
             QApplication.processEvents()
 
-            layer1 = QgsProject.instance().mapLayersByName('csv')[0]
             filter_list = []
             if self.len >= 1 : filter_list.append(str(self.cmb_option1_3.currentText()))
             if self.len >= 2 : filter_list.append(str(self.cmb_option2_3.currentText()))
@@ -2282,120 +2513,145 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
             if self.len >= 4 : filter_list.append(str(self.cmb_option4_3.currentText()))
             if self.len >= 5 : filter_list.append(str(self.cmb_option5_3.currentText()))
 
-            sfilter = ""
-            self.filter = {}
+            where = self.txt_sql_003.text().strip()
+            status = self.analyze_003(filter_list, where)
+            progress.close()
+            if status == ANALYSIS_EMPTY :
+                QMessageBox.warning(None, "分析処理", "該当レコードがありません")
+                return
+            if status == ANALYSIS_FAILED :
+                QMessageBox.warning(None, "分析処理", "クロス集計に失敗しました")
+                return
+            if status == ANALYSIS_RESTORED :
+                QMessageBox.information(None, "分析処理", "分析処理が完了しました。(前回の分析結果を表示しています)")
+            else :
+                QMessageBox.information(None, "分析処理", "分析処理が完了しました。")
+            self.move_003_5()
+            self.btn_003_4_n.setVisible(True)
+            self.lbl_003_4_n.setVisible(True)
 
-            alist = []
-            for cnt in range(self.header_count-6) :
-                if cnt == 0:
-                    if filter_list[0] == 'ALL' :
-                        alist.append("option1")
-                    else :
-                        sfilter += "\"option1\" = '%s'" % (filter_list[0])
-                    self.filter["option1"] = [self.colName.get('option1', 'option1'),filter_list[0]]
-                else:
-                    if filter_list[cnt] == 'ALL' :
-                        alist.append("option" + str(cnt+1))
-                    else :
-                        if sfilter == "" :
-                            sfilter +=  "\"option%s\" = '%s'" % (cnt+1,filter_list[cnt])
-                        else :    
-                            sfilter +=  " AND \"option%s\" = '%s'" % (cnt+1,filter_list[cnt])
-                    self.filter["option" + str(cnt+1)] = [self.colName.get("option" + str(cnt+1), "option" + str(cnt+1)),filter_list[cnt]]
-            layer1.setSubsetString(sfilter)
+        except KeyError as e:
+            progress.close()
+            QMessageBox.warning(None, "分析処理", "クロス集計に失敗しました")
+            
+        except staging.QueryError as e:
+            progress.close()
+            QMessageBox.warning(None, "SQL条件", str(e))
+        except :
+            progress.close()
+            QMessageBox.warning(None, "分析処理", "分析処理時に問題が発生しました")
 
-            QApplication.processEvents()
+    def analyze_003(self, filter_list, where):
+        """プルダウンの入力(filter_list)とSQL条件(where)で分析処理(003)を行い、地図・集計表・HTMLを出力する
 
-            if layer1.featureCount() <= 0:
-                progress.close()
-                QMessageBox.warning(None, "分析処理", "該当レコードがありません")
-                return  
+        一括出力も同じ処理で組み合わせごとのHTMLを作成する。戻り値は ANALYSIS_* のいずれか
+        """
+        self.filter = {}
 
+        alist = []
+        sfilter = {}
+        for cnt in range(self.header_count-6) :
+            condition = dataset.parse_filter(filter_list[cnt])
+            if condition is None :
+                alist.append("option" + str(cnt+1))
+            else :
+                sfilter["option" + str(cnt+1)] = condition
+                # 複数の値・範囲を指定した項目は、ALLと同様に1つの値に絞り込まない項目として扱う
+                if isinstance(condition, dataset.Condition) :
+                    alist.append("option" + str(cnt+1))
+            self.filter["option" + str(cnt+1)] = [self.colName.get("option" + str(cnt+1), "option" + str(cnt+1)),filter_list[cnt]]
 
-            QApplication.processEvents()
+        # 同じデータ・抽出条件の分析結果があれば、抽出せずに出力ファイルを書き戻して表示する
+        result_key = self.result_key('003', filter_list, where, results.file_key(self.file_003_sensor_path))
+        if self.results.restore(result_key) :
+            self.restore_layer(os.path.dirname(__file__) + '/temp/result_003.geojson', 'result')
+            self.mask = None
+            return ANALYSIS_RESTORED
 
-            if len(QgsProject.instance().mapLayersByName('result')) >= 1 :
-                QgsProject.instance().removeMapLayer(QgsProject.instance().mapLayersByName('result')[0].id())
-
-
-            new_layer = QgsVectorLayer("point", "result", "memory")
-            QgsProject.instance().addMapLayer(new_layer)
-            prov = new_layer.dataProvider()
-            caps = prov.capabilities()
-            if caps & QgsVectorDataProvider.AddAttributes:
-                prov.addAttributes(
-                    [
-                        QgsField('area', QVariant.String),
-                        QgsField('option1', QVariant.String),
-                        QgsField('option2', QVariant.String),
-                        QgsField('option3', QVariant.String),
-                        QgsField('option4', QVariant.String),
-                        QgsField('option5', QVariant.String)
-                    ])
-                new_layer.updateFields()
-
-            new_layer.startEditing()
-            # for feat in _layer.getFeatures():
-            select_value = []
-            file_encoding = encodingCheck(self.file_003_sensor_path)
-            with open(self.file_003_sensor_path, encoding=file_encoding, newline='') as f:
-                reader = csv.reader(f)
-                i=0
-                for f_row in reader:
-                    # ヘッダーがある前提でスキップ
-                    if i == 0:
-                        i=i+1
-                        continue
-                    if i == 1:
-                        select_value = f_row
-                    # lon, latで登録
-                    _geom = QgsGeometry.fromPointXY(QgsPointXY(float(f_row[2]), float(f_row[1])))
-                    feature2 = QgsFeature(new_layer.fields())
-                    feature2.setGeometry(_geom)
-                    feature2[0] = f_row[0]
-                    if len(f_row) > 3 :
-                        feature2[1] = f_row[3]
-                    if len(f_row) > 4 :
-                        feature2[2] = f_row[4]
-                    if len(f_row) > 5 :
-                        feature2[3] = f_row[5]
-                    if len(f_row) > 6 :
-                        feature2[4] = f_row[6]
-                    if len(f_row) > 7 :
-                        feature2[5] = f_row[7]
+        # SQL条件(WHERE句)が入力されていれば、プルダウンの条件と合わせて抽出する
+        self.mask = staging.mask(self.dataset, sfilter, where)
 
-                    new_layer.addFeature(feature2)
+        QApplication.processEvents()
+
+        if not self.mask.any():
+            return ANALYSIS_EMPTY
+
+
+        QApplication.processEvents()
 
+        if len(QgsProject.instance().mapLayersByName('result')) >= 1 :
+            QgsProject.instance().removeMapLayer(QgsProject.instance().mapLayersByName('result')[0].id())
+
+
+        new_layer = QgsVectorLayer("point", "result", "memory")
+        QgsProject.instance().addMapLayer(new_layer)
+        prov = new_layer.dataProvider()
+        caps = prov.capabilities()
+        if caps & QgsVectorDataProvider.AddAttributes:
+            prov.addAttributes(
+                [
+                    QgsField('area', QVariant.String),
+                    QgsField('option1', QVariant.String),
+                    QgsField('option2', QVariant.String),
+                    QgsField('option3', QVariant.String),
+                    QgsField('option4', QVariant.String),
+                    QgsField('option5', QVariant.String)
+                ])
+            new_layer.updateFields()
+
+        new_layer.startEditing()
+        # for feat in _layer.getFeatures():
+        select_value = []
+        file_encoding = encodingCheck(self.file_003_sensor_path)
+        with open(self.file_003_sensor_path, encoding=file_encoding, newline='') as f:
+            reader = csv.reader(f)
+            i=0
+            for f_row in reader:
+                # ヘッダーがある前提でスキップ
+                if i == 0:
                     i=i+1
+                    continue
+                if i == 1:
+                    select_value = f_row
+                # lon, latで登録
+                _geom = QgsGeometry.fromPointXY(QgsPointXY(float(f_row[2]), float(f_row[1])))
+                feature2 = QgsFeature(new_layer.fields())
+                feature2.setGeometry(_geom)
+                feature2[0] = f_row[0]
+                if len(f_row) > 3 :
+                    feature2[1] = f_row[3]
+                if len(f_row) > 4 :
+                    feature2[2] = f_row[4]
+                if len(f_row) > 5 :
+                    feature2[3] = f_row[5]
+                if len(f_row) > 6 :
+                    feature2[4] = f_row[6]
+                if len(f_row) > 7 :
+                    feature2[5] = f_row[7]
+
+                new_layer.addFeature(feature2)
+
+                i=i+1
 
-                new_layer.commitChanges()
+            new_layer.commitChanges()
 
-                QgsVectorFileWriter.writeAsVectorFormat(
-                    new_layer,
-                    os.path.dirname(__file__) + '/temp/result_003.geojson',
-                    'UTF-8',
-                    QgsCoordinateReferenceSystem("EPSG:4326"),
-                    'GeoJSON'
-                )
+            QgsVectorFileWriter.writeAsVectorFormat(
+                new_layer,
+                os.path.dirname(__file__) + '/temp/result_003.geojson',
+                'UTF-8',
+                QgsCoordinateReferenceSystem("EPSG:4326"),
+                'GeoJSON'
+            )
 
-            if self.replaceData_003(select_value) :
-                #self.do_crosstab_time()
-                progress.close()
-                QMessageBox.information(None, "分析処理", "分析処理が完了しました。")
-                self.move_003_5()
-                self.btn_003_4_n.setVisible(True)
-                self.lbl_003_4_n.setVisible(True)
-            else :
-                progress.close()
-                QMessageBox.warning(None, "分析処理", "クロス集計に失敗しました")
+        if not self.replaceData_003(select_value) :
+            return ANALYSIS_FAILED
+        #self.do_crosstab_time()
+        self.results.store(result_key, RESULT_FILES_003)
+        return ANALYSIS_DONE
 
-        except KeyError as e:
-            progress.close()
-            QMessageBox.warning(None, "分析処理", "クロス集計に失敗しました")
-            
-        except :
-            progress.close()
-            QMessageBox.warning(None, "分析処理", "分析処理時に問題が発生しました")
+    def batch_003_clicked(self):
+        combos = [self.cmb_option1_3, self.cmb_option2_3, self.cmb_option3_3, self.cmb_option4_3, self.cmb_option5_3]
+        self.start_batch('003', combos, self.txt_sql_003.text().strip())
 
     def export_html_003_clicked(self):
         # ダイアログ表示
@@ -2412,7 +2668,6 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
             QMessageBox.warning(None, "html保存", "html保存時に問題が発生しました")        
 
     def export_csv_003_clicked(self):
-        layer1 = QgsProject.instance().mapLayersByName('csv')[0]
         output_path = QFileDialog.getSaveFileName(self, "保存先指定",
                                        os.path.expanduser('~') + '/Desktop','CSV(*.csv)')
         try:
@@ -2443,7 +2698,7 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
     def sensor_read_003_2_clicked(self):
         try:
             (fileName, selectedFilter) = QFileDialog.getOpenFileName(self, 'ログデータ選択', 
-                                self.default_file_path, "ログデータcsv (*.csv)")
+                                self.default_file_path, "ログデータ (" + loader.FILE_PATTERNS + ")")
 
             zahyo_flag = 0
             if fileName != None and fileName != "":
@@ -2459,15 +2714,15 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
 
                 self.default_file_path = os.path.dirname(fileName)
                 #ヘッダー確認
-                file_encoding = encodingCheck(fileName)
-                if "error" in file_encoding :
-                    progress.close()
-                    QMessageBox.warning(None, "CSVフォーマットチェック", "文字コードが対応していません(" + file_encoding +")")
-                    return   
+                file_encoding = None
+                if loader.is_csv(fileName) :
+                    file_encoding = encodingCheck(fileName)
+                    if "error" in file_encoding :
+                        progress.close()
+                        QMessageBox.warning(None, "CSVフォーマットチェック", "文字コードが対応していません(" + file_encoding +")")
+                        return   
 
-                with open(fileName, encoding=file_encoding, newline='') as f:
-                    csvreader = csv.reader(f)
-                    header = next(csvreader)
+                header = loader.read_header(fileName, file_encoding)
 
                 if len(header) != len(set(header)) :
                     progress.close()
@@ -2523,147 +2778,18 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
                         QMessageBox.warning(None, "CSVフォーマットチェック", "CSVの形式が異なります(option5)")
                         return
 
-                if sum([1 for _ in open(fileName, encoding=file_encoding, newline='')]) == 1:
-                    progress.close()
-                    QMessageBox.warning(None, "CSVチェック", "CSVデータが取得できませんでした")
-                    return
-                
                 self.header_count = len(header)
 
-                with open(fileName, encoding=file_encoding, newline='') as f:
-                    reader = csv.reader(f)
-                    i = 0
-                    for row in reader:
-                        if i == 0:
-                            i=i+1
-                            continue
-                        if row[0] == "" :
-                            progress.close()
-                            QMessageBox.warning(None, "CSVチェック", "idが指定されていません")
-                            return
-                        if row[1] == "" :
-                            progress.close()
-                            QMessageBox.warning(None, "CSVチェック", "timestampが指定されていません")
-                            return
-                        if row[2] == "" :
-                            progress.close()
-                            QMessageBox.warning(None, "CSVチェック", "latが指定されていません")
-                            return
-                        if row[3] == "" :
-                            progress.close()
-                            QMessageBox.warning(None, "CSVチェック", "lonが指定されていません")
-                            return
-
-                        # 座標値チェック
-                        zahyo_flag = 0
-                        float(row[2])
-                        float(row[3])
-                        if (float(row[2]) <= -90) or (float(row[2]) >= 90) :
-                            float(row[2] + 'a')
-                        if (float(row[3]) <= -180) or (float(row[3]) >= 180) :
-                            float(row[3] + 'a')     
-                        zahyo_flag = 1
-                        i=i+1
-
-                # ログCSV読み込み
-                if len(QgsProject.instance().mapLayersByName('csv')) >= 1 :
-                    QgsProject.instance().removeMapLayer(QgsProject.instance().mapLayersByName('csv')[0].id())
-
-                csvLyr = QgsVectorLayer('None', 'csv', 'memory')
-                csvLyrprov = csvLyr.dataProvider()   
-                csvLyr.setProviderEncoding('UTF-8')
-                csvLyr.dataProvider().setEncoding('UTF-8')   
-                QgsProject.instance().addMapLayers([csvLyr])
-
-                csvLyrprov.addAttributes([QgsField("id", QVariant.String)])
-                csvLyrprov.addAttributes([QgsField("timestamp", QVariant.DateTime)])
-                csvLyrprov.addAttributes([QgsField("lat", QVariant.Double)])
-                csvLyrprov.addAttributes([QgsField("lon", QVariant.Double)])
-                for i in range(0,self.header_count-4):
-                    csvLyrprov.addAttributes([QgsField("option" + str(i+1), QVariant.String)])
-                    
-                csvLyr.updateFields()
-                featureList = []
-                with open(fileName, encoding=file_encoding, newline='') as f:
-                    csvreader = csv.reader(f)
-                    header = next(csvreader)
-                    for row in csvreader:
-                        feat = QgsFeature()
-                        feat.setAttributes(row)
-                        featureList.append(feat)
-                    
-                csvLyr.dataProvider().addFeatures(featureList)        
-                csvLyr.commitChanges()
-                
-                layer1 = csvLyr
-
-
-                option_list = []
-                for cnt in range(0,self.header_count-4) :
-                    option = processing.run("qgis:listuniquevalues", {'INPUT':layer1,'FIELDS':['option'+str(cnt+1)],'OUTPUT':'TEMPORARY_OUTPUT'})
-                    option_list_temp = []
-                    for item in option["OUTPUT"].getFeatures():
-                        option_list_temp.append(item.attributes()[0])
-                    option_list.append(option_list_temp)
-
-
-                self.cmb_option1_4.setVisible(False)
-                self.lbl_option1_4.setVisible(False)
-                self.cmb_option2_4.setVisible(False)
-                self.lbl_option2_4.setVisible(False)
-                self.cmb_option3_4.setVisible(False)
-                self.lbl_option3_4.setVisible(False)
-                self.cmb_option4_4.setVisible(False)
-                self.lbl_option4_4.setVisible(False)
-                self.cmb_option5_4.setVisible(False)
-                self.lbl_option5_4.setVisible(False)
-
-                self.len = len(option_list)
-
-                if self.len >= 1 : 
-                    self.cmb_option1_4.clear()
-                    self.cmb_option1_4.addItem('ALL')
-                    self.cmb_option1_4.addItems(option_list[0])
-                    self.cmb_option1_4.model().sort(0)
-                    self.cmb_option1_4.setVisible(True)
-                    self.lbl_option1_4.setVisible(True)
-                if self.len >= 2 : 
-                    self.cmb_option2_4.clear()
-                    self.cmb_option2_4.addItem('ALL')
-                    self.cmb_option2_4.addItems(option_list[1])
-                    self.cmb_option2_4.model().sort(0)
-                    self.cmb_option2_4.setVisible(True)
-                    self.lbl_option2_4.setVisible(True)
-                if self.len >= 3 : 
-                    self.cmb_option3_4.clear()
-                    self.cmb_option3_4.addItem('ALL')
-                    self.cmb_option3_4.addItems(option_list[2])
-                    self.cmb_option3_4.model().sort(0)
-                    self.cmb_option3_4.setVisible(True)
-                    self.lbl_option3_4.setVisible(True)
-                if self.len >= 4 : 
-                    self.cmb_option4_4.clear()
-                    self.cmb_option4_4.addItem('ALL')
-                    self.cmb_option4_4.addItems(option_list[3])
-                    self.cmb_option4_4.model().sort(0)
-                    self.cmb_option4_4.setVisible(True)
-                    self.lbl_option4_4.setVisible(True)
-                if self.len >= 5 : 
-                    self.cmb_option5_4.clear()
-                    self.cmb_option5_4.addItem('ALL')
-                    self.cmb_option5_4.addItems(option_list[4])
-                    self.cmb_option5_4.model().sort(0)
-                    self.cmb_option5_4.setVisible(True)
-                    self.lbl_option5_4.setVisible(True)
-                
-                file_path = fileName
-                file_name = file_path[file_path.rfind("/") + 1:]
-                self.lbl_003_filename_3.setText(file_name)
-
+                # ログデータ読み込み(id・timestamp・座標値の確認は読み込みタスク内で全行まとめて行う)
                 progress.close()
-                self.lbl_002_sensor_msg_3.setText("ログデータの読み込みに成功しました。")
-                self.btn_003_7_n.setVisible(True)
-                self.lbl_003_7_n.setVisible(True)
+                rules = validation.log_rules()
+                self.start_load_with_preview("ログデータ", fileName,
+                    lambda: validation.check_result(loader.read_preview(fileName, dataset.LOG, file_encoding), rules),
+                    lambda callback: validation.check_result(
+                        loader.read_file(fileName, dataset.LOG, file_encoding, callback),
+                        rules, errors_path('errors_003_2.csv'), callback),
+                    lambda task: self.sensor_read_003_2_loaded(task, fileName))
+
         except ValueError as e:
             progress.close()
             if zahyo_flag == 0:
@@ -2674,6 +2800,96 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
             progress.close()
             QMessageBox.warning(None, "ログデータ読み込み", "ファイル読み込み時に問題が発生しました")      
 
+    def sensor_read_003_2_loaded(self, task, fileName):
+        if not self.check_load_task(task, "ログデータ読み込み", "ログデータの座標が登録できません"):
+            return
+        zahyo_flag = 0
+        try:
+            data, stats, report = task.result
+            QgsMessageLog.logMessage("ログデータ読み込み: " + str(stats), "PeopleFlowVisualization", Qgis.Info)
+
+            if len(data) == 0:
+                QMessageBox.warning(None, "CSVチェック", "CSVデータが取得できませんでした")
+                return
+
+            # id・timestamp・座標値チェック(全行を確認し、エラーがあれば有効な行のみで続行するかを選ぶ)
+            data = self.check_rows(data, report, 'errors_003_2.csv', stats.preview)
+            if data is None :
+                return
+            zahyo_flag = 1
+
+            self.dataset = data
+            self.mask = None
+
+            option_list = []
+            for cnt in range(0,self.header_count-4) :
+                option_list.append(self.dataset.unique('option'+str(cnt+1)))
+
+
+            self.cmb_option1_4.setVisible(False)
+            self.lbl_option1_4.setVisible(False)
+            self.cmb_option2_4.setVisible(False)
+            self.lbl_option2_4.setVisible(False)
+            self.cmb_option3_4.setVisible(False)
+            self.lbl_option3_4.setVisible(False)
+            self.cmb_option4_4.setVisible(False)
+            self.lbl_option4_4.setVisible(False)
+            self.cmb_option5_4.setVisible(False)
+            self.lbl_option5_4.setVisible(False)
+
+            self.len = len(option_list)
+
+            if self.len >= 1 : 
+                self.cmb_option1_4.clear()
+                self.cmb_option1_4.addItem('ALL')
+                self.cmb_option1_4.addItems(option_list[0])
+                self.cmb_option1_4.model().sort(0)
+                self.cmb_option1_4.setVisible(True)
+                self.lbl_option1_4.setVisible(True)
+            if self.len >= 2 : 
+                self.cmb_option2_4.clear()
+                self.cmb_option2_4.addItem('ALL')
+                self.cmb_option2_4.addItems(option_list[1])
+                self.cmb_option2_4.model().sort(0)
+                self.cmb_option2_4.setVisible(True)
+                self.lbl_option2_4.setVisible(True)
+            if self.len >= 3 : 
+                self.cmb_option3_4.clear()
+                self.cmb_option3_4.addItem('ALL')
+                self.cmb_option3_4.addItems(option_list[2])
+                self.cmb_option3_4.model().sort(0)
+                self.cmb_option3_4.setVisible(True)
+                self.lbl_option3_4.setVisible(True)
+            if self.len >= 4 : 
+                self.cmb_option4_4.clear()
+                self.cmb_option4_4.addItem('ALL')
+                self.cmb_option4_4.addItems(option_list[3])
+                self.cmb_option4_4.model().sort(0)
+                self.cmb_option4_4.setVisible(True)
+                self.lbl_option4_4.setVisible(True)
+            if self.len >= 5 : 
+                self.cmb_option5_4.clear()
+                self.cmb_option5_4.addItem('ALL')
+                self.cmb_option5_4.addItems(option_list[4])
+                self.cmb_option5_4.model().sort(0)
+                self.cmb_option5_4.setVisible(True)
+                self.lbl_option5_4.setVisible(True)
+            
+            file_path = fileName
+            file_name = file_path[file_path.rfind("/") + 1:]
+            self.lbl_003_filename_3.setText(file_name)
+
+            self.lbl_002_sensor_msg_3.setText(self.load_message("ログデータ", stats))
+            self.btn_003_7_n.setVisible(True)
+            self.lbl_003_7_n.setVisible(True)
+        except ValueError as e:
+            if zahyo_flag == 0:
+                QMessageBox.warning(None, "CSVチェック", "ログデータの座標が登録できません")
+            if zahyo_flag == 1:
+                QMessageBox.warning(None, "CSVチェック", "ログデータのタイムスタンプが登録できません")
+        except:
+            QMessageBox.warning(None, "ログデータ読み込み", "ファイル読み込み時に問題が発生しました")      
+
     def btn_option_load_4_clicked(self):
         try:
             self.lbl_001_12.setText('')
@@ -2759,7 +2975,6 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
 
             QApplication.processEvents()
 
-            layer1 = QgsProject.instance().mapLayersByName('csv')[0]
             filter_list = []
             if self.len >= 1 : filter_list.append(str(self.cmb_option1_4.currentText()))
             if self.len >= 2 : filter_list.append(str(self.cmb_option2_4.currentText()))
@@ -2767,32 +2982,28 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
             if self.len >= 4 : filter_list.append(str(self.cmb_option4_4.currentText()))
             if self.len >= 5 : filter_list.append(str(self.cmb_option5_4.currentText()))
 
-            sfilter = ""
             self.filter = {}
 
             alist = []
+            sfilter = {}
             for cnt in range(self.header_count-4) :
-                if cnt == 0:
-                    if filter_list[0] == 'ALL' :
-                        alist.append("option1")
-                    else :
-                        sfilter += "\"option1\" = '%s'" % (filter_list[0])
-                    self.filter["option1"] = [self.colName.get('option1', 'option1'),filter_list[0]]
-                else:
-                    if filter_list[cnt] == 'ALL' :
+                condition = dataset.parse_filter(filter_list[cnt])
+                if condition is None :
+                    alist.append("option" + str(cnt+1))
+                else :
+                    sfilter["option" + str(cnt+1)] = condition
+                    # 複数の値・範囲を指定した項目は、ALLと同様に1つの値に絞り込まない項目として扱う
+                    if isinstance(condition, dataset.Condition) :
                         alist.append("option" + str(cnt+1))
-                    else :
-                        if sfilter == "" :
-                            sfilter +=  "\"option%s\" = '%s'" % (cnt+1,filter_list[cnt])
-                        else :    
-                            sfilter +=  " AND \"option%s\" = '%s'" % (cnt+1,filter_list[cnt])
-                    self.filter["option" + str(cnt+1)] = [self.colName.get("option" + str(cnt+1), "option" + str(cnt+1)),filter_list[cnt]]
+                self.filter["option" + str(cnt+1)] = [self.colName.get("option" + str(cnt+1), "option" + str(cnt+1)),filter_list[cnt]]
 
-            layer1.setSubsetString(sfilter)
+            # SQL条件(WHERE句)が入力されていれば、プルダウンの条件と合わせて抽出する
+            where = self.txt_sql_003_2.text().strip()
+            self.mask = staging.mask(self.dataset, sfilter, where)
 
             QApplication.processEvents()
 
-            if layer1.featureCount() <= 0:
+            if not self.mask.any():
                 progress.close()
                 QMessageBox.warning(None, "分析処理", "該当レコードがありません")
                 return  
@@ -2810,6 +3021,9 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
                 progress.close()
                 QMessageBox.warning(None, "分析処理", "時系列データの作成に失敗しました")
            
+        except staging.QueryError as e:
+            progress.close()
+            QMessageBox.warning(None, "SQL条件", str(e))
         except :
             progress.close()
             QMessageBox.warning(None, "分析処理", "分析処理時に問題が発生しました")
@@ -2829,11 +3043,11 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
             QMessageBox.warning(None, "html保存", "html保存時に問題が発生しました")
 
     def export_csv_003_2_clicked(self):
-        layer1 = QgsProject.instance().mapLayersByName('csv')[0]
         output_path = QFileDialog.getSaveFileName(self, "保存先指定",
                                        os.path.expanduser('~') + '/Desktop','CSV(*.csv)')
         try:
             if output_path[0] :                                   
+                layer1 = self.dataset.to_layer('csv', self.mask)
                 QgsVectorFileWriter.writeAsVectorFormat(
                     layer1,
                     output_path[0],
@@ -2845,11 +3059,11 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
             QMessageBox.warning(None, "CSV保存", "CSV保存時に問題が発生しました")
 
     def export_geojson_003_3_clicked(self):
-        layer1 = QgsProject.instance().mapLayersByName('csv')[0]
         output_path = QFileDialog.getSaveFileName(self, "保存先指定",
                                        os.path.expanduser('~') + '/Desktop','GeoJson(*.geojson)')
         try:
             if output_path[0] :
+                layer1 = self.dataset.to_layer('csv', self.mask)
                 result = processing.run("native:geometrybyexpression", 
                     {'INPUT':layer1,'OUTPUT_GEOMETRY':2,'WITH_Z':False,'WITH_M':False,'EXPRESSION':'make_point("lon" , "lat" ) ','OUTPUT':'TEMPORARY_OUTPUT'})
 
@@ -2863,34 +3077,28 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
         except:
             QMessageBox.warning(None, "geojson保存", "geojson保存時に問題が発生しました")  
 
-    def datajoin(self,alist) :
+    def datajoin(self,alist,aggregated=None) :
+        """メッシュのレイヤに value を結合して result.gpkg, result.csv に出力する
+
+        aggregated は集計キューブで meshcode ごとに合計済みの Dataset(alist がある場合のみ。無い場合は抽出した行から求める)。
+        集計・結合は meshcode の番号で行い、QGISの一時レイヤは出力するレイヤのみ作成する
+        """
+        start = time.perf_counter()
         layer1 = QgsProject.instance().mapLayersByName('sptial')[0]
-        layer2 = QgsProject.instance().mapLayersByName('csv')[0]
-        
-        if len(alist) != 0 :
-            aggregate_list = []
-            for cnt in range(0,self.header_count):
-                if cnt == 0 :
-                    m = {'aggregate': 'first_value','delimiter': ',','input': '"meshcode"','length': 0,'name': 'meshcode','precision': 0,'type': 10}
-                elif  cnt == self.header_count-1 : 
-                    m = {'aggregate': 'sum','delimiter': ',','input': '"value"','length': 0,'name': 'value','precision': 0,'type': 6}
-                else :
-                    m = {'aggregate': 'first_value','delimiter': ',','input': '"option'+str(cnt)+'"','length': 0,'name': 'option'+str(cnt),'precision': 0,'type': 10}
-            
-                aggregate_list.append(m)
-            
-            result_csv = processing.run("native:aggregate", {'INPUT':layer2,'GROUP_BY':'"meshcode"','AGGREGATES':aggregate_list,'OUTPUT':'TEMPORARY_OUTPUT'})
-            layer2 = result_csv["OUTPUT"]
-        
-        result = processing.run("native:joinattributestable", {'INPUT':layer1,'FIELD':'meshcode','INPUT_2':layer2,'FIELD_2':'meshcode','FIELDS_TO_COPY':["value"],'METHOD':1,'DISCARD_NONMATCHING':False,'PREFIX':'','OUTPUT':'TEMPORARY_OUTPUT'})
-        result["OUTPUT"].setProviderEncoding('UTF-8')
-        result["OUTPUT"].dataProvider().setEncoding('UTF-8')
+        joined, rows = cube.join_rows(self.dataset, self.mask, alist, aggregated)
+        result = cube.join_layer(layer1, joined)
+
         QgsVectorFileWriter.writeAsVectorFormatV2(
-            result["OUTPUT"],
+            result,
             os.path.dirname(__file__) + '/temp/result.gpkg',
             QgsProject.instance().transformContext(),
             QgsVectorFileWriter.SaveVectorOptions()
         )
+        if rows is not None :
+            layer2 = rows.to_layer('csv')
+        else :
+            # 1つの値に絞り込んだ場合は抽出した行をそのまま出力する
+            layer2 = self.dataset.to_layer('csv', self.mask)
         QgsVectorFileWriter.writeAsVectorFormat(
             layer2,
             os.path.dirname(__file__) + '/temp/result.csv',
@@ -2898,8 +3106,8 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
             QgsCoordinateReferenceSystem("EPSG:4326"),
             'CSV'
         )
-        #QgsProject.instance().removeMapLayer(layer1.id())
-        #QgsProject.instance().removeMapLayer(layer2.id())
+        QgsMessageLog.logMessage("メッシュ集計・結合: {:,}メッシュ {:.2f}秒".format(result.featureCount(), time.perf_counter() - start),
+                                 "PeopleFlowVisualization", Qgis.Info)
 
 
     def replaceData(self,path,geo_json_path, graph_datas=None, add_id_flg=False,legend_flg=False) :
@@ -3057,62 +3265,52 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
         meshlayerprov.addAttributes([QgsField("meshcode", QVariant.String)])
         meshlayer.updateFields() 
         
-        for grid_code in mesh_list:
-            if index >= 5 :
-                result = worldmesh.meshcode_to_latlong_grid('20' + grid_code,True)
-            else :    
-                result = worldmesh.meshcode_to_latlong_grid('20' + grid_code)
-            
-            pt1 = QgsPointXY(result["long0"],result["lat0"])
-            pt2 = QgsPointXY(result["long1"],result["lat1"])
+        # メッシュの範囲はまとめて配列で計算する
+        mesh_list = list(mesh_list)
+        result = worldmesh.meshcode_to_latlong_grid_array(np.array(['20' + grid_code for grid_code in mesh_list]), index >= 5)
+        long0 = result["long0"].tolist()
+        lat0 = result["lat0"].tolist()
+        long1 = result["long1"].tolist()
+        lat1 = result["lat1"].tolist()
+
+        feats = []
+        for i, grid_code in enumerate(mesh_list):
+            pt1 = QgsPointXY(long0[i],lat0[i])
+            pt2 = QgsPointXY(long1[i],lat1[i])
             
             feat = QgsFeature()
             feat.setGeometry(QgsGeometry.fromRect(QgsRectangle(pt1,pt2)))
             feat.setAttributes([grid_code])
-            meshlayerprov.addFeatures([feat])
-    
-            meshlayer.updateExtents()
+            feats.append(feat)
+        meshlayerprov.addFeatures(feats)
+        meshlayer.updateExtents()
 
         QgsProject.instance().addMapLayers([meshlayer])
 
 
     def datafilter(self) :
         ########################################
-        # 期間内データ取得
+        # 期間内データを集計する(読み込み時に作成した日時の列を使う)
+        period = (self.date_002_from, self.date_002_to)
 
         # 地図用データ（計測点で集約）
-        self.point_geo_features = {}
+        self.point_geo_features = self.dataset.aggregate(['place_id'], 'sum', self.mask, period).to_dict()
+
         # グラフデータ
+        # 日付・idで集約
         _temp_data_1 = {} # 日付(date)をキーとしたJSON
-        _temp_data_2 = {} # 日時(date-time)をキーとしたJSON
-        for row in self.file_002_data_list:
-            # 期間
-            if row[0] >= self.date_002_from and row[0] <= self.date_002_to:
-                # 地図用データ
-                if (row[1] in self.point_geo_features) == False:
-                    self.point_geo_features[row[1]] = float(row[2])
-                else:
-                    self.point_geo_features[row[1]] += float(row[2])
-
-                str_date_1 = row[0].strftime('%Y/%m/%d')
-                str_date_2 = row[0].strftime('%Y/%m/%d %H:%M')
-
-                # グラフデータ
-                # 日付・idで集約
-                if (str_date_1 in _temp_data_1) == False:
-                    _temp_data_1[str_date_1] = {}
-                    _temp_data_1[str_date_1]['date'] = str_date_1 # 日付も格納
-
-                _id = row[1]
-                if (_id in _temp_data_1[str_date_1]) == False:
-                    _temp_data_1[str_date_1][_id] = float(row[2])
-                else:
-                    _temp_data_1[str_date_1][_id] += float(row[2])
+        for (str_date_1, _id), value in self.dataset.aggregate([dataset.DATE, 'place_id'], 'sum', self.mask, period).items():
+            if (str_date_1 in _temp_data_1) == False:
+                _temp_data_1[str_date_1] = {}
+                _temp_data_1[str_date_1]['date'] = str_date_1 # 日付も格納
+            _temp_data_1[str_date_1][_id] = value
 
-                # 集約なし
-                if (str_date_2 in _temp_data_2) == False:
-                    _temp_data_2[str_date_2] = []
-                _temp_data_2[str_date_2].append({'id':row[1],'value':row[2]})
+        # 集約なし(同じ日時・idは後の行の値)
+        _temp_data_2 = {} # 日時(date-time)をキーとしたJSON
+        for (str_date_2, _id), value in self.dataset.aggregate([dataset.DATETIME, 'place_id'], 'last', self.mask, period).items():
+            if (str_date_2 in _temp_data_2) == False:
+                _temp_data_2[str_date_2] = []
+            _temp_data_2[str_date_2].append({'id':_id,'value':value})
 
         # グラフデータを整形する
         # ex: {date: "2020-02-17 10:00:00", '111': 100, '112': 100, '113': 80}
@@ -3147,17 +3345,9 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
             html_cross_combo += '<option value="'+ v[1] + ',' + v[0]+ '">' + k + '</option>'
         html_cross_combo += '</select>'
 
-        layer1 = QgsProject.instance().mapLayersByName('csv')[0]
-        QgsVectorFileWriter.writeAsVectorFormat(
-            layer1,
-            os.path.dirname(__file__) + '/temp/result_003.csv',
-            'UTF-8',
-            QgsCoordinateReferenceSystem("EPSG:4326"),
-            'CSV'
-        )
-        df = pd.read_csv(os.path.dirname(__file__) + '/temp/result_003.csv',dtype=str)
-        df['value'] = df['value'].astype('float')
-        cross1 = pd.crosstab(df['origin'], df['destination'],df['value'],aggfunc=np.sum)
+        # origin・destinationごとの合計(行: origin, 列: destination)と、異なる組のみの割合(cross3: origin別, cross4: destination別)
+        totals = self.dataset.aggregate(['origin', 'destination'], 'sum', self.mask)
+        cross1, cross3, cross4 = dataset.od_crosstab(totals)
         #cols = list(cross1.columns)
 
         csv_cross1 = [['origin','destination','value','lat','lon']]
@@ -3190,7 +3380,7 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
             writer = csv.writer(file, quoting=csv.QUOTE_ALL,delimiter=',')
             writer.writerows(csv_cross1)
 
-        cross2 = pd.crosstab(df['destination'], df['origin'],df['value'],aggfunc=np.sum)
+        cross2 = cross1.T
 
         csv_cross2 = [['destination','origin','value','lat','lon']]
         html_cross2 = '<table  class="od-table"><tbody><tr><th class="od_title">D/O</th>'
@@ -3221,13 +3411,9 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
             writer = csv.writer(file, quoting=csv.QUOTE_ALL,delimiter=',')
             writer.writerows(csv_cross2)
 
-        dff = df[df['origin'] != df['destination']]
-
-        if len(dff) == 0:
+        if cross3 is None:
             return "","","","",""
 
-        cross3 = pd.crosstab(dff['origin'], dff['destination'],dff['value'],aggfunc=np.sum, normalize='index')
-        
         csv_cross3 = [['origin','destination','value','lat','lon']]
         html_cross3 = '<table  class="od-table"><tbody><tr><th class="od_title">O/D</th>'
         for n in cols:
@@ -3279,8 +3465,6 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
             'GeoJSON'
         )
 
-        cross4 = pd.crosstab(dff['destination'], dff['origin'],dff['value'],aggfunc=np.sum, normalize='index')
-        
         csv_cross4 = [['destination','origin','value','lat','lon']]
         html_cross4 = '<table  class="od-table"><tbody><tr><th class="od_title">D/O</th>'
         for n in cols:
@@ -3345,9 +3529,8 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
             for row in csvreader:
                 cols.append(str(row[0]))
 
-        df = pd.read_csv(os.path.dirname(__file__) + '/temp/result_003.csv',dtype=str)
+        df = self.dataset.to_frame(self.mask)
 
-        df['value'] = df['value'].astype('float')
         df['time_o'] = pd.to_datetime(df['time_o'])
         df['time_d'] = pd.to_datetime(df['time_d'])
 
@@ -3580,63 +3763,11 @@ class PeopleFlowVisualizationDialog(QtWidgets.QDialog, FORM_CLASS):
 
 
     def replaceData_004(self):
-        test = QgsProject.instance().mapLayersByName('csv')[0]
-        idx_user_id = test.dataProvider().fields().indexFromName('id')
-        idx_lat = test.dataProvider().fields().indexFromName('lat')
-        idx_lon = test.dataProvider().fields().indexFromName('lon')
-        idx_time = test.dataProvider().fields().indexFromName('timestamp')
-
-        user_id = processing.run("qgis:listuniquevalues", {'INPUT':test,'FIELDS':['id'],'OUTPUT':'TEMPORARY_OUTPUT'})
-        user_id_list = []
-        i = 0
-        replace_min = 99999999999999999
-        replace_max = 0
-
-        for item in user_id["OUTPUT"].getFeatures():
-            request = QgsFeatureRequest(QgsExpression("\"id\" = '" + item.attributes()[0] + "'"))
-            clause = QgsFeatureRequest.OrderByClause('timestamp', ascending=True)
-            orderby = QgsFeatureRequest.OrderBy([clause])
-            request.setOrderBy(orderby)
-            selection = test.getFeatures(request)
-            
-            user = {}
-            path_all = []
-            time_all = []
-            j = 0
-            for feature in selection:
-                user = {}
-                user["vendor"] = i
-                if j==0 :
-                    lat_1 = feature.attributes()[idx_lat]
-                    lon_1 = feature.attributes()[idx_lon]
-                    path_1 = [lon_1,lat_1]
-                    time_1 = float(str(feature.attributes()[idx_time].toMSecsSinceEpoch()))
-                else :
-                    lat_2 = feature.attributes()[idx_lat]
-                    lon_2 = feature.attributes()[idx_lon]
-                    path_2 = [lon_2,lat_2]
-                    time_2 = float(str(feature.attributes()[idx_time].toMSecsSinceEpoch()))
-                    user["path"] = [path_1,path_2]
-                    user["timestamps"] = [time_1,time_2]
-
-                    if time_2 > replace_max :
-                        replace_max = time_2
-
-                    if time_2 < replace_min :
-                        replace_min = time_2
-
-                    lat_1 = feature.attributes()[idx_lat]
-                    lon_1 = feature.attributes()[idx_lon]
-                    path_1 = [lon_1,lat_1]
-                    time_1 = float(str(feature.attributes()[idx_time].toMSecsSinceEpoch()))
-                    
-                    user_id_list.append(user)
-                j = j+1
-        
-            i = i+1
+        # timestamp は読み込み時にUNIX時間(ミリ秒)に変換済み
+        df = self.dataset.to_frame(self.mask, ['id', dataset.EPOCH_MS, 'lat', 'lon'])
+        df['time'] = df[dataset.EPOCH_MS].astype('float')
+        user_id_list, replace_min, replace_max = dataset.log_segments(df)
 
-
-        
         replace_data = json.dumps(user_id_list)
 
         file_name = os.path.dirname(__file__) + '/html/003-2.html'
@@ -3691,23 +3822,27 @@ def getZoomFromScale(scale):
     return z-0.5
 
 def encodingCheck(file_path) :
-    with open(file_path, mode='rb') as f:
-        b = f.read()
-        encoding_info = detect(b)
-
-    file_encoding = encoding_info['encoding']
-    if file_encoding == "utf-8":
-        file_encoding = "utf-8"
-    elif file_encoding == "SHIFT_JIS":
-        file_encoding = "cp932"
-    elif file_encoding == "Windows-1252":
-        file_encoding = "cp932"
-    elif file_encoding == "ascii":
-        file_encoding = "cp932"
-    elif file_encoding == "UTF-8-SIG":
-        file_encoding = "utf-8-sig"
-    else :
-        file_encoding = "error:" + file_encoding
-
-    return file_encoding
-    
+    return loader.detect_encoding(file_path)
+
+def errors_path(file_name):
+    """エラー行の一覧(CSV)の出力先"""
+    return os.path.dirname(__file__) + '/temp/' + file_name
+
+def preview_mesh(file_names, index):
+    """メッシュ人流データ(複数のファイルは各ファイルから選んだ行)のプレビューを確認する
+
+    戻り値は load_mesh_with_cube と同じ形式で、キューブはNone
+    """
+    return validation.check_result(loader.preview_mesh_files(file_names), validation.mesh_rules(index)) + (None,)
+
+def load_mesh_with_cube(file_names, index, callback=None):
+    """メッシュ人流データを読み込んで全行を確認し、集計キューブを作成する(読み込みタスク内で実行する)
+
+    戻り値は (Dataset, メッシュコード一覧, LoadStats, 確認結果(Report), キューブ)。
+    キューブはエラーのある行を除いたデータ(Report.valid_data)から作成する
+    """
+    result = validation.check_result(loader.load_mesh_files(file_names, callback), validation.mesh_rules(index),
+                                     errors_path('errors_001.csv'), callback)
+    report = result[3]
+    data = report.valid_data if report.errors else result[0]
+    return result + (cube.build(data) if data is not None else None,)
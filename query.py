@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeopleFlowVisualization
+                                 A QGIS plugin
+ This plugin visualize people flow
+                             -------------------
+        begin                : 2022-10-07
+        copyright            : (C) 2022 by MLIT
+        email                : trial@MILT
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ SQLの条件式(WHERE句)をメモリ上の列で評価する
+
+ 一時保存していないデータはSQLiteに書き込まずに、条件式で使う列だけを numpy で評価する。
+ SQLiteと同じ結果になるように、値の無いセル(NULL)は比較の結果を「不明」とする3値の論理で扱う。
+ 対応する構文: 比較(=, ==, !=, <>, <, <=, >, >=)、AND・OR・NOT・括弧、[NOT] IN (...)、
+ [NOT] BETWEEN ... AND ...、[NOT] LIKE '...'、IS [NOT] NULL
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+TOKEN = re.compile(r"""\s*(?:
+    (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<name>[^\W\d]\w*|"(?:[^"]|"")*"|`(?:[^`]|``)*`|\[[^\]]*\])
+  | (?P<op><=|>=|<>|!=|==|[=<>(),+-])
+)""", re.VERBOSE)
+
+KEYWORDS = ("AND", "OR", "NOT", "IN", "BETWEEN", "LIKE", "IS", "NULL")
+# 比較の左右を入れ替えたときの演算子
+FLIPPED = {"=": "=", "!=": "!=", "<": ">", "<=": ">=", ">": "<", ">=": "<="}
+
+
+class QueryError(Exception):
+    """SQLの条件式の誤り"""
+
+
+class Column(object):
+    """条件式で使う列
+
+    values はユニーク値(codes で各行の値にする)または各行の値。値の無いセルは数値ではNaN、文字列ではNone
+    """
+
+    def __init__(self, values, codes=None, numeric=False):
+        self.values = values
+        self.codes = codes
+        self.numeric = numeric
+
+    def expand(self, result):
+        """ユニーク値ごとの結果を各行の結果にする(番号が-1の行は値が無い)"""
+        if self.codes is None:
+            return result
+        return np.append(result, False)[self.codes]
+
+    def rows(self):
+        return self.expand(self.values) if self.codes is not None else self.values
+
+    def known(self, values=None):
+        values = self.values if values is None else values
+        if self.numeric:
+            return ~np.isnan(values)
+        return np.array([value is not None for value in values], dtype=bool)
+
+
+def tokenize(text):
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = TOKEN.match(text, pos)
+        if match is None or match.end() == pos:
+            raise QueryError("SQLの条件式を解釈できません(" + text[pos:].strip()[:20] + ")")
+        pos = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == "string":
+            value = value[1:-1].replace("''", "'")
+        elif kind == "number":
+            value = float(value) if re.search(r"[.eE]", value) else int(value)
+        elif kind == "name":
+            if value[0] in "\"`[":
+                value = value[1:-1].replace(value[0] * 2, value[0]) if value[0] != "[" else value[1:-1]
+            elif value.upper() in KEYWORDS:
+                kind, value = "keyword", value.upper()
+        elif kind == "op" and value == "==":
+            value = "="
+        elif kind == "op" and value == "<>":
+            value = "!="
+        tokens.append((kind, value))
+    return tokens
+
+
+class Parser(object):
+    """条件式を (種類, ...) のタプルの木にする"""
+
+    def __init__(self, text):
+        self.tokens = tokenize(text)
+        self.pos = 0
+
+    def peek(self, kind=None, value=None):
+        if self.pos >= len(self.tokens):
+            return False
+        token = self.tokens[self.pos]
+        return (kind is None or token[0] == kind) and (value is None or token[1] == value)
+
+    def accept(self, kind, value=None):
+        if self.peek(kind, value):
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, kind, value=None):
+        if not self.accept(kind, value):
+            if self.pos >= len(self.tokens):
+                raise QueryError("SQLの条件式が途中で終わっています")
+            raise QueryError("SQLの条件式を解釈できません({} の前)".format(self.tokens[self.pos][1]))
+        return self.tokens[self.pos - 1][1]
+
+    def parse(self):
+        if len(self.tokens) == 0:
+            raise QueryError("SQLの条件式が空です")
+        node = self.parse_or()
+        if self.pos < len(self.tokens):
+            self.expect("end")
+        return node
+
+    def parse_or(self):
+        node = self.parse_and()
+        while self.accept("keyword", "OR"):
+            node = ("or", node, self.parse_and())
+        return node
+
+    def parse_and(self):
+        node = self.parse_not()
+        while self.accept("keyword", "AND"):
+            node = ("and", node, self.parse_not())
+        return node
+
+    def parse_not(self):
+        if self.accept("keyword", "NOT"):
+            return ("not", self.parse_not())
+        return self.parse_predicate()
+
+    def parse_predicate(self):
+        if self.accept("op", "("):
+            node = self.parse_or()
+            self.expect("op", ")")
+            return node
+        left = self.parse_operand()
+        if self.accept("keyword", "IS"):
+            negate = self.accept("keyword", "NOT")
+            self.expect("keyword", "NULL")
+            return ("null", left, negate)
+        negate = self.accept("keyword", "NOT")
+        if self.accept("keyword", "IN"):
+            self.expect("op", "(")
+            items = [self.parse_literal()]
+            while self.accept("op", ","):
+                items.append(self.parse_literal())
+            self.expect("op", ")")
+            return ("in", left, items, negate)
+        if self.accept("keyword", "BETWEEN"):
+            low = self.parse_operand()
+            self.expect("keyword", "AND")
+            return ("between", left, low, self.parse_operand(), negate)
+        if self.accept("keyword", "LIKE"):
+            pattern = self.parse_literal()
+            if not isinstance(pattern[1], str):
+                raise QueryError("LIKE の条件は文字列で指定してください")
+            return ("like", left, pattern[1], negate)
+        if negate:
+            self.expect("keyword", "IN")
+        op = self.expect("op")
+        if op not in FLIPPED:
+            raise QueryError("SQLの条件式を解釈できません({} の前)".format(op))
+        return ("compare", op, left, self.parse_operand())
+
+    def parse_operand(self):
+        if self.peek("name"):
+            return ("column", self.expect("name"))
+        return self.parse_literal()
+
+    def parse_literal(self):
+        if self.accept("keyword", "NULL"):
+            return ("literal", None)
+        sign = 1
+        if self.accept("op", "-"):
+            sign = -1
+        elif self.accept("op", "+"):
+            pass
+        if sign == -1 or self.peek("number"):
+            return ("literal", sign * self.expect("number"))
+        return ("literal", self.expect("string"))
+
+
+def parse(text):
+    return Parser(text).parse()
+
+
+def column_names(node):
+    """条件式で使う項目名"""
+    names = []
+    if node[0] == "column":
+        return [node[1]]
+    for child in node[1:]:
+        if isinstance(child, tuple):
+            names += [name for name in column_names(child) if name not in names]
+    return names
+
+
+def text_value(value):
+    """数値を文字列の項目と比較するときの文字列(SQLiteと同じ形式)"""
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
+
+
+def number_value(value):
+    """文字列を数値の項目と比較するときの数値(数値として解釈できなければNone)"""
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return float(value)
+
+
+def compare(values, op, other):
+    if op == "=":
+        return values == other
+    if op == "!=":
+        return values != other
+    if op == "<":
+        return values < other
+    if op == "<=":
+        return values <= other
+    if op == ">":
+        return values > other
+    return values >= other
+
+
+class Evaluator(object):
+    """条件式の木を列の辞書({項目名: Column})で評価し、(結果, 不明でないか) の配列の組を返す"""
+
+    def __init__(self, columns, rows):
+        self.columns = columns
+        self.rows = rows
+
+    def constant(self, value, known=True):
+        return np.full(self.rows, value, dtype=bool), np.full(self.rows, known, dtype=bool)
+
+    def evaluate(self, node):
+        kind = node[0]
+        if kind == "or":
+            (a, ka), (b, kb) = self.evaluate(node[1]), self.evaluate(node[2])
+            return (a & ka) | (b & kb), (ka & kb) | (a & ka) | (b & kb)
+        if kind == "and":
+            (a, ka), (b, kb) = self.evaluate(node[1]), self.evaluate(node[2])
+            return a & b, (ka & kb) | (~a & ka) | (~b & kb)
+        if kind == "not":
+            value, known = self.evaluate(node[1])
+            return ~value, known
+        if kind == "compare":
+            return self.compare(node[1], node[2], node[3])
+        if kind == "between":
+            low = self.compare(">=", node[1], node[2])
+            high = self.compare("<=", node[1], node[3])
+            value, known = self.evaluate(("and", ("result",) + low, ("result",) + high))
+            return (~value if node[4] else value), known
+        if kind == "result":
+            return node[1], node[2]
+        if kind == "null":
+            column = self.column(node[1])
+            if column is None:
+                return self.constant((node[1][1] is None) != node[2])
+            missing = column.expand(~column.known())
+            if column.codes is not None:
+                missing |= column.codes < 0
+            return (~missing if node[2] else missing), np.ones(self.rows, dtype=bool)
+        if kind == "in":
+            return self.isin(node[1], [item[1] for item in node[2]], node[3])
+        if kind == "like":
+            return self.like(node[1], node[2], node[3])
+        raise QueryError("SQLの条件式を解釈できません")
+
+    def column(self, operand):
+        if operand[0] != "column":
+            return None
+        for name, column in self.columns.items():
+            if name.lower() == operand[1].lower():
+                return column
+        raise QueryError("SQLの実行に失敗しました(no such column: " + operand[1] + ")")
+
+    def compare(self, op, left, right):
+        if left[0] != "column" and right[0] == "column":
+            return self.compare(FLIPPED[op], right, left)
+        column = self.column(left)
+        if column is None:
+            a, b = left[1], right[1]
+            if a is None or b is None:
+                return self.constant(False, False)
+            if isinstance(a, str) != isinstance(b, str):
+                # SQLiteでは数値は文字列より小さい
+                a, b = (0, 1) if isinstance(b, str) else (1, 0)
+            return self.constant(bool(compare(a, op, b)))
+        if right[0] == "column":
+            return self.compare_columns(op, column, self.column(right))
+
+        value = right[1]
+        if value is None:
+            return self.constant(False, False)
+        known = column.known()
+        if column.numeric:
+            number = number_value(value)
+            if number is None:
+                # 数値に変換できない文字列は数値より大きい
+                result = np.full(len(column.values), op in ("<", "<=", "!="), dtype=bool)
+            else:
+                with np.errstate(invalid="ignore"):
+                    result = compare(column.values, op, number)
+        else:
+            values = np.where(known, column.values, "").astype(object)
+            result = np.asarray(compare(values, op, text_value(value)), dtype=bool)
+        return column.expand(result & known), column.expand(known)
+
+    def compare_columns(self, op, left, right):
+        if left.numeric != right.numeric:
+            raise QueryError("SQLの条件式で数値の項目と文字列の項目は比較できません")
+        a, b = left.rows(), right.rows()
+        known = left.expand(left.known()) & right.expand(right.known())
+        if left.numeric:
+            with np.errstate(invalid="ignore"):
+                result = compare(a, op, b)
+        else:
+            result = np.asarray(compare(np.where(known, a, "").astype(object), op,
+                                        np.where(known, b, "").astype(object)), dtype=bool)
+        return result & known, known
+
+    def isin(self, operand, items, negate):
+        column = self.column(operand)
+        if column is None:
+            raise QueryError("IN の左側には項目名を指定してください")
+        if column.numeric:
+            wanted = [number for number in (number_value(item) for item in items if item is not None)
+                      if number is not None]
+            matched = np.isin(column.values, wanted)
+        else:
+            wanted = [text_value(item) for item in items if item is not None]
+            matched = pd.Index(column.values, dtype=object).isin(wanted)
+        known = column.known()
+        if any(item is None for item in items):
+            # NULL を含む一覧で一致しない場合は不明
+            known = known & matched
+        matched = matched & known
+        return column.expand(~matched if negate else matched), column.expand(known)
+
+    def like(self, operand, pattern, negate):
+        column = self.column(operand)
+        if column is None:
+            raise QueryError("LIKE の左側には項目名を指定してください")
+        regex = "".join(".*" if c == "%" else "." if c == "_" else re.escape(c) for c in pattern)
+        known = column.known()
+        if column.numeric:
+            texts = [text_value(float(value)) for value in column.values]
+        else:
+            texts = ["" if value is None else value for value in column.values]
+        matched = pd.Series(texts, dtype=object).str.fullmatch(regex, case=False, flags=re.DOTALL)
+        matched = matched.fillna(False).to_numpy(dtype=bool) & known
+        if negate:
+            matched = ~matched & known
+        return column.expand(matched), column.expand(known)
+
+
+def evaluate(node, columns, rows):
+    """条件式(parse の結果)に該当する行をTrueとした配列(NULLとの比較など結果が不明の行は該当しない)"""
+    value, known = Evaluator(columns, rows).evaluate(node)
+    return value & known
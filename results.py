@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeopleFlowVisualization
+                                 A QGIS plugin
+ This plugin visualize people flow
+                             -------------------
+        begin                : 2022-10-07
+        copyright            : (C) 2022 by MLIT
+        email                : trial@MILT
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ 分析結果のキャッシュ(出力ファイル(HTML・GeoJSON・CSV)の内容)
+
+ 読み込んだデータと抽出条件が同じ分析は、保存した出力ファイルを書き戻して結果を表示する。
+ メモリ上は使われた順に上限サイズまで保持し、あふれたものはディスクに保存する
+"""
+
+import collections
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+from . import cache
+
+# 出力ファイルの基準のフォルダ(プラグインのフォルダ)
+BASE_DIR = os.path.dirname(__file__)
+# 出力HTMLのテンプレートのフォルダ
+TEMPLATE_DIR = os.path.join(BASE_DIR, 'html')
+# テンプレートから作成したHTMLの拡張子(テンプレートの内容には含めない)
+OUTPUT_SUFFIX = '.html.html'
+# ディスクの保存先(QGISのユーザープロファイルの下)
+RESULT_DIR = cache.user_cache_dir("results")
+# メモリ上に保持する上限サイズ
+MAX_MEMORY_BYTES = 256 * 1024 * 1024
+# ディスクに保存する上限サイズ(超えた場合は使われていない順に削除する)
+MAX_DISK_BYTES = 2 * 1024 * 1024 * 1024
+# キャッシュを使うかどうか・ディスクに保存するかどうか
+ENABLED = True
+DISK_ENABLED = True
+
+META_FILE = "meta.json"
+
+
+def make_key(*parts):
+    """分析の種類・データのキー・抽出条件などからキャッシュのキーを作る
+
+    出力HTMLはテンプレートに値を埋め込んで作るため、テンプレートの内容もキーに含める(更新すれば作り直す)
+    """
+    text = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    h = hashlib.sha1(text.encode("utf-8"))
+    h.update(template_key().encode("ascii"))
+    return h.hexdigest()
+
+
+def template_key(directory=None):
+    """出力HTMLのテンプレート(テンプレートから作成したHTMLを除く)の名前と内容のハッシュ"""
+    if directory is None:
+        directory = TEMPLATE_DIR
+    h = hashlib.sha1()
+    if os.path.isdir(directory):
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if not name.endswith(".html") or name.endswith(OUTPUT_SUFFIX) or not os.path.isfile(path):
+                continue
+            h.update(name.encode("utf-8") + b"\0")
+            with open(path, mode="rb") as f:
+                h.update(hashlib.sha1(f.read()).digest())
+    return h.hexdigest()
+
+
+def file_key(path):
+    """分析に使う入力ファイル(センサー情報など)のキー(ファイルが無ければNone)"""
+    if path is None or not os.path.isfile(path):
+        return None
+    return cache.fingerprint(path)
+
+
+def normalize_filters(filter_list):
+    """プルダウンの入力を比較用に正規化する(前後の空白・未入力とALLの違いを無視する)"""
+    return tuple("ALL" if text.strip() == "" else text.strip() for text in filter_list)
+
+
+class ResultCache(object):
+    """出力ファイルの内容({基準フォルダからの相対パス: bytes})をキーごとに保持する"""
+
+    def __init__(self, max_bytes=None, directory=None):
+        self.max_bytes = MAX_MEMORY_BYTES if max_bytes is None else max_bytes
+        self.directory = directory
+        self.entries = collections.OrderedDict()
+        self.size = 0
+
+    def get(self, key):
+        """保持していれば出力ファイルの内容を返す(メモリに無ければディスクから読み込む)。無ければNone"""
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        files = self.read_disk(key)
+        if files is not None:
+            self.add(key, files)
+        return files
+
+    def put(self, key, files):
+        self.add(key, files)
+        self.write_disk(key, files)
+
+    def add(self, key, files):
+        if key in self.entries:
+            self.size -= entry_size(self.entries.pop(key))
+        self.entries[key] = files
+        self.size += entry_size(files)
+        while self.size > self.max_bytes and len(self.entries) > 0:
+            old_key, old_files = self.entries.popitem(last=False)
+            self.size -= entry_size(old_files)
+
+    def store(self, key, names):
+        """分析後の出力ファイル(相対パスのリスト)を読み込んで保持する"""
+        if not ENABLED or key is None:
+            return
+        files = {}
+        try:
+            for name in names:
+                with open(os.path.join(BASE_DIR, name), mode="rb") as f:
+                    files[name] = f.read()
+        except OSError:
+            # 出力されなかったファイルがあれば保持しない(分析結果はそのまま表示する)
+            return
+        self.put(key, files)
+
+    def restore(self, key):
+        """保持している出力ファイルを書き戻す。保持していなければFalse"""
+        if not ENABLED or key is None:
+            return False
+        files = self.get(key)
+        if files is None:
+            return False
+        for name, content in files.items():
+            with open(os.path.join(BASE_DIR, name), mode="wb") as f:
+                f.write(content)
+        return True
+
+    def read_disk(self, key):
+        if self.directory is None or not DISK_ENABLED:
+            return None
+        path = os.path.join(self.directory, key)
+        meta_path = os.path.join(path, META_FILE)
+        if not os.path.isfile(meta_path):
+            return None
+        try:
+            with open(meta_path, encoding="utf-8") as f:
+                names = json.load(f)["files"]
+            files = {}
+            for i, name in enumerate(names):
+                with open(os.path.join(path, str(i)), mode="rb") as f:
+                    files[name] = f.read()
+            # 使用日時を更新する(削除の順番に使う)
+            os.utime(meta_path, None)
+        except Exception:
+            shutil.rmtree(path, ignore_errors=True)
+            return None
+        return files
+
+    def write_disk(self, key, files):
+        """ディスクに保存する(失敗しても分析は続ける)"""
+        if self.directory is None or not DISK_ENABLED:
+            return
+        path = os.path.join(self.directory, key)
+        if os.path.isdir(path):
+            return
+        tmp = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = tempfile.mkdtemp(prefix=".tmp-", dir=self.directory)
+            names = list(files)
+            for i, name in enumerate(names):
+                with open(os.path.join(tmp, str(i)), mode="wb") as f:
+                    f.write(files[name])
+            with open(os.path.join(tmp, META_FILE), mode="w", encoding="utf-8") as f:
+                json.dump({"files": names}, f, ensure_ascii=False)
+            os.replace(tmp, path)
+            tmp = None
+        except Exception:
+            pass
+        finally:
+            if tmp is not None:
+                shutil.rmtree(tmp, ignore_errors=True)
+        self.evict()
+
+    def evict(self, max_bytes=None):
+        """ディスク全体が上限サイズを超えていれば、最後に使われた日時が古いものから削除する"""
+        if max_bytes is None:
+            max_bytes = MAX_DISK_BYTES
+        if self.directory is None or not os.path.isdir(self.directory):
+            return
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            meta_path = os.path.join(path, META_FILE)
+            if name.startswith(".") or not os.path.isfile(meta_path):
+                continue
+            size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+            entries.append((os.path.getmtime(meta_path), size, path))
+            total += size
+
+        for used, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            if not os.path.isdir(path):
+                total -= size
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def entry_size(files):
+    return sum(len(content) for content in files.values())
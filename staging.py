@@ -0,0 +1,597 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeopleFlowVisualization
+                                 A QGIS plugin
+ This plugin visualize people flow
+                             -------------------
+        begin                : 2022-10-07
+        copyright            : (C) 2022 by MLIT
+        email                : trial@MILT
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ メモリに収まらない大きなデータの一時保存(SQLite)
+
+ 一定サイズ以上のCSVはメモリ上の配列にせず、索引付きのSQLiteファイルに書き込んで
+ 抽出・集計をSQLで行う。StagedDataset は dataset.Dataset と同じ名前のメソッドを持つ
+"""
+
+import contextlib
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import uuid
+
+from urllib.request import pathname2url
+
+import numpy as np
+import pandas as pd
+
+from pandas.io.sql import DatabaseError
+
+from . import cache
+from . import query
+from .dataset import (SENSOR, LOG, FLOAT_COLUMNS, DATE, DATETIME, EPOCH_MS, INVALID_EPOCH_MS,
+                      Condition, compose_datetime, concat, encode, format_datetime, is_category,
+                      parse_timestamps, source_keys)
+
+# 一時保存先(QGISのユーザープロファイルの下)
+STAGING_DIR = cache.user_cache_dir("staging")
+# このサイズ以上のCSVは一時保存して処理する(QGISの設定 staging/min_mb で変更できる)
+STAGE_MIN_BYTES = 2 * 1024 * 1024 * 1024
+# 一時保存全体の上限サイズ(超えた場合は使われていない順に削除する。QGISの設定 staging/max_mb で変更できる)
+MAX_STAGING_BYTES = 50 * 1024 * 1024 * 1024
+# 一時保存を使うかどうか
+ENABLED = True
+# 追加データの書き込みで1回に扱う件数
+WRITE_ROWS = 200000
+
+TABLE = "data"
+META_TABLE = "meta"
+EXTENSION = ".sqlite"
+
+# 計測日時はSQLiteの文字列として比較・並べ替えできる形式で保存する
+STORED_DATETIME_FORMAT = "%Y-%m-%d %H:%M"
+# 集計キー(DATE, DATETIME)のSQL式。dataset.DATE_FORMATS と同じ文字列にする
+KEY_EXPRESSIONS = {
+    DATE: "replace(substr(datetime, 1, 10), '-', '/')",
+    DATETIME: "replace(datetime, '-', '/')",
+}
+
+
+# SQLの条件式の誤り(一時保存していないデータの条件式は query で評価する)
+QueryError = query.QueryError
+
+
+def should_stage(path):
+    """ファイルを一時保存して処理するかどうか"""
+    return ENABLED and os.path.getsize(path) >= cache.setting_bytes("staging/min_mb", STAGE_MIN_BYTES)
+
+
+def store_path(key):
+    return os.path.join(STAGING_DIR, key + EXTENSION)
+
+
+def quote_name(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def quote_value(value):
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def column_type(name):
+    if name in FLOAT_COLUMNS:
+        return "REAL"
+    if name == EPOCH_MS:
+        return "INTEGER"
+    return "TEXT"
+
+
+def stored_columns(kind, header):
+    """テーブルの項目(計測データは日時、ログデータはUNIX時間の項目を加える)"""
+    if kind == SENSOR:
+        return list(header) + [DATETIME]
+    if kind == LOG:
+        return list(header) + [EPOCH_MS]
+    return list(header)
+
+
+def index_columns(kind, header):
+    """索引を作成する項目の組(抽出・集計に使う項目)"""
+    candidates = [("meshcode",), ("place_id",), (DATETIME,), ("origin", "destination"), ("destination",),
+                  ("id", "timestamp")]
+    candidates += [(name,) for name in header if name.startswith("option")]
+    columns = stored_columns(kind, header)
+    return [names for names in candidates if all(name in columns for name in names)]
+
+
+def open_store(key):
+    """一時保存済みであれば StagedDataset を返す。無ければNone"""
+    path = store_path(key)
+    if not ENABLED or not os.path.isfile(path):
+        return None
+    try:
+        data = StagedDataset(path)
+    except sqlite3.Error:
+        return None
+    # 使用日時を更新する(削除の順番に使う)
+    os.utime(path, None)
+    return data
+
+
+class StoreWriter(object):
+    """読み込んだ行のまとまりを一時ファイルに書き込み、最後に索引を作成する
+
+    finish() を呼ぶまではファイル名を確定しないため、中断した場合は close() で削除される。
+    base(StagedDataset)を指定した場合は、そのファイルの複製に行を追加する(既存の行は書き直さず、索引も追加分のみ更新される)
+    """
+
+    def __init__(self, key, kind, header, base=None):
+        os.makedirs(STAGING_DIR, exist_ok=True)
+        self.key = key
+        self.kind = kind
+        self.header = list(header)
+        self.columns = stored_columns(kind, header)
+        self.rows = 0
+        self.sources = []
+        self.path = store_path(key)
+        self.tmp = os.path.join(STAGING_DIR, ".tmp-" + uuid.uuid4().hex + EXTENSION)
+        if base is not None:
+            shutil.copyfile(base.path, self.tmp)
+            self.rows = base.rows
+        self.conn = sqlite3.connect(self.tmp)
+        # 書き込み中のファイルは完成するまで使わないため、ジャーナルは作成しない
+        self.conn.execute("PRAGMA journal_mode=OFF")
+        self.conn.execute("PRAGMA synchronous=OFF")
+        if base is None:
+            self.conn.execute("CREATE TABLE {} ({})".format(
+                TABLE, ", ".join(quote_name(name) + " " + column_type(name) for name in self.columns)))
+            self.conn.execute("CREATE TABLE {} (name TEXT PRIMARY KEY, value TEXT)".format(META_TABLE))
+        self.insert = "INSERT INTO {} VALUES ({})".format(TABLE, ", ".join("?" * len(self.columns)))
+
+    def write(self, chunk):
+        """DataFrameまたは列の辞書(ヘッダーの項目)を書き込む"""
+        values = [np.asarray(chunk[name]).tolist() for name in self.header]
+        if self.kind == SENSOR:
+            values.append(self.stored_datetime(chunk))
+        elif self.kind == LOG:
+            epoch, valid = parse_timestamps(chunk["timestamp"])
+            values.append(np.where(valid, epoch, None).tolist())
+        self.conn.executemany(self.insert, zip(*values))
+        self.rows += len(values[0])
+
+    def stored_datetime(self, chunk):
+        """year,month,day,hour,minute から保存用の日時の文字列を作る(無効な日時はNULL)"""
+        row_date, valid = compose_datetime(*[chunk[name] for name in ("year", "month", "day", "hour", "minute")])
+        text = np.full(len(row_date), None, dtype=object)
+        text[valid] = format_datetime(row_date[valid], STORED_DATETIME_FORMAT)
+        return text.tolist()
+
+    def write_dataset(self, data, exclude=None, callback=None):
+        """Dataset または StagedDataset の全行(exclude で指定した行番号を除く)を書き込む
+
+        Dataset は WRITE_ROWS 行ずつ書き込み、callback(書き込んだ行数, 全行数, 書き込んだ行数) を呼ぶ
+        """
+        if isinstance(data, StagedDataset):
+            self.conn.execute("CREATE TEMP TABLE excluded (id INTEGER PRIMARY KEY)")
+            if exclude is not None:
+                self.conn.executemany("INSERT INTO excluded VALUES (?)", ((int(row) + 1,) for row in exclude))
+            self.conn.commit()
+            self.conn.execute("ATTACH DATABASE ? AS source", (data.path,))
+            columns = ", ".join(quote_name(name) for name in self.columns)
+            cursor = self.conn.execute(("INSERT INTO {0} ({1}) SELECT {1} FROM source.{0} "
+                                        "WHERE rowid NOT IN (SELECT id FROM excluded) ORDER BY rowid").format(TABLE, columns))
+            self.rows += cursor.rowcount
+            self.conn.commit()
+            self.conn.execute("DETACH DATABASE source")
+            self.conn.execute("DROP TABLE excluded")
+            return
+        excluded = None
+        if exclude is not None:
+            excluded = np.zeros(len(data), dtype=bool)
+            excluded[exclude] = True
+        for start, columns in data.iter_rows(self.header, WRITE_ROWS):
+            end = start + len(columns[self.header[0]])
+            if excluded is not None:
+                keep = ~excluded[start:end]
+                columns = {name: values[keep] for name, values in columns.items()}
+            self.write(columns)
+            if callback is not None:
+                callback(end, len(data), end)
+
+    def finish(self):
+        """索引を作成してファイル名を確定し、StagedDataset を返す"""
+        for names in index_columns(self.kind, self.header):
+            self.conn.execute("CREATE INDEX IF NOT EXISTS {} ON {} ({})".format(
+                quote_name("idx_" + "_".join(names)), TABLE, ", ".join(quote_name(name) for name in names)))
+        meta = {"kind": self.kind, "header": json.dumps(self.header, ensure_ascii=False), "rows": str(self.rows),
+                "sources": json.dumps(self.sources)}
+        self.conn.executemany("INSERT OR REPLACE INTO {} VALUES (?, ?)".format(META_TABLE), meta.items())
+        self.conn.commit()
+        self.conn.close()
+        self.conn = None
+        os.replace(self.tmp, self.path)
+        evict()
+        return StagedDataset(self.path)
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+            if os.path.exists(self.tmp):
+                os.remove(self.tmp)
+
+
+def append(base, delta):
+    """Dataset/StagedDataset を結合する
+
+    どちらも一時保存していなければ Dataset.append と同じ。どちらかが一時保存したデータであれば merge と同じ
+    """
+    if not isinstance(base, StagedDataset) and not isinstance(delta, StagedDataset):
+        return base.append(delta)
+    return merge([base, delta])
+
+
+def merge(datasets):
+    """Dataset/StagedDataset を順に結合した StagedDataset を返す
+
+    先頭が一時保存したデータであれば、そのファイルの複製に残りの行だけを書き込む
+    (先頭がメモリ上のデータの場合は、すべての行を新しいファイルに書き込む)。
+    項目の異なるデータ・同じファイルを含むデータは結合できない
+    """
+    first = datasets[0]
+    sources = source_keys(first)
+    for data in datasets[1:]:
+        if data.header != first.header:
+            raise ValueError("header")
+        if any(key in sources for key in source_keys(data)):
+            raise ValueError("duplicate")
+        sources += source_keys(data)
+    fingerprints = [data.fingerprint for data in datasets]
+    if None not in fingerprints:
+        key = hashlib.sha1("".join(fingerprints).encode("ascii")).hexdigest()
+    else:
+        key = uuid.uuid4().hex
+    data = open_store(key)
+    if data is not None:
+        return data
+
+    if isinstance(first, StagedDataset):
+        writer = StoreWriter(key, first.kind, first.header, first)
+        rest = datasets[1:]
+    else:
+        writer = StoreWriter(key, first.kind, first.header)
+        rest = datasets
+    try:
+        for data in rest:
+            writer.write_dataset(data)
+        writer.sources = sources
+        return writer.finish()
+    finally:
+        writer.close()
+
+
+def stage_dataset(data, callback=None):
+    """Dataset をSQLiteに書き込んだ StagedDataset を返す(同じキーのデータは書き込み済みのものを使う)
+
+    fingerprint の無いデータは使い捨てのキーで書き込む。
+    callback(書き込んだ行数, 全行数, 書き込んだ行数) は LoadTask の進捗・キャンセルに使う
+    """
+    if data.fingerprint is not None:
+        staged = open_store(data.fingerprint)
+        if staged is not None:
+            return staged
+    key = data.fingerprint if data.fingerprint is not None else uuid.uuid4().hex
+    writer = StoreWriter(key, data.kind, data.header)
+    try:
+        writer.write_dataset(data, callback=callback)
+        return writer.finish()
+    finally:
+        writer.close()
+
+
+def query_columns(data, names):
+    """メモリ上の Dataset の項目を、条件式(query)で使う列にする
+
+    項目名・値は一時保存したテーブルと同じにする(計測データの日時は保存時と同じ形式の文字列、
+    ログデータのUNIX時間は数値)。文字列の項目はユニーク値ごとに評価する
+    """
+    wanted = set(name.lower() for name in names)
+    columns = {}
+    for name in stored_columns(data.kind, data.header):
+        if name.lower() not in wanted or name not in data.columns:
+            continue
+        values = data.columns[name]
+        if name in data.categories:
+            columns[name] = query.Column(data.categories[name], values)
+        elif name in FLOAT_COLUMNS:
+            columns[name] = query.Column(values, numeric=True)
+        elif name == EPOCH_MS:
+            numbers = values.astype(np.float64)
+            numbers[values == INVALID_EPOCH_MS] = np.nan
+            columns[name] = query.Column(numbers, numeric=True)
+        elif name == DATETIME:
+            codes, uniques = pd.factorize(values)
+            texts = pd.DatetimeIndex(uniques).strftime(STORED_DATETIME_FORMAT).to_numpy(dtype=object)
+            columns[name] = query.Column(texts, codes)
+        else:
+            codes, uniques = pd.factorize(values)
+            columns[name] = query.Column(np.asarray(uniques, dtype=object), codes)
+    return columns
+
+
+def mask(data, filters, where=None):
+    """{項目名: 値} の等価条件と、SQLの条件式(where)をすべて満たす行の抽出条件を返す
+
+    一時保存したデータは条件式をSQLiteで実行する。メモリ上の Dataset はSQLiteに書き込まず、
+    条件式で使う列だけを query で評価する
+    """
+    if not where:
+        return data.mask(filters)
+    if isinstance(data, StagedDataset):
+        result = StagedMask(data, filters, where)
+        data.exists(result)
+        return result
+    node = query.parse(where)
+    selected = query.evaluate(node, query_columns(data, query.column_names(node)), len(data))
+    return data.mask(filters) & selected
+
+
+def exclude_rows(data, rows):
+    """行番号(0から)で指定した行を除いた StagedDataset を返す"""
+    key = hashlib.sha1(data.fingerprint.encode("ascii") + np.asarray(rows, dtype=np.int64).tobytes()).hexdigest()
+    staged = open_store(key)
+    if staged is not None:
+        return staged
+    writer = StoreWriter(key, data.kind, data.header)
+    try:
+        writer.write_dataset(data, exclude=rows)
+        writer.sources = source_keys(data)
+        return writer.finish()
+    finally:
+        writer.close()
+
+
+def evict(max_bytes=None):
+    """一時保存全体が上限サイズを超えていれば、最後に使われた日時が古いものから削除する"""
+    if max_bytes is None:
+        max_bytes = cache.setting_bytes("staging/max_mb", MAX_STAGING_BYTES)
+    if not os.path.isdir(STAGING_DIR):
+        return
+    entries = []
+    total = 0
+    for name in os.listdir(STAGING_DIR):
+        path = os.path.join(STAGING_DIR, name)
+        if name.startswith(".") or not name.endswith(EXTENSION):
+            continue
+        size = os.path.getsize(path)
+        entries.append((os.path.getmtime(path), size, path))
+        total += size
+
+    for used, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        # 開いているファイルは削除できない場合がある(その場合は次回に削除する)
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+def clear():
+    if not os.path.isdir(STAGING_DIR):
+        return
+    for name in os.listdir(STAGING_DIR):
+        try:
+            os.remove(os.path.join(STAGING_DIR, name))
+        except OSError:
+            pass
+
+
+class StagedMask(object):
+    """StagedDataset.mask() の戻り値({項目名: 値} の等価条件とSQLの条件式)"""
+
+    def __init__(self, data, filters, where=None):
+        self.data = data
+        self.filters = dict(filters)
+        self.where = where
+
+    def any(self):
+        return self.data.exists(self)
+
+
+class StagedDataset(object):
+    """SQLiteに一時保存した人流データ
+
+    抽出条件・集計はSQLで行い、結果だけをメモリに読み込む。
+    QGISのレイヤはSQLiteのテーブルをそのまま開き、抽出条件は subset string で指定する
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.fingerprint = os.path.basename(path)[:-len(EXTENSION)]
+        meta = dict(self.query("SELECT name, value FROM {}".format(META_TABLE)))
+        self.kind = meta["kind"]
+        self.header = json.loads(meta["header"])
+        self.rows = int(meta["rows"])
+        self.sources = json.loads(meta.get("sources", "[]"))
+
+    def connect(self):
+        # 読み込みタスクとメインスレッドの両方から使うため、問い合わせごとに接続する。
+        # 利用者が入力した条件式も実行するため、読み取り専用で開く
+        return contextlib.closing(sqlite3.connect("file:" + pathname2url(self.path) + "?mode=ro", uri=True))
+
+    def query(self, sql):
+        with self.connect() as conn:
+            try:
+                return conn.execute(sql).fetchall()
+            except sqlite3.Error as e:
+                raise QueryError("SQLの実行に失敗しました(" + str(e) + ")")
+
+    def read_frame(self, sql):
+        with self.connect() as conn:
+            try:
+                return pd.read_sql_query(sql, conn)
+            except (sqlite3.Error, DatabaseError) as e:
+                raise QueryError("SQLの実行に失敗しました(" + str(e) + ")")
+
+    def terms(self, mask=None, period=None):
+        """抽出条件(StagedMask)と計測日時の範囲をSQLの条件式のリストにする"""
+        terms = []
+        if mask is not None:
+            for name, value in mask.filters.items():
+                if isinstance(value, Condition):
+                    # 該当する値を求めて IN の条件にする(項目の索引を使う)
+                    values = value.select(self.unique(name))
+                    terms.append("{} IN ({})".format(quote_name(name), ", ".join(quote_value(v) for v in values)))
+                else:
+                    terms.append("{} = {}".format(quote_name(name), quote_value(value)))
+        if period is not None:
+            terms.append("datetime BETWEEN {} AND {}".format(
+                *[quote_value(value.strftime(STORED_DATETIME_FORMAT)) for value in period]))
+        if mask is not None and mask.where:
+            terms.append("(" + mask.where + ")")
+        return terms
+
+    def condition(self, mask=None, period=None):
+        terms = self.terms(mask, period)
+        if len(terms) == 0:
+            return "1"
+        return " AND ".join(terms)
+
+    def select(self, columns, mask=None, period=None):
+        return "SELECT {} FROM {} WHERE {} ORDER BY rowid".format(
+            ", ".join(quote_name(name) for name in columns), TABLE, self.condition(mask, period))
+
+    def __len__(self):
+        return self.rows
+
+    def option_names(self):
+        return [name for name in self.header if name.startswith("option")]
+
+    def exists(self, mask=None):
+        return len(self.query("SELECT 1 FROM {} WHERE {} LIMIT 1".format(TABLE, self.condition(mask)))) > 0
+
+    def row_numbers(self, mask=None):
+        """条件に該当する行の番号(0から)"""
+        rows = self.query("SELECT rowid - 1 FROM {} WHERE {} ORDER BY rowid".format(TABLE, self.condition(mask)))
+        return np.array([row[0] for row in rows], dtype=np.int64)
+
+    def iter_rows(self, names, size):
+        """(先頭の行番号, 列の辞書) を size 行ずつ返す(rowidの範囲で読み込む)"""
+        for start in range(0, self.rows, size):
+            rows = self.query("SELECT {} FROM {} WHERE rowid > {} AND rowid <= {} ORDER BY rowid".format(
+                ", ".join(quote_name(name) for name in names), TABLE, start, start + size))
+            yield start, {name: self.to_array(name, [row[i] for row in rows]) for i, name in enumerate(names)}
+
+    def column(self, name, mask=None):
+        return self.to_array(name, [row[0] for row in self.query(self.select([name], mask))])
+
+    def to_array(self, name, values):
+        """問い合わせ結果の値のリストを Dataset と同じ型の配列にする"""
+        if name in FLOAT_COLUMNS:
+            return np.array([np.nan if value is None else value for value in values], dtype=np.float64)
+        if name == DATETIME:
+            return pd.to_datetime(pd.Series(values, dtype=object)).to_numpy(dtype="datetime64[m]")
+        if name == EPOCH_MS:
+            return np.array([INVALID_EPOCH_MS if value is None else value for value in values], dtype=np.int64)
+        return np.array(values, dtype=object)
+
+    def unique(self, name, mask=None):
+        """項目のユニーク値を文字列のリストで返す(索引を使う)"""
+        rows = self.query("SELECT DISTINCT {0} FROM {1} WHERE {2} ORDER BY {0}".format(
+            quote_name(name), TABLE, self.condition(mask)))
+        return [str(row[0]) for row in rows]
+
+    def mask(self, filters):
+        """{項目名: 値} の等価条件(SQLの条件式として使う)"""
+        return StagedMask(self, filters)
+
+    def add_datetime(self):
+        """日時の項目は書き込み時に作成済み。すべて有効な日時ならTrue"""
+        return self.query("SELECT COUNT(*) FROM {} WHERE datetime IS NULL".format(TABLE))[0][0] == 0
+
+    def datetime_range(self):
+        values = self.query("SELECT MIN(datetime), MAX(datetime) FROM {}".format(TABLE))[0]
+        return tuple(datetime.datetime.strptime(value, STORED_DATETIME_FORMAT) for value in values)
+
+    def aggregate(self, keys, how="sum", mask=None, period=None):
+        """keys の値ごとに value を集計した Series を返す(Dataset.aggregate と同じ結果をSQLで求める)"""
+        exprs = [KEY_EXPRESSIONS.get(key, quote_name(key)) for key in keys]
+        group = ", ".join(exprs)
+        columns = ", ".join("{} AS {}".format(expr, quote_name(key)) for expr, key in zip(exprs, keys))
+        condition = self.condition(mask, period)
+        if how == "last":
+            # 同じキーの最後の行の値(並びは最初に現れた順)
+            sql = ("SELECT {0}, value FROM {1} JOIN (SELECT MIN(rowid) AS first_row, MAX(rowid) AS last_row "
+                   "FROM {1} WHERE {2} GROUP BY {3}) ON {1}.rowid = last_row ORDER BY first_row").format(
+                       columns, TABLE, condition, group)
+        else:
+            sql = "SELECT {0}, SUM(value) AS value FROM {1} WHERE {2} GROUP BY {3} ORDER BY MIN(rowid)".format(
+                columns, TABLE, condition, group)
+        frame = self.read_frame(sql)
+        return frame.set_index(keys[0] if len(keys) == 1 else list(keys))["value"]
+
+    def aggregate_rows(self, key, how="sum", mask=None):
+        """key の値ごとに1行にまとめたメモリ上の Dataset を返す(Dataset.aggregate_rows と同じ結果をSQLで求める)"""
+        columns = []
+        for name in self.header:
+            if name == "value" and how == "sum":
+                columns.append("total AS value")
+            else:
+                columns.append("{}.{}".format(TABLE, quote_name(name)))
+        sql = ("SELECT {0} FROM {1} JOIN (SELECT MIN(rowid) AS first_row, TOTAL(value) AS total FROM {1} "
+               "WHERE {2} GROUP BY {3}) ON {1}.rowid = first_row ORDER BY first_row").format(
+                   ", ".join(columns), TABLE, self.condition(mask), quote_name(key))
+        frame = self.read_frame(sql)
+        chunk = {}
+        for name in self.header:
+            values = self.to_array(name, frame[name].tolist())
+            chunk[name] = encode(values) if is_category(name) else values
+        return concat(self.kind, self.header, [chunk])
+
+    def to_frame(self, mask=None, columns=None):
+        """抽出条件(mask)または行番号(0から)の配列で指定した行の DataFrame(行番号はまとまりごとに読み込む)"""
+        if columns is None:
+            columns = self.header
+        if isinstance(mask, np.ndarray):
+            frames = []
+            for start in range(0, len(mask), WRITE_ROWS):
+                ids = ", ".join(str(int(row) + 1) for row in mask[start:start + WRITE_ROWS])
+                frames.append(self.read_frame("SELECT {} FROM {} WHERE rowid IN ({}) ORDER BY rowid".format(
+                    ", ".join(quote_name(name) for name in columns), TABLE, ids)))
+            frame = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns)
+        else:
+            frame = self.read_frame(self.select(columns, mask))
+        for name in columns:
+            if name in FLOAT_COLUMNS:
+                frame[name] = frame[name].astype(np.float64)
+        return frame
+
+    def to_layer(self, name="csv", mask=None):
+        """SQLiteのテーブルを開いたレイヤを作成する(プロジェクトには追加しない)"""
+        from qgis.core import QgsVectorLayer
+
+        layer = QgsVectorLayer("{}|layername={}".format(self.path, TABLE), name, 'ogr')
+        layer.setProviderEncoding('UTF-8')
+        layer.dataProvider().setEncoding('UTF-8')
+        layer.setSubsetString(" AND ".join(self.terms(mask)))
+        return layer
+
+    def append(self, other):
+        return append(self, other)
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeopleFlowVisualization
+                                 A QGIS plugin
+ This plugin visualize people flow
+                             -------------------
+        begin                : 2022-10-07
+        copyright            : (C) 2022 by MLIT
+        email                : trial@MILT
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ バックグラウンドで実行する読み込み処理(QgsTask)
+"""
+
+import time
+
+from qgis.core import QgsTask
+
+from .loader import LoadCancelled
+
+
+def format_seconds(seconds):
+    """残り時間の表示(例: 1分05秒)"""
+    seconds = int(round(seconds))
+    if seconds >= 60:
+        return "{}分{:02d}秒".format(seconds // 60, seconds % 60)
+    return "{}秒".format(seconds)
+
+
+class LoadTask(QgsTask):
+    """func(callback) を別スレッドで実行するタスク
+
+    callback(読み込み済バイト数, ファイルサイズ, 読み込み済件数) で進捗と残り時間を更新し、
+    キャンセルされていれば LoadCancelled を送出して読み込みを中断する。
+    終了後はメインスレッドで on_finished(task) が呼ばれる。
+    結果は task.result、例外は task.exception に入る。
+    """
+
+    def __init__(self, description, func, on_finished):
+        super(LoadTask, self).__init__(description, QgsTask.CanCancel)
+        self.func = func
+        self.on_finished = on_finished
+        self.result = None
+        self.exception = None
+        self.rows = 0
+        self.eta = None
+        self.start_time = None
+
+    def progress_callback(self, pos, total, rows):
+        if self.isCanceled():
+            raise LoadCancelled()
+        self.rows = rows
+        if total > 0 and pos > 0:
+            ratio = min(float(pos) / total, 1.0)
+            elapsed = time.perf_counter() - self.start_time
+            self.eta = elapsed / ratio - elapsed
+            self.setProgress(ratio * 100)
+
+    def status_text(self):
+        """進捗ダイアログに表示する文字列"""
+        text = "{:.0f}% ({:,}件)".format(self.progress(), self.rows)
+        if self.eta is not None:
+            text += " 残り約" + format_seconds(self.eta)
+        return text
+
+    def run(self):
+        self.start_time = time.perf_counter()
+        try:
+            self.result = self.func(self.progress_callback)
+        except Exception as e:
+            self.exception = e
+            return False
+        return True
+
+    def finished(self, result):
+        self.on_finished(self)
+
+
+class FinishedTask(object):
+    """実行済みの結果を LoadTask と同じ形(result, exception)で渡す(プレビューなど)"""
+
+    def __init__(self, result):
+        self.result = result
+        self.exception = None
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeopleFlowVisualization
+                                 A QGIS plugin
+ This plugin visualize people flow
+                             -------------------
+        begin                : 2022-10-07
+        copyright            : (C) 2022 by MLIT
+        email                : trial@MILT
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ 分析処理(001)の集計・結合のベンチマーク
+
+ 変更前の native:aggregate, joinattributestable による結合と、cube.join_rows, cube.join_layer による結合の
+ 処理時間を比較し、結合した value が同じであることを確認する。
+ QGISのPython環境で、プラグインの親フォルダから次のように実行する(QGISが無い場合は新しい処理のみ計測する)
+
+   python -m <プラグインのフォルダ名>.test.benchmark_datajoin [行数] [メッシュ数]
+"""
+
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from .. import cube
+from .. import worldmesh
+from .mesh_data import make_dataset, make_frame, reference_join
+
+# (名前, 抽出条件, ALLの項目)
+CASES = [
+    ("ALLの項目あり(集計キューブ)", {"option1": "2020"}, ["option2"]),
+    ("すべて1つの値", {"option1": "2020", "option2": "7"}, []),
+]
+
+
+def start_qgis():
+    """QGISを初期化して processing を返す(QGISが無い場合はNone)"""
+    try:
+        from qgis.core import QgsApplication
+    except ImportError:
+        return None
+    app = QgsApplication([], False)
+    app.initQgis()
+    from processing.core.Processing import Processing
+    Processing.initialize()
+    import processing
+    start_qgis.app = app
+    return processing
+
+
+def mesh_layer(meshcodes):
+    """create_mesh と同じメッシュのレイヤ('sptial')"""
+    from qgis.PyQt.QtCore import QVariant
+    from qgis.core import QgsVectorLayer, QgsField, QgsFeature, QgsGeometry, QgsRectangle, QgsPointXY
+
+    layer = QgsVectorLayer('Polygon?crs=epsg:4326', 'sptial', 'memory')
+    provider = layer.dataProvider()
+    provider.addAttributes([QgsField("meshcode", QVariant.String)])
+    layer.updateFields()
+    result = worldmesh.meshcode_to_latlong_grid_array(np.array(['20' + code for code in meshcodes]))
+    feats = []
+    for i, code in enumerate(meshcodes):
+        feat = QgsFeature()
+        feat.setGeometry(QgsGeometry.fromRect(QgsRectangle(QgsPointXY(result["long0"][i], result["lat0"][i]),
+                                                           QgsPointXY(result["long1"][i], result["lat1"][i]))))
+        feat.setAttributes([code])
+        feats.append(feat)
+    provider.addFeatures(feats)
+    layer.updateExtents()
+    return layer
+
+
+def processing_join(processing, layer1, layer2, alist, header):
+    """変更前の datajoin と同じ native:aggregate, joinattributestable による結合"""
+    if len(alist) != 0:
+        aggregate_list = []
+        for cnt, name in enumerate(header):
+            if name == "value":
+                m = {'aggregate': 'sum', 'delimiter': ',', 'input': '"value"', 'length': 0, 'name': 'value',
+                     'precision': 0, 'type': 6}
+            else:
+                m = {'aggregate': 'first_value', 'delimiter': ',', 'input': '"' + name + '"', 'length': 0,
+                     'name': name, 'precision': 0, 'type': 10}
+            aggregate_list.append(m)
+        layer2 = processing.run("native:aggregate", {'INPUT': layer2, 'GROUP_BY': '"meshcode"',
+                                                     'AGGREGATES': aggregate_list,
+                                                     'OUTPUT': 'TEMPORARY_OUTPUT'})["OUTPUT"]
+    return processing.run("native:joinattributestable", {'INPUT': layer1, 'FIELD': 'meshcode', 'INPUT_2': layer2,
+                                                         'FIELD_2': 'meshcode', 'FIELDS_TO_COPY': ["value"],
+                                                         'METHOD': 1, 'DISCARD_NONMATCHING': False, 'PREFIX': '',
+                                                         'OUTPUT': 'TEMPORARY_OUTPUT'})["OUTPUT"]
+
+
+def layer_values(layer):
+    values = {feat["meshcode"]: feat["value"] for feat in layer.getFeatures()}
+    return pd.Series({code: (np.nan if value is None or value != value else float(value))
+                      for code, value in values.items()}, dtype=np.float64)
+
+
+def main(rows=1000000, meshes=20000):
+    frame = make_frame(rows, meshes)
+    data = make_dataset(frame)
+    mesh_cube = cube.build(data)
+    processing = start_qgis()
+    print("{:,}行 {:,}メッシュ".format(rows, meshes))
+    for name, filters, alist in CASES:
+        start = time.perf_counter()
+        mask = None if len(alist) != 0 else data.mask(filters)
+        aggregated = mesh_cube.slice(filters) if len(alist) != 0 else None
+        joined, output = cube.join_rows(data, mask, alist, aggregated)
+        elapsed = time.perf_counter() - start
+        expected, expected_rows = reference_join(frame, filters, alist)
+        actual = pd.Series(joined.column("value"), index=joined.column("meshcode"))
+        same = actual.index.equals(expected.index) and np.allclose(actual, expected, equal_nan=True)
+        print("{}: join_rows {:.3f}秒 (参照実装と{})".format(name, elapsed, "一致" if same else "不一致"))
+        if processing is None:
+            continue
+
+        layer1 = mesh_layer(data.unique("meshcode", mask) if mask is not None else joined.unique("meshcode"))
+        layer2 = data.to_layer("csv", data.mask(filters))
+        start = time.perf_counter()
+        old = processing_join(processing, layer1, layer2, alist, data.header)
+        old_elapsed = time.perf_counter() - start
+        start = time.perf_counter()
+        joined, output = cube.join_rows(data, mask, alist, aggregated)
+        new = cube.join_layer(layer1, joined)
+        new_elapsed = time.perf_counter() - start
+        old_values = layer_values(old)
+        new_values = layer_values(new).reindex(old_values.index)
+        same = np.allclose(old_values, new_values, equal_nan=True)
+        print("  native:aggregate, joinattributestable {:.3f}秒 / join_rows, join_layer {:.3f}秒 (x{:.1f}, 結合した値は{})"
+              .format(old_elapsed, new_elapsed, old_elapsed / new_elapsed, "一致" if same else "不一致"))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeopleFlowVisualization
+                                 A QGIS plugin
+ This plugin visualize people flow
+                             -------------------
+        begin                : 2022-10-07
+        copyright            : (C) 2022 by MLIT
+        email                : trial@MILT
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ worldmesh の配列版の関数とスカラー版の関数の処理時間の比較
+
+ プラグインの親フォルダから次のように実行する
+
+   python -m <プラグインのフォルダ名>.test.benchmark_worldmesh [件数]
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from .. import worldmesh
+from .test_worldmesh import random_meshcodes
+
+# スカラー版を計測する件数の上限(残りは件数の比で推定する)
+SCALAR_LIMIT = 200000
+
+
+def measure(scalar, vector, count):
+    """(スカラー版の秒数(推定), 配列版の秒数)"""
+    start = time.perf_counter()
+    scalar(min(count, SCALAR_LIMIT))
+    scalar_elapsed = (time.perf_counter() - start) * count / min(count, SCALAR_LIMIT)
+    start = time.perf_counter()
+    vector(count)
+    return scalar_elapsed, time.perf_counter() - start
+
+
+def report(name, count, scalar_elapsed, vector_elapsed):
+    print("{}: {:,}件 スカラー版 {:.2f}秒 / 配列版 {:.3f}秒 ({:.1f}百万件/秒, x{:.0f})".format(
+        name, count, scalar_elapsed, vector_elapsed, count / vector_elapsed / 1e6, scalar_elapsed / vector_elapsed))
+
+
+def benchmark_grid(count):
+    for length, extension, name in ((10, False, "1km"), (13, False, "125m"), (16, True, "拡張1m")):
+        codes = random_meshcodes(length, extension, count)
+        array = np.array(codes).astype(np.int64)
+        elapsed = measure(lambda n: [worldmesh.meshcode_to_latlong_grid(code, extension) for code in codes[:n]],
+                          lambda n: worldmesh.meshcode_to_latlong_grid_array(array[:n], extension), count)
+        report("meshcode_to_latlong_grid " + name, count, *elapsed)
+
+
+def benchmark_encode(count):
+    rng = np.random.default_rng(0)
+    latitude = rng.uniform(20, 46, count)
+    longitude = rng.uniform(122, 154, count)
+    points = list(zip(latitude.tolist(), longitude.tolist()))
+    for level in (3, 6, "ex100m_12", "ex1m_16"):
+        func = worldmesh._MESHCODE_LEVELS[level][0]
+        elapsed = measure(lambda n: [func(lat, lon) for lat, lon in points[:n]],
+                          lambda n: worldmesh.cal_meshcode_array(latitude[:n], longitude[:n], level), count)
+        report("cal_meshcode_array " + str(level), count, *elapsed)
+
+
+def main(count=1000000):
+    benchmark_grid(count)
+    benchmark_encode(count)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:2]])
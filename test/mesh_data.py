@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeopleFlowVisualization
+                                 A QGIS plugin
+ This plugin visualize people flow
+                             -------------------
+        begin                : 2022-10-07
+        copyright            : (C) 2022 by MLIT
+        email                : trial@MILT
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ テスト・ベンチマーク用のメッシュ人流データと、QGISの処理(native:aggregate, joinattributestable)と同じ結合の参照実装
+"""
+
+import numpy as np
+import pandas as pd
+
+from .. import worldmesh
+from ..dataset import MESH, concat, encode, is_category
+
+HEADER = ["meshcode", "option1", "option2", "value"]
+
+
+def make_meshcodes(count, seed=0):
+    """関東周辺の1kmメッシュのコード(先頭の "20" を除いた8桁)を count 個作る"""
+    rng = np.random.default_rng(seed)
+    codes = set()
+    while len(codes) < count:
+        latitude = rng.uniform(34.5, 37.0, count)
+        longitude = rng.uniform(138.0, 141.0, count)
+        codes.update(str(code)[2:] for code in worldmesh.cal_meshcode_array(latitude, longitude, 3).tolist())
+    return sorted(codes)[:count]
+
+
+def make_frame(rows, meshes, seed=0):
+    """meshcode, option1(年), option2(月), value の DataFrame(同じメッシュ・項目の行を含み、value の一部は空)"""
+    rng = np.random.default_rng(seed)
+    meshcodes = np.asarray(make_meshcodes(meshes, seed), dtype=object)
+    frame = pd.DataFrame({
+        "meshcode": meshcodes[rng.integers(0, meshes, rows)],
+        "option1": rng.choice(np.array(["2019", "2020", "2021"], dtype=object), rows),
+        "option2": rng.choice(np.array([str(month) for month in range(1, 13)], dtype=object), rows),
+        "value": rng.integers(0, 1000, rows).astype(np.float64),
+    }, columns=HEADER)
+    frame.loc[rng.random(rows) < 0.01, "value"] = np.nan
+    return frame
+
+
+def make_dataset(frame):
+    """DataFrame を読み込み時と同じ形式の Dataset にする"""
+    chunk = {}
+    for name in HEADER:
+        values = frame[name].to_numpy()
+        chunk[name] = encode(values) if is_category(name) else values.astype(np.float64)
+    data = concat(MESH, HEADER, [chunk])
+    data.build_index()
+    return data
+
+
+def reference_join(frame, filters, alist):
+    """変更前の分析処理(001)と同じ結合結果を pandas で求める
+
+    抽出した行について、alist があれば native:aggregate(meshcode ごとに value は sum(空の値は除き、すべて空なら0)、
+    その他は first_value)、無ければ抽出した行をそのまま結合の対象とし、joinattributestable(METHOD=1)で
+    meshcode ごとに最初に一致した行の値を結合する。
+    戻り値は (meshcode をインデックスとした結合する value, result.csv の DataFrame)
+    """
+    selected = pd.Series(True, index=frame.index)
+    for name, value in filters.items():
+        values = value if isinstance(value, (list, tuple)) else [value]
+        selected &= frame[name].isin(values)
+    rows = frame[selected].reset_index(drop=True)
+    if len(alist) != 0:
+        first = rows.loc[~rows["meshcode"].duplicated()].set_index("meshcode")
+        first["value"] = rows.groupby("meshcode", sort=False)["value"].sum()
+        rows = first.reset_index()[HEADER]
+    # joinattributestable(METHOD=1)は meshcode ごとに最初に一致した行(空の値も含む)
+    joined = rows.loc[~rows["meshcode"].duplicated()].set_index("meshcode")["value"]
+    return joined, rows
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeopleFlowVisualization
+                                 A QGIS plugin
+ This plugin visualize people flow
+                             -------------------
+        begin                : 2022-10-07
+        copyright            : (C) 2022 by MLIT
+        email                : trial@MILT
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ 読み込み済みのデータへの追加(Dataset.append, staging.append)のテスト
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from .. import staging
+from ..dataset import MAX_BITMAP_VALUES, already_loaded
+from .mesh_data import HEADER, make_dataset, make_frame
+
+
+def make_pair(rows=1003, delta_rows=517):
+    """読み込み済みのデータと、途中・末尾に並ぶ新しい値を含む追加分の DataFrame"""
+    base = make_frame(rows, 40, 0)
+    delta = make_frame(delta_rows, 40, 1)
+    delta.loc[delta.index[::7], "option1"] = "2018"
+    delta.loc[delta.index[::11], "option1"] = "2022"
+    return base, delta
+
+
+class AppendTest(unittest.TestCase):
+
+    def make_data(self, frame, key):
+        data = make_dataset(frame)
+        data.fingerprint = key
+        return data
+
+    def test_same_as_full_encoding(self):
+        # 追加分だけを変換・索引付けしても、全行をまとめて読み込んだ場合と同じになる
+        for rows, delta_rows in [(1003, 517), (1000, 8), (5, 3)]:
+            base, delta = make_pair(rows, delta_rows)
+            appended = self.make_data(base, "a").append(self.make_data(delta, "b"))
+            expected = make_dataset(pd.concat([base, delta], ignore_index=True))
+            self.assertEqual(len(appended), len(expected))
+            for name in HEADER:
+                if name in expected.categories:
+                    self.assertEqual(list(appended.categories[name]), list(expected.categories[name]))
+                np.testing.assert_array_equal(appended.columns[name], expected.columns[name])
+            self.assertEqual(sorted(appended.bitmaps), sorted(expected.bitmaps))
+            for name in expected.bitmaps:
+                np.testing.assert_array_equal(appended.bitmaps[name], expected.bitmaps[name])
+            for filters in [{"option1": "2018"}, {"option1": "2022", "option2": "3"}, {"option1": "2020"}]:
+                np.testing.assert_array_equal(appended.mask(filters), expected.mask(filters))
+
+    def test_append_twice(self):
+        # 続けて追加しても、途中まで使われているビットマップの最後のバイトが正しくつながる
+        frames = [make_frame(rows, 30, seed) for seed, rows in enumerate([13, 21, 6])]
+        data = self.make_data(frames[0], "a").append(self.make_data(frames[1], "b")).append(self.make_data(frames[2], "c"))
+        expected = make_dataset(pd.concat(frames, ignore_index=True))
+        for name in expected.bitmaps:
+            np.testing.assert_array_equal(data.bitmaps[name], expected.bitmaps[name])
+        self.assertEqual(data.sources, ["a", "b", "c"])
+
+    def test_too_many_values_for_bitmap(self):
+        # 追加で値の種類が上限を超えた項目は索引を作らない
+        base, delta = make_pair()
+        delta["option2"] = [str(i % (MAX_BITMAP_VALUES + 10)) for i in range(len(delta))]
+        appended = self.make_data(base, "a").append(self.make_data(delta, "b"))
+        self.assertNotIn("option2", appended.bitmaps)
+        self.assertIn("option1", appended.bitmaps)
+        expected = make_dataset(pd.concat([base, delta], ignore_index=True))
+        np.testing.assert_array_equal(appended.mask({"option2": "7"}), expected.mask({"option2": "7"}))
+
+    def test_reject_duplicate(self):
+        # 読み込み済みのファイルは追加できない
+        base, delta = make_pair()
+        data = self.make_data(base, "a").append(self.make_data(delta, "b"))
+        self.assertTrue(already_loaded(data, self.make_data(delta, "b")))
+        self.assertFalse(already_loaded(data, self.make_data(delta, "c")))
+        with self.assertRaises(ValueError):
+            data.append(self.make_data(base, "a"))
+
+
+class StagedAppendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        original = staging.STAGING_DIR
+        staging.STAGING_DIR = os.path.join(self.dir, "staging")
+        self.addCleanup(setattr, staging, "STAGING_DIR", original)
+        self.addCleanup(shutil.rmtree, self.dir, True)
+
+    def test_append_to_staged(self):
+        # 一時保存したデータへの追加は、追加分の行だけを複製したファイルに書き込む
+        base, delta = make_pair()
+        base_data = make_dataset(base)
+        base_data.fingerprint = "a"
+        delta_data = make_dataset(delta)
+        delta_data.fingerprint = "b"
+        staged = staging.stage_dataset(base_data)
+        appended = staging.append(staged, delta_data)
+        self.assertNotEqual(appended.path, staged.path)
+        self.assertTrue(os.path.exists(staged.path))
+        self.assertEqual(len(appended), len(base) + len(delta))
+        expected = pd.concat([base, delta], ignore_index=True)
+        frame = appended.to_frame(columns=HEADER)
+        pd.testing.assert_frame_equal(frame.reset_index(drop=True), expected, check_dtype=False)
+        self.assertEqual(appended.unique("option1"), sorted(expected["option1"].unique()))
+        self.assertEqual(appended.sources, ["a", "b"])
+        with self.assertRaises(ValueError):
+            staging.append(appended, delta_data)
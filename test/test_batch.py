@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeopleFlowVisualization
+                                 A QGIS plugin
+ This plugin visualize people flow
+                             -------------------
+        begin                : 2022-10-07
+        copyright            : (C) 2022 by MLIT
+        email                : trial@MILT
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ 一括出力(batch)の組み合わせ・出力ファイル名のテスト
+"""
+
+import unittest
+
+from .. import batch
+from .mesh_data import make_dataset, make_frame
+
+
+class CombinationsTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.data = make_dataset(make_frame(2000, 50, seed=4))
+
+    def test_split_multiple_values_and_ranges(self):
+        # 複数の値・範囲は該当する値ごとに分け、1つの値は固定、ALLは絞り込まない
+        jobs = batch.combinations(self.data, ["2019,2021", "10～12"])
+        self.assertEqual(len(jobs), 6)
+        self.assertEqual(jobs[0], {"option1": "2019", "option2": "10"})
+        self.assertEqual(jobs[-1], {"option1": "2021", "option2": "12"})
+        self.assertEqual(batch.combinations(self.data, ["2020", "ALL"]), [{"option1": "2020"}])
+        self.assertEqual(batch.combinations(self.data, ["ALL", "ALL"]), [{}])
+
+    def test_no_matching_value(self):
+        self.assertEqual(batch.combinations(self.data, ["1999,1998", "ALL"]), [])
+
+    def test_filter_texts(self):
+        # 組み合わせは分析処理に渡すプルダウンの入力に戻す(ALLの項目はそのまま)
+        jobs = batch.combinations(self.data, ["2019,2021", "ALL"])
+        self.assertEqual([batch.filter_texts(["2019,2021", "ALL"], filters) for filters in jobs],
+                         [["2019", "ALL"], ["2021", "ALL"]])
+
+
+class ReportNameTest(unittest.TestCase):
+
+    def test_name(self):
+        used = set()
+        self.assertEqual(batch.report_name("002", {"option2": "平日", "option1": "2020/4"}, used),
+                         "002_2020-4_平日.html")
+        self.assertEqual(batch.report_name("001", {}, used), "001.html")
+
+    def test_collision(self):
+        # 置き換えで同じ名前になる組み合わせは上書きせず、番号を付ける
+        used = set()
+        names = [batch.report_name("001", {"option1": value}, used) for value in ["a/b", "a:b", "A-B", "a-b_2"]]
+        self.assertEqual(names, ["001_a-b.html", "001_a-b_2.html", "001_A-B_3.html", "001_a-b_2_2.html"])
+        self.assertEqual(len(set(name.lower() for name in names)), len(names))
+
+
+if __name__ == "__main__":
+    unittest.main()
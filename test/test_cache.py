@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeopleFlowVisualization
+                                 A QGIS plugin
+ This plugin visualize people flow
+                             -------------------
+        begin                : 2022-10-07
+        copyright            : (C) 2022 by MLIT
+        email                : trial@MILT
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ 読み込み済みデータのキャッシュ(cache)のテスト
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from unittest import mock
+
+import numpy as np
+
+from .. import cache
+from .mesh_data import make_dataset, make_frame
+
+
+class CacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        original = cache.CACHE_DIR
+        cache.CACHE_DIR = os.path.join(self.dir, "cache")
+        self.addCleanup(setattr, cache, "CACHE_DIR", original)
+        self.addCleanup(shutil.rmtree, self.dir, True)
+        self.data = make_dataset(make_frame(500, 20, seed=2))
+
+    def test_save_and_load(self):
+        cache.save("key1", self.data)
+        loaded = cache.load("key1")
+        self.assertEqual(loaded.fingerprint, "key1")
+        self.assertEqual(loaded.header, self.data.header)
+        for name in self.data.header:
+            np.testing.assert_array_equal(loaded.column(name), self.data.column(name))
+        self.assertIsNone(cache.load("key2"))
+
+    def test_failed_save_is_logged_and_cleaned_up(self):
+        # 保存に失敗しても例外にせず、ログに出力して書きかけのフォルダを削除する
+        with mock.patch.object(cache, "log_warning") as log, \
+                mock.patch.object(cache.np, "save", side_effect=OSError("disk full")):
+            cache.save("key1", self.data)
+        log.assert_called_once()
+        self.assertIn("disk full", log.call_args[0][0])
+        self.assertEqual(os.listdir(cache.CACHE_DIR), [])
+        self.assertIsNone(cache.load("key1"))
+
+    def test_user_cache_dir_is_outside_the_plugin(self):
+        plugin_dir = os.path.dirname(os.path.abspath(cache.__file__))
+        path = os.path.abspath(cache.user_cache_dir("cache"))
+        self.assertFalse(path.startswith(plugin_dir + os.sep))
+        self.assertEqual(os.path.basename(path), "cache")
+
+
+if __name__ == "__main__":
+    unittest.main()
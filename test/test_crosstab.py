@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeopleFlowVisualization
+                                 A QGIS plugin
+ This plugin visualize people flow
+                             -------------------
+        begin                : 2022-10-07
+        copyright            : (C) 2022 by MLIT
+        email                : trial@MILT
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ 移動滞在ログデータ(003)の集計表(dataset.od_crosstab)が変更前の pd.crosstab と同じ値になることのテスト
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from .. import staging
+from ..dataset import OD, Dataset, od_crosstab
+
+HEADER = ["time_o", "time_d", "origin", "destination", "value"]
+
+
+def make_od_dataset(rows, areas, seed=0):
+    """エリア数 areas の移動滞在ログデータ(同じエリアへの移動・空の value を含む)"""
+    rng = np.random.default_rng(seed)
+    names = np.array(["エリア{}".format(i) for i in range(areas)], dtype=object)
+    values = rng.integers(1, 100, rows).astype(np.float64)
+    values[rng.random(rows) < 0.02] = np.nan
+    columns = {
+        "time_o": np.full(rows, "2022-10-01 10:00:00", dtype=object),
+        "time_d": np.full(rows, "2022-10-01 11:00:00", dtype=object),
+        "origin": names[rng.integers(0, areas, rows)],
+        "destination": names[rng.integers(0, areas, rows)],
+        "value": values,
+    }
+    return Dataset(OD, HEADER, columns)
+
+
+def reference_crosstab(frame):
+    """変更前の do_crosstab の集計(pd.crosstab)"""
+    cross1 = pd.crosstab(frame["origin"], frame["destination"], frame["value"], aggfunc="sum")
+    moved = frame[frame["origin"] != frame["destination"]]
+    if len(moved) == 0:
+        return cross1, None, None
+    cross3 = pd.crosstab(moved["origin"], moved["destination"], moved["value"], aggfunc="sum", normalize="index")
+    cross4 = pd.crosstab(moved["destination"], moved["origin"], moved["value"], aggfunc="sum", normalize="index")
+    return cross1, cross3, cross4
+
+
+class OdCrosstabTest(unittest.TestCase):
+
+    def assert_same_cells(self, actual, expected):
+        # do_crosstab は表[列][行] で値を取り出すため、行・列の並びではなく各セルの値を比べる
+        expected = expected.reindex(index=actual.index, columns=actual.columns)
+        self.assertEqual(sorted(actual.index), sorted(expected.index))
+        self.assertEqual(sorted(actual.columns), sorted(expected.columns))
+        np.testing.assert_allclose(actual.to_numpy(dtype=np.float64), expected.to_numpy(dtype=np.float64),
+                                   rtol=1e-12, equal_nan=True)
+
+    def assert_same_tables(self, data, mask=None):
+        tables = od_crosstab(data.aggregate(["origin", "destination"], "sum", mask))
+        expected = reference_crosstab(data.to_frame(mask))
+        for actual, table in zip(tables, expected):
+            if table is None:
+                self.assertIsNone(actual)
+            else:
+                self.assert_same_cells(actual, table)
+
+    def test_same_as_crosstab(self):
+        data = make_od_dataset(5000, 12, seed=1)
+        self.assert_same_tables(data)
+        self.assert_same_tables(data, data.column("origin") != "エリア3")
+
+    def test_only_same_area(self):
+        # 同じエリアへの移動のみの場合は割合の表を作らない
+        data = make_od_dataset(200, 4, seed=2)
+        self.assert_same_tables(data, data.column("origin") == data.column("destination"))
+
+    def test_staged_dataset(self):
+        # 一時保存したデータ(SQLでの集計)でも同じ表になる
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        original = staging.STAGING_DIR
+        staging.STAGING_DIR = os.path.join(directory, "staging")
+        self.addCleanup(setattr, staging, "STAGING_DIR", original)
+
+        data = make_od_dataset(3000, 8, seed=3)
+        staged = staging.stage_dataset(data)
+        tables = od_crosstab(staged.aggregate(["origin", "destination"], "sum"))
+        for actual, table in zip(tables, reference_crosstab(data.to_frame())):
+            self.assert_same_cells(actual, table)
+
+
+if __name__ == "__main__":
+    unittest.main()
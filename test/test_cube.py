@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeopleFlowVisualization
+                                 A QGIS plugin
+ This plugin visualize people flow
+                             -------------------
+        begin                : 2022-10-07
+        copyright            : (C) 2022 by MLIT
+        email                : trial@MILT
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ メッシュ人流データの集計キューブ(cube.MeshCube)のテスト
+"""
+
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from .. import cube
+from .mesh_data import HEADER, make_dataset, make_frame
+
+
+class MeshCubeTest(unittest.TestCase):
+
+    def assert_same_rows(self, actual, expected):
+        frame = actual.to_frame()
+        other = expected.to_frame()
+        self.assertEqual(frame[HEADER[:-1]].values.tolist(), other[HEADER[:-1]].values.tolist())
+        np.testing.assert_allclose(frame["value"].to_numpy(), other["value"].to_numpy(), rtol=1e-12)
+
+    def test_append_same_as_rebuild(self):
+        # 追加分のみ集計して結合した結果が、結合したデータ全体を集計し直した結果と同じになる
+        frame = make_frame(20000, 400, seed=2)
+        base = frame.iloc[:15000].reset_index(drop=True)
+        # 追加分には既存の組み合わせと新しい値(2022年・新しいメッシュ)を含める
+        delta = frame.iloc[15000:].reset_index(drop=True)
+        delta.loc[delta.index[::7], "option1"] = "2022"
+        delta.loc[delta.index[::11], "meshcode"] = "99999999"
+        base_data = make_dataset(base)
+        delta_data = make_dataset(delta)
+
+        appended = cube.build(base_data).append(cube.build(delta_data))
+        rebuilt = cube.build(base_data.append(delta_data))
+        self.assert_same_rows(appended.data, rebuilt.data)
+        for filters in ({}, {"option1": "2022"}, {"option1": "2020", "option2": "5"}):
+            self.assert_same_rows(appended.slice(filters), rebuilt.slice(filters))
+
+    def test_slice_sums_values(self):
+        frame = make_frame(5000, 100, seed=3)
+        mesh_cube = cube.build(make_dataset(frame))
+        rows = mesh_cube.slice({"option2": "12"})
+        selected = frame[frame["option2"] == "12"]
+        expected = selected.groupby("meshcode", sort=False)["value"].sum()
+        actual = pd.Series(rows.column("value"), index=rows.column("meshcode"))
+        self.assertEqual(actual.index.tolist(), expected.index.tolist())
+        np.testing.assert_allclose(actual.to_numpy(), expected.to_numpy(), rtol=1e-12)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeopleFlowVisualization
+                                 A QGIS plugin
+ This plugin visualize people flow
+                             -------------------
+        begin                : 2022-10-07
+        copyright            : (C) 2022 by MLIT
+        email                : trial@MILT
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ プルダウンの抽出条件(parse_filter, Condition)のテスト
+"""
+
+import unittest
+
+import numpy as np
+
+from ..dataset import Condition, parse_filter
+from .mesh_data import make_dataset, make_frame
+
+
+class ParseFilterTest(unittest.TestCase):
+
+    def test_all(self):
+        for text in ["ALL", "", "  ", " ALL "]:
+            self.assertIsNone(parse_filter(text))
+
+    def test_single_value(self):
+        self.assertEqual(parse_filter(" 2020 "), "2020")
+
+    def test_values(self):
+        for text in ["2019,2021", "2019、2021", " 2019 , 2021 ,"]:
+            with self.subTest(text=text):
+                condition = parse_filter(text)
+                self.assertIsInstance(condition, Condition)
+                self.assertEqual(condition.values, ["2019", "2021"])
+
+    def test_ranges(self):
+        for text, low, high in [("2019～2020", "2019", "2020"), ("2019~2020", "2019", "2020"),
+                                ("2019 ~", "2019", ""), ("～2020", "", "2020")]:
+            with self.subTest(text=text):
+                condition = parse_filter(text)
+                self.assertIsNone(condition.values)
+                self.assertEqual((condition.low, condition.high), (low, high))
+
+
+class ConditionSelectTest(unittest.TestCase):
+
+    def test_values(self):
+        # 候補の順で、候補にある値のみ
+        self.assertEqual(parse_filter("2021,2019,1999").select(["2019", "2020", "2021"]), ["2019", "2021"])
+
+    def test_numeric_range(self):
+        # 範囲が数値の場合は数値として比較し、数値でない値は該当しない
+        candidates = ["9", "10", "100", "2", "x"]
+        self.assertEqual(parse_filter("9～10").select(candidates), ["9", "10"])
+        self.assertEqual(parse_filter("10～").select(candidates), ["10", "100"])
+        self.assertEqual(parse_filter("～9").select(candidates), ["9", "2"])
+
+    def test_text_range(self):
+        self.assertEqual(parse_filter("b～d").select(["a", "b", "c", "d", "e"]), ["b", "c", "d"])
+
+    def test_value_with_separator(self):
+        # 区切り文字を含む値そのものが候補にあれば、その値を選ぶ
+        self.assertEqual(parse_filter("A,B").select(["A", "B", "A,B"]), ["A,B"])
+        self.assertEqual(parse_filter("1~2").select(["1", "1~2", "2"]), ["1~2"])
+
+    def test_mask(self):
+        frame = make_frame(500, 20, seed=3)
+        data = make_dataset(frame)
+        month = frame["option2"].astype(int)
+        mask = data.mask({"option2": parse_filter("3～5"), "option1": parse_filter("2019、2021")})
+        expected = month.between(3, 5) & frame["option1"].isin(["2019", "2021"])
+        np.testing.assert_array_equal(mask, expected.to_numpy())
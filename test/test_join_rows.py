@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeopleFlowVisualization
+                                 A QGIS plugin
+ This plugin visualize people flow
+                             -------------------
+        begin                : 2022-10-07
+        copyright            : (C) 2022 by MLIT
+        email                : trial@MILT
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ 分析処理(001)の集計・結合(cube.join_rows)が変更前の native:aggregate, joinattributestable と同じ結果になることのテスト
+"""
+
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from .. import cube
+from .mesh_data import HEADER, make_dataset, make_frame, reference_join
+
+
+class JoinRowsTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.frame = make_frame(20000, 500, seed=1)
+        cls.data = make_dataset(cls.frame)
+        cls.cube = cube.build(cls.data)
+
+    def assert_joined(self, joined, expected):
+        actual = pd.Series(joined.column("value"), index=joined.column("meshcode"))
+        self.assertEqual(actual.index.tolist(), expected.index.tolist())
+        np.testing.assert_allclose(actual.to_numpy(), expected.to_numpy(), rtol=1e-12)
+
+    def assert_rows(self, rows, expected):
+        frame = rows.to_frame()
+        self.assertEqual(frame[HEADER[:-1]].values.tolist(), expected[HEADER[:-1]].values.tolist())
+        np.testing.assert_allclose(frame["value"].to_numpy(), expected["value"].to_numpy(), rtol=1e-12)
+
+    def test_all_single_values(self):
+        # すべての項目を1つの値に絞り込んだ場合は、最初に一致した行を結合し、抽出した行をそのまま出力する
+        filters = {"option1": "2020", "option2": "7"}
+        mask = self.data.mask(filters)
+        joined, rows = cube.join_rows(self.data, mask, [])
+        expected_joined, expected_rows = reference_join(self.frame, filters, [])
+        self.assertIsNone(rows)
+        self.assert_joined(joined, expected_joined)
+        self.assert_rows(self.data.take(mask), expected_rows)
+
+    def test_all_values(self):
+        # ALLの項目がある場合は、meshcode ごとに合計した行を結合・出力する
+        filters = {"option1": "2021"}
+        mask = self.data.mask(filters)
+        joined, rows = cube.join_rows(self.data, mask, ["option2"])
+        expected_joined, expected_rows = reference_join(self.frame, filters, ["option2"])
+        self.assert_joined(joined, expected_joined)
+        self.assert_rows(rows, expected_rows)
+
+    def test_all_values_from_cube(self):
+        # 集計キューブから求めた合計も同じ結果になる(合計の順序の違いによる誤差のみ)
+        filters = {"option2": "3"}
+        aggregated = self.cube.slice(filters)
+        joined, rows = cube.join_rows(self.data, None, ["option1"], aggregated)
+        expected_joined, expected_rows = reference_join(self.frame, filters, ["option1"])
+        self.assert_joined(joined, expected_joined)
+        self.assert_rows(rows, expected_rows)
+
+    def test_no_filters(self):
+        joined, rows = cube.join_rows(self.data, None, ["option1", "option2"], self.cube.slice({}))
+        expected_joined, expected_rows = reference_join(self.frame, {}, ["option1", "option2"])
+        self.assert_joined(joined, expected_joined)
+        self.assert_rows(rows, expected_rows)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,318 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeopleFlowVisualization
+                                 A QGIS plugin
+ This plugin visualize people flow
+                             -------------------
+        begin                : 2022-10-07
+        copyright            : (C) 2022 by MLIT
+        email                : trial@MILT
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ 読み込み(loader)のテスト
+"""
+
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+import numpy as np
+
+from unittest import mock
+
+from .. import loader, parallel
+from ..dataset import MESH
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+
+class LoaderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def path(self, name):
+        return os.path.join(self.dir, name)
+
+
+@unittest.skipIf(loader.pq is None, "pyarrow がインストールされていません")
+class ReadColumnarTest(LoaderTestCase):
+
+    def write_parquet(self, name, columns):
+        path = self.path(name)
+        loader.pq.write_table(pa.table(columns), path)
+        return path
+
+    def test_read_parquet(self):
+        path = self.write_parquet("mesh.parquet", {
+            "meshcode": ["53393599", "53393600", "53393599"],
+            "option1": [2019, 2020, 2019],
+            "value": [1.5, 2.0, 3.0],
+        })
+        data, stats = loader.read_columnar(path, MESH)
+        self.assertEqual(stats.rows, 3)
+        self.assertEqual(data.header, ["meshcode", "option1", "value"])
+        self.assertEqual(list(data.column("meshcode")), ["53393599", "53393600", "53393599"])
+        self.assertEqual(list(data.column("option1")), ["2019", "2020", "2019"])
+        np.testing.assert_array_equal(data.column("value"), [1.5, 2.0, 3.0])
+
+    def test_nulls(self):
+        # 値の無いセルは数値の列ではNaN、文字列の列では空文字(CSVの空欄と同じ扱い)
+        path = self.write_parquet("nulls.parquet", {
+            "meshcode": ["53393599", None, "53393601"],
+            "option1": ["a", "b", None],
+            "value": [1.0, None, 3.0],
+        })
+        data, stats = loader.read_columnar(path, MESH)
+        self.assertEqual(list(data.column("meshcode")), ["53393599", "", "53393601"])
+        self.assertEqual(list(data.column("option1")), ["a", "b", ""])
+        values = data.column("value")
+        self.assertEqual(values.dtype, np.float64)
+        self.assertTrue(np.isnan(values[1]))
+        self.assertEqual(values[2], 3.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+
+class EncodingTest(LoaderTestCase):
+
+    JAPANESE = "meshcode,option1,value\n" + "".join(
+        "5339{:04d},東京都千代田区の人流データ{},{}\n".format(row, row, row) for row in range(200))
+
+    def write_bytes(self, name, content):
+        path = self.path(name)
+        with open(path, mode="wb") as f:
+            f.write(content)
+        return path
+
+    def detect(self, content):
+        with open(self.write_bytes("sniff.csv", content), mode="rb") as f:
+            return loader.sniff_encoding(f, len(content))
+
+    def test_sniff(self):
+        self.assertEqual(self.detect(self.JAPANESE.encode("utf-8")), "utf-8")
+        self.assertEqual(self.detect(self.JAPANESE.encode("utf-8-sig")), "utf-8-sig")
+        self.assertEqual(self.detect(self.JAPANESE.encode("cp932")), "cp932")
+        # ASCIIのみのファイルは変更前と同じくcp932で読む
+        self.assertEqual(self.detect(b"meshcode,option1,value\n53393599,2020,1\n"), "cp932")
+
+    def test_sniff_tail(self):
+        # 先頭で確定しない場合は末尾も判定する(先頭はASCIIのみ、日本語は末尾のみ)
+        content = ("meshcode,option1,value\n" + "53393599,2020,1\n" * 200).encode("ascii") + \
+            self.JAPANESE.encode("utf-8")[-2000:]
+        with mock.patch.object(loader, "SNIFF_BYTES", 256), mock.patch.object(loader, "SNIFF_MAX_BYTES", 1024):
+            self.assertEqual(self.detect(content), "utf-8")
+            with open(self.write_bytes("head.csv", content), mode="rb") as f:
+                self.assertEqual(loader.sniff_encoding(f), "cp932")
+
+    def test_detect_once_per_file(self):
+        # 同じファイルは判定結果を再利用し、更新されたファイルは判定し直す
+        path = self.write_bytes("mesh.csv", self.JAPANESE.encode("utf-8"))
+        with mock.patch.object(loader, "sniff_encoding", wraps=loader.sniff_encoding) as sniff:
+            self.assertEqual(loader.detect_encoding(path), "utf-8")
+            self.assertEqual(loader.detect_encoding(path), "utf-8")
+            self.assertEqual(sniff.call_count, 1)
+            self.write_bytes("mesh.csv", self.JAPANESE.encode("cp932"))
+            os.utime(path, ns=(0, 0))
+            self.assertEqual(loader.detect_encoding(path), "cp932")
+            self.assertEqual(sniff.call_count, 2)
+
+
+class LoadMeshCsvTest(LoaderTestCase):
+
+    def write_text(self, name, text, encoding="utf-8"):
+        path = self.path(name)
+        with open(path, mode="w", encoding=encoding, newline="") as f:
+            f.write(text)
+        return path
+
+    def test_types(self):
+        # 数値の項目は変換できない値・空欄をNaNにし、その他の項目は文字列のまま読む
+        path = self.write_text("mesh.csv", "meshcode,option1,value\n53393599,2020,1.5\n53393600,,\n0533,x,abc\n")
+        data, meshcode_list, stats = loader.load_mesh_csv(path)
+        self.assertEqual(stats.rows, 3)
+        self.assertEqual(list(data.column("meshcode")), ["53393599", "53393600", "0533"])
+        self.assertEqual(list(data.column("option1")), ["2020", "", "x"])
+        np.testing.assert_array_equal(data.column("value"), [1.5, np.nan, np.nan])
+        self.assertEqual(sorted(meshcode_list), ["0533", "53393599", "53393600"])
+
+    def test_chunked_read(self):
+        # 行のまとまりごとに読んでも同じ結果になり、まとまりごとに進捗を通知する
+        text = "meshcode,option1,value\n" + "".join(
+            "5339{:04d},{},{}\n".format(row % 37, 2019 + row % 3, row) for row in range(250))
+        path = self.write_text("mesh.csv", text)
+        whole, meshcode_list, stats = loader.load_mesh_csv(path)
+        calls = []
+        with mock.patch.object(loader, "CHUNK_ROWS", 40):
+            chunked, meshcode_list, stats = loader.load_mesh_csv(path, lambda *values: calls.append(values))
+        for name in whole.header:
+            np.testing.assert_array_equal(chunked.column(name), whole.column(name))
+        self.assertEqual([values[2] for values in calls], [40, 80, 120, 160, 200, 240, 250])
+        self.assertEqual(calls[-1][:2], (os.path.getsize(path), os.path.getsize(path)))
+
+    def test_header_and_empty(self):
+        path = self.write_text("mesh.csv", "code,option1,value\n53393599,2020,1\n")
+        with self.assertRaises(loader.LoadError):
+            loader.load_mesh_csv(path)
+        path = self.write_text("empty.csv", "meshcode,option1,value\n")
+        with self.assertRaises(loader.LoadError):
+            loader.load_mesh_csv(path)
+
+    def test_field_count(self):
+        path = self.write_text("mesh.csv", "meshcode,option1,value\n53393599,2020,1,extra\n")
+        with self.assertRaises(loader.LoadError):
+            loader.load_mesh_csv(path)
+
+
+class CompressedInputTest(LoaderTestCase):
+
+    TEXT = "meshcode,option1,value\n" + "".join(
+        "5339{:04d},{},{}\n".format(row % 50, 2019 + row % 3, row) for row in range(300))
+
+    def write_gzip(self):
+        path = self.path("mesh.csv.gz")
+        with gzip.open(path, mode="wb") as f:
+            f.write(self.TEXT.encode("utf-8"))
+        return path
+
+    def write_zip(self, names):
+        path = self.path("mesh.zip")
+        with zipfile.ZipFile(path, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for name in names:
+                archive.writestr(name, self.TEXT)
+        return path
+
+    def assert_same_as_csv(self, path):
+        plain = self.path("mesh.csv")
+        with open(plain, mode="w", encoding="utf-8", newline="") as f:
+            f.write(self.TEXT)
+        expected, meshcode_list, stats = loader.load_mesh_csv(plain)
+        calls = []
+        data, meshcode_list, stats = loader.load_mesh_csv(path, lambda *values: calls.append(values))
+        for name in expected.header:
+            np.testing.assert_array_equal(data.column(name), expected.column(name))
+        # 進捗は圧縮後のファイルの読み込み位置で求める
+        self.assertEqual(calls[-1][1], os.path.getsize(path))
+        self.assertLessEqual(calls[-1][0], os.path.getsize(path))
+
+    def test_format(self):
+        self.assertEqual(loader.file_format("a.csv.gz"), "csv")
+        self.assertEqual(loader.file_format("a.zip"), "csv")
+        self.assertEqual(loader.file_format("a.parquet"), "parquet")
+        self.assertEqual(loader.compression("a.CSV.GZ"), "gzip")
+        self.assertIsNone(loader.compression("a.csv"))
+
+    def test_gzip(self):
+        path = self.write_gzip()
+        self.assertEqual(loader.read_header(path, "utf-8"), ["meshcode", "option1", "value"])
+        self.assert_same_as_csv(path)
+
+    def test_zip(self):
+        path = self.write_zip(["data/mesh.csv"])
+        self.assertEqual(loader.detect_encoding(path), "cp932")
+        self.assert_same_as_csv(path)
+
+    def test_zip_with_several_files(self):
+        path = self.write_zip(["mesh1.csv", "mesh2.csv"])
+        with self.assertRaises(loader.LoadError):
+            loader.read_header(path)
+
+    @unittest.skipIf(loader.zstandard is not None, "zstandard がインストールされています")
+    def test_zstd_without_zstandard(self):
+        path = self.path("mesh.csv.zst")
+        with open(path, mode="wb") as f:
+            f.write(b"\x28\xb5\x2f\xfd")
+        with self.assertRaises(loader.LoadError):
+            loader.read_header(path)
+
+    def test_preview_reads_head_only(self):
+        # 圧縮ファイルのプレビューは先頭の行のみ使う
+        path = self.write_gzip()
+        data, stats = loader.read_preview(path, MESH, "utf-8", rows=25)
+        self.assertEqual(len(data), 25)
+        self.assertIsNone(stats.estimated_rows)
+
+
+class ReadPreviewTest(LoaderTestCase):
+
+    def write_csv(self, name, content):
+        path = self.path(name)
+        with open(path, mode="wb") as f:
+            f.write(content)
+        return path
+
+    def test_invalid_bytes(self):
+        # 文字コードで変換できない行は置き換えずにエラーにする
+        path = self.write_csv("mesh.csv", b"meshcode,option1,value\n53393599,a\xff,1\n")
+        with self.assertRaises(loader.LoadError) as raised:
+            loader.read_preview(path, MESH, "utf-8")
+        self.assertIn("utf-8", raised.exception.message)
+
+    def test_preview_each_file(self):
+        # 複数のファイルは各ファイルから行を選んでまとめる
+        paths = [self.write_csv("mesh{}.csv".format(i), ("meshcode,option1,value\n" + "".join(
+            "5339{}{:03d},2020,{}\n".format(i, row, row) for row in range(50))).encode("ascii")) for i in range(3)]
+        data, meshcode_list, stats = loader.preview_mesh_files(paths)
+        self.assertTrue(stats.preview)
+        self.assertEqual(len(data), 150)
+        self.assertEqual(sorted(set(code[4] for code in meshcode_list)), ["0", "1", "2"])
+        self.assertAlmostEqual(stats.estimated_rows, 150, delta=15)
+
+    def test_preview_header_mismatch(self):
+        paths = [self.write_csv("mesh1.csv", b"meshcode,option1,value\n53393599,2020,1\n"),
+                 self.write_csv("mesh2.csv", b"meshcode,option2,value\n53393599,2020,1\n")]
+        with self.assertRaises(loader.LoadError) as raised:
+            loader.preview_mesh_files(paths)
+        self.assertIn("mesh2.csv", raised.exception.message)
+
+    def test_should_preview_total_size(self):
+        paths = [self.write_csv("a.csv", b"0" * 60), self.write_csv("b.csv", b"0" * 60)]
+        original = loader.PREVIEW_MIN_BYTES
+        loader.PREVIEW_MIN_BYTES = 100
+        self.addCleanup(setattr, loader, "PREVIEW_MIN_BYTES", original)
+        self.assertFalse(loader.should_preview(paths[0]))
+        self.assertTrue(loader.should_preview(paths))
+
+
+class LoadMeshFilesTest(LoaderTestCase):
+
+    def test_progress_per_chunk(self):
+        # 複数のファイルの進捗は行のまとまりごとに、全ファイルの合計で通知する
+        paths = []
+        for i in range(2):
+            path = self.path("mesh{}.csv".format(i))
+            with open(path, mode="w", encoding="utf-8") as f:
+                f.write("meshcode,option1,value\n")
+                f.writelines("5339{}{:03d},2020,{}\n".format(i, row, row) for row in range(100))
+            paths.append(path)
+        calls = []
+        with mock.patch.object(loader, "CHUNK_ROWS", 30), \
+                mock.patch.object(loader.cache, "save"), \
+                mock.patch.object(parallel, "python_executable", return_value=None):
+            data, meshcode_list, stats = loader.load_mesh_files(paths, lambda *values: calls.append(values))
+        self.assertEqual(len(data), 200)
+        self.assertEqual(stats.rows, 200)
+        total = sum(os.path.getsize(path) for path in paths)
+        self.assertGreater(len(calls), 2)
+        self.assertEqual(calls[-1], (total, total, 200))
+        self.assertEqual([values[0] for values in calls], sorted(values[0] for values in calls))
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeopleFlowVisualization
+                                 A QGIS plugin
+ This plugin visualize people flow
+                             -------------------
+        begin                : 2022-10-07
+        copyright            : (C) 2022 by MLIT
+        email                : trial@MILT
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ ログデータ(003-2)の timestamp の変換と移動の区間のテスト
+"""
+
+import os
+import time
+import unittest
+
+import numpy as np
+import pandas as pd
+from dateutil import tz
+
+from ..dataset import INVALID_EPOCH_MS, log_segments, parse_timestamps
+
+
+def epoch_ms(text):
+    return int(pd.Timestamp(text).value // 1000000)
+
+
+class ParseTimestampsTest(unittest.TestCase):
+
+    def test_zones(self):
+        # " UTC"・時差の指定はその時差、時差の無い日時はタイムゾーンの日時とする
+        tokyo = tz.gettz("Asia/Tokyo")
+        values = ["2023-01-01 09:00:00 UTC", "2023-01-01 09:00:00", "2023-01-01T09:00:00+09:00",
+                  "2023-01-01T00:00:00Z", "2023-01-01T09:00:00.250+0900", "2023/01/01 09:00", "2023-01-01"]
+        epoch, valid = parse_timestamps(values, tokyo)
+        self.assertTrue(valid.all())
+        self.assertEqual(epoch.tolist(), [
+            epoch_ms("2023-01-01 09:00:00"), epoch_ms("2023-01-01 00:00:00"), epoch_ms("2023-01-01 00:00:00"),
+            epoch_ms("2023-01-01 00:00:00"), epoch_ms("2023-01-01 00:00:00.250"), epoch_ms("2023-01-01 00:00:00"),
+            epoch_ms("2022-12-31 15:00:00")])
+
+    def test_daylight_saving(self):
+        new_york = tz.gettz("America/New_York")
+        epoch, valid = parse_timestamps(["2023-01-15 12:00:00", "2023-07-15 12:00:00"], new_york)
+        self.assertEqual(epoch.tolist(), [epoch_ms("2023-01-15 17:00:00"), epoch_ms("2023-07-15 16:00:00")])
+
+    def test_invalid(self):
+        epoch, valid = parse_timestamps(["2023-01-01 09:00:00 UTC", "", "abc", None])
+        self.assertEqual(valid.tolist(), [True, False, False, False])
+        self.assertTrue(np.all(epoch[1:] == INVALID_EPOCH_MS))
+
+    @unittest.skipUnless(hasattr(time, "tzset"), "time.tzset が使えない環境")
+    def test_local_timezone(self):
+        # タイムゾーンを指定しない場合はコンピュータの設定(変更前の QDateTime と同じ)
+        original = os.environ.get("TZ")
+
+        def restore():
+            if original is None:
+                os.environ.pop("TZ", None)
+            else:
+                os.environ["TZ"] = original
+            time.tzset()
+
+        self.addCleanup(restore)
+        os.environ["TZ"] = "Asia/Tokyo"
+        time.tzset()
+        epoch, valid = parse_timestamps(["2023-01-01 09:00:00", "2023-01-01 09:00:00 UTC"])
+        self.assertEqual(epoch.tolist(), [epoch_ms("2023-01-01 00:00:00"), epoch_ms("2023-01-01 09:00:00")])
+
+
+class LogSegmentsTest(unittest.TestCase):
+
+    def test_segments(self):
+        # id はデータに最初に現れた順に番号を付け、各 id の点は時刻順につなぐ
+        frame = pd.DataFrame({
+            "id": ["b", "a", "b", "a", "b", "c"],
+            "time": [3000.0, 1000.0, 1000.0, 2000.0, 2000.0, 5000.0],
+            "lat": [3.0, 10.0, 1.0, 20.0, 2.0, 0.0],
+            "lon": [30.0, 100.0, 10.0, 200.0, 20.0, 0.0],
+        })
+        segments, time_min, time_max = log_segments(frame)
+        self.assertEqual(segments, [
+            {"vendor": 0, "path": [[10.0, 1.0], [20.0, 2.0]], "timestamps": [1000.0, 2000.0]},
+            {"vendor": 0, "path": [[20.0, 2.0], [30.0, 3.0]], "timestamps": [2000.0, 3000.0]},
+            {"vendor": 1, "path": [[100.0, 10.0], [200.0, 20.0]], "timestamps": [1000.0, 2000.0]},
+        ])
+        self.assertEqual((time_min, time_max), (2000.0, 3000.0))
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeopleFlowVisualization
+                                 A QGIS plugin
+ This plugin visualize people flow
+                             -------------------
+        begin                : 2022-10-07
+        copyright            : (C) 2022 by MLIT
+        email                : trial@MILT
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ ビットマップ索引による抽出(Dataset.mask)のテスト
+"""
+
+import unittest
+
+import numpy as np
+
+from ..dataset import MAX_BITMAP_UNION, MAX_BITMAP_VALUES, Condition, build_bitmaps
+from .mesh_data import make_dataset, make_frame
+
+
+class BitmapMaskTest(unittest.TestCase):
+
+    def setUp(self):
+        # 8の倍数でない行数にして、最後のバイトの余りのビットを確認する
+        self.frame = make_frame(2003, 80, seed=4)
+        self.data = make_dataset(self.frame)
+
+    def expected(self, filters):
+        selected = np.ones(len(self.frame), dtype=bool)
+        for name, values in filters.items():
+            selected &= self.frame[name].isin(values).to_numpy()
+        return selected
+
+    def test_build_bitmaps(self):
+        codes = np.array([0, 2, 1, 0, 2, 2, 0, 1, 1, 2], dtype=np.int32)
+        bitmaps = build_bitmaps(codes, 4)
+        self.assertEqual(bitmaps.shape, (4, 2))
+        for code in range(4):
+            np.testing.assert_array_equal(np.unpackbits(bitmaps[code], count=len(codes)).view(bool), codes == code)
+
+    def test_index_only_small_fields(self):
+        # 値の種類が多い項目(meshcode)には索引を作らない
+        self.assertEqual(sorted(self.data.bitmaps), ["option1", "option2"])
+        frame = make_frame(600, 20, seed=1)
+        frame["option1"] = [str(i % (MAX_BITMAP_VALUES + 1)) for i in range(len(frame))]
+        data = make_dataset(frame)
+        self.assertNotIn("option1", data.bitmaps)
+
+    def test_single_values(self):
+        for filters in [{"option1": "2020"}, {"option1": "2019", "option2": "12"}, {"option2": "1"}]:
+            with self.subTest(filters=filters):
+                expected = self.expected({name: [value] for name, value in filters.items()})
+                np.testing.assert_array_equal(self.data.mask(filters), expected)
+
+    def test_several_values(self):
+        # 値の数が MAX_BITMAP_UNION 以下はビットマップのOR、超える場合は番号の対応表で求める
+        months = [str(month) for month in range(1, 13)]
+        for values in [months[:2], months[:MAX_BITMAP_UNION], months[:MAX_BITMAP_UNION + 1]]:
+            with self.subTest(values=len(values)):
+                filters = {"option1": Condition(",".join(values), values=["2020", "2021"]),
+                           "option2": Condition(",".join(values), values=values)}
+                expected = self.expected({"option1": ["2020", "2021"], "option2": values})
+                np.testing.assert_array_equal(self.data.mask(filters), expected)
+
+    def test_same_without_index(self):
+        # 索引の有無で結果は変わらない(meshcode・数値の項目は索引を使わない)
+        plain = make_dataset(self.frame)
+        plain.bitmaps = {}
+        meshcode = self.frame["meshcode"].iloc[5]
+        for filters in [{"option1": "2021", "meshcode": meshcode}, {"option2": Condition("3～5", low="3", high="5")},
+                        {"option1": "2019", "value": 500.0}]:
+            with self.subTest(filters=filters):
+                np.testing.assert_array_equal(self.data.mask(filters), plain.mask(filters))
+        self.assertEqual(self.data.mask({"option1": "2019", "value": 500.0}).sum(),
+                         ((self.frame["option1"] == "2019") & (self.frame["value"] == 500.0)).sum())
+
+    def test_unknown_value(self):
+        self.assertFalse(self.data.mask({"option1": "1999"}).any())
+        self.assertFalse(self.data.mask({"option1": "2020", "option2": "13"}).any())
+        self.assertTrue(self.data.mask({}).all())
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeopleFlowVisualization
+                                 A QGIS plugin
+ This plugin visualize people flow
+                             -------------------
+        begin                : 2022-10-07
+        copyright            : (C) 2022 by MLIT
+        email                : trial@MILT
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ 並列処理(parallel)のテスト
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from unittest import mock
+
+from .. import parallel
+
+
+def scale(value, factor, callback=None):
+    """ワーカーで実行する関数(進捗として値と1を送る)"""
+    if callback is not None:
+        callback(value, 1)
+    if value < 0:
+        raise ValueError(value)
+    return value * factor
+
+
+class BrokenPool(object):
+    """ワーカープロセスを起動できない(broken の index は異常終了する)プールの代わり"""
+
+    def __init__(self, broken=None):
+        self.broken = broken
+        self.submitted = 0
+
+    def submit(self, func, *args):
+        if self.broken is None:
+            raise OSError("cannot start")
+        future = Future()
+        self.submitted += 1
+        if self.submitted - 1 in self.broken:
+            future.set_exception(BrokenProcessPool("terminated"))
+        else:
+            future.set_result(func(*args))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+class PythonExecutableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, True)
+
+    def touch(self, *names):
+        path = os.path.join(self.dir, *names)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        open(path, "w").close()
+        return path
+
+    def test_python_interpreter(self):
+        with mock.patch.object(sys, "executable", "/usr/bin/python3.9"):
+            self.assertEqual(parallel.python_executable(), "/usr/bin/python3.9")
+
+    def test_qgis_on_windows(self):
+        # QGIS本体から起動した場合は sys.exec_prefix の python.exe を使う
+        path = self.touch("python.exe")
+        with mock.patch.object(sys, "executable", os.path.join(self.dir, "qgis-bin.exe")), \
+                mock.patch.object(sys, "exec_prefix", self.dir):
+            self.assertEqual(parallel.python_executable(), path)
+
+    def test_qgis_on_unix(self):
+        path = self.touch("bin", "python3")
+        with mock.patch.object(sys, "executable", "/usr/bin/qgis"), \
+                mock.patch.object(sys, "exec_prefix", self.dir):
+            self.assertEqual(parallel.python_executable(), path)
+
+    def test_not_found(self):
+        with mock.patch.object(sys, "executable", "/usr/bin/qgis"), \
+                mock.patch.object(sys, "exec_prefix", self.dir):
+            self.assertIsNone(parallel.python_executable())
+
+
+class RunTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(parallel.cache, "log_warning")
+        self.log = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_jobs(self, values):
+        completed = []
+        progress = []
+        results = parallel.run(scale, [(value, 10) for value in values],
+                               lambda i, result: completed.append(i), lambda *values: progress.append(values))
+        return results, sorted(completed), sorted(progress)
+
+    def test_threads(self):
+        with mock.patch.object(parallel, "python_executable", return_value=None):
+            results, completed, progress = self.run_jobs([1, 2, 3])
+        self.assertEqual(results, [10, 20, 30])
+        self.assertEqual(completed, [0, 1, 2])
+        self.assertEqual(progress, [(0, 1, 1), (1, 2, 1), (2, 3, 1)])
+        self.log.assert_not_called()
+
+    def test_processes(self):
+        if parallel.python_executable() is None:
+            self.skipTest("Pythonの実行ファイルが見つかりません")
+        results, completed, progress = self.run_jobs([1, 2])
+        self.assertEqual(results, [10, 20])
+        self.assertEqual(completed, [0, 1])
+
+    def test_fallback_when_pool_cannot_start(self):
+        # ワーカープロセスを起動できない場合はこのプロセスで実行する
+        with mock.patch.object(parallel, "executor", return_value=BrokenPool()):
+            results, completed, progress = self.run_jobs([1, 2, 3])
+        self.assertEqual(results, [10, 20, 30])
+        self.assertEqual(completed, [0, 1, 2])
+        self.assertEqual(progress, [(0, 1, 1), (1, 2, 1), (2, 3, 1)])
+        self.log.assert_called_once()
+
+    def test_fallback_for_terminated_workers(self):
+        # 異常終了したワーカーの分だけをこのプロセスで実行し直す
+        with mock.patch.object(parallel, "executor", return_value=BrokenPool(broken={1, 2})):
+            results = parallel.run(scale, [(value, 10) for value in [1, 2, 3]])
+        self.assertEqual(results, [10, 20, 30])
+        self.log.assert_called_once()
+
+    def test_error_in_worker(self):
+        # 関数の例外はそのまま送出する(このプロセスで実行し直さない)
+        with mock.patch.object(parallel, "python_executable", return_value=None):
+            with self.assertRaises(ValueError):
+                parallel.run(scale, [(1, 10), (-1, 10)])
+        self.log.assert_not_called()
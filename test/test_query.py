@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeopleFlowVisualization
+                                 A QGIS plugin
+ This plugin visualize people flow
+                             -------------------
+        begin                : 2022-10-07
+        copyright            : (C) 2022 by MLIT
+        email                : trial@MILT
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ SQLの条件式(query・staging.mask)のテスト
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from .. import loader, query, staging
+from ..dataset import LOG, SENSOR
+from .mesh_data import make_dataset, make_frame
+
+# SQLiteで実行した結果と同じになること
+MESH_QUERIES = [
+    "value >= 100 AND option1 IN ('2019', '2021')",
+    "value < 10 OR value IS NULL",
+    "NOT value > 500",
+    "NOT (value = NULL)",
+    "value IS NOT NULL AND NOT (option1 = '2019' OR option2 = '1')",
+    "option1 = 2020",
+    "option1 > 2019.5",
+    "option2 > '5'",
+    "option2 BETWEEN 3 AND 6",
+    "option2 NOT BETWEEN '3' AND '6'",
+    "value BETWEEN -1 AND 50.5",
+    "meshcode LIKE '5339%'",
+    "meshcode like '%9_'",
+    "value LIKE '1%'",
+    "value = '100'",
+    "value < 'abc'",
+    "value NOT IN (1, 2, 3, NULL)",
+    "value IN (100, NULL)",
+    "option1 <> option2",
+    "VALUE > 900 or \"option1\" = '2019'",
+    "1 = 1",
+]
+SENSOR_QUERIES = [
+    "datetime >= '2022-06-01'",
+    "datetime LIKE '2022-0_-1%'",
+    "place_id IN ('P1', 'P2') AND option1 = ''",
+    "month > '9'",
+    "value IS NULL",
+]
+LOG_QUERIES = [
+    "epoch_ms > 1641000000000",
+    "epoch_ms IS NULL",
+    "timestamp = ''",
+    "lat > 35.5 AND id = '3'",
+]
+
+
+class QueryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        original = staging.STAGING_DIR
+        staging.STAGING_DIR = os.path.join(self.dir, "staging")
+        self.addCleanup(setattr, staging, "STAGING_DIR", original)
+        self.addCleanup(shutil.rmtree, self.dir, True)
+
+    def read_csv(self, name, header, lines, kind):
+        path = os.path.join(self.dir, name)
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            f.write(header + "\n" + "\n".join(lines) + "\n")
+        data, stats = loader.read_csv(path, kind, "utf-8")
+        loader.add_derived_columns(data)
+        data.fingerprint = name
+        return data
+
+    def assert_same_as_sqlite(self, data, queries):
+        staged = staging.stage_dataset(data)
+        for where in queries:
+            with self.subTest(where=where):
+                expected = np.zeros(len(data), dtype=bool)
+                expected[staged.row_numbers(staging.StagedMask(staged, {}, where))] = True
+                np.testing.assert_array_equal(staging.mask(data, {}, where), expected)
+
+    def test_mesh_same_as_sqlite(self):
+        data = make_dataset(make_frame(3000, 40, seed=5))
+        data.fingerprint = "mesh"
+        self.assert_same_as_sqlite(data, MESH_QUERIES)
+
+    def test_sensor_same_as_sqlite(self):
+        rng = np.random.default_rng(0)
+        lines = ["P{},2022,{},{},{},0,{},{}".format(i % 7, rng.integers(1, 13), rng.integers(1, 28), rng.integers(0, 24),
+                                                   rng.choice(["a", "b", ""]), rng.choice(["1", "2.5", "", "x"]))
+                 for i in range(500)]
+        data = self.read_csv("sensor.csv", "place_id,year,month,day,hour,minute,option1,value", lines, SENSOR)
+        data.add_datetime()
+        self.assert_same_as_sqlite(data, SENSOR_QUERIES)
+
+    def test_log_same_as_sqlite(self):
+        rng = np.random.default_rng(1)
+        lines = ["{},{},35.{},139.{}".format(i % 11, rng.choice(["2022-01-01 10:00:00", "2022-03-01 00:00:00", "bad", ""]),
+                                            i, i) for i in range(300)]
+        data = self.read_csv("log.csv", "id,timestamp,lat,lon", lines, LOG)
+        self.assert_same_as_sqlite(data, LOG_QUERIES)
+
+    def test_combined_with_filters(self):
+        # プルダウンの条件とANDで組み合わせ、SQLiteには書き込まない
+        data = make_dataset(make_frame(2000, 30, seed=6))
+        mask = staging.mask(data, {"option1": "2020"}, "value >= 500")
+        expected = (data.column("option1") == "2020") & (data.column("value") >= 500)
+        np.testing.assert_array_equal(mask, expected)
+        self.assertFalse(os.path.exists(staging.STAGING_DIR))
+
+    def test_column_names(self):
+        node = query.parse("value >= 100 AND (option1 IN ('A') OR \"option 2\" LIKE 'x%' OR value IS NULL)")
+        self.assertEqual(query.column_names(node), ["value", "option1", "option 2"])
+
+    def test_errors(self):
+        data = make_dataset(make_frame(100, 5, seed=7))
+        for where, message in [("value >", "途中で終わっています"), ("foo = 1", "no such column: foo"),
+                               ("value = 'x", "解釈できません"), ("option1 IN 1", "解釈できません"),
+                               ("value > 1 extra", "extra"), ("option1 = value", "比較できません")]:
+            with self.subTest(where=where):
+                with self.assertRaises(staging.QueryError) as context:
+                    staging.mask(data, {}, where)
+                self.assertIn(message, str(context.exception))
+
+
+if __name__ == "__main__":
+    unittest.main()
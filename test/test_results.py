@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeopleFlowVisualization
+                                 A QGIS plugin
+ This plugin visualize people flow
+                             -------------------
+        begin                : 2022-10-07
+        copyright            : (C) 2022 by MLIT
+        email                : trial@MILT
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ 分析結果のキャッシュ(results)のテスト
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from .. import results
+
+
+class ResultCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.base = os.path.join(self.dir, "plugin")
+        self.templates = os.path.join(self.base, "html")
+        os.makedirs(os.path.join(self.base, "temp"))
+        os.makedirs(self.templates)
+        self.write("html/001.html", b"<html>template</html>")
+        for name, value in [("BASE_DIR", self.base), ("TEMPLATE_DIR", self.templates)]:
+            self.addCleanup(setattr, results, name, getattr(results, name))
+            setattr(results, name, value)
+        self.addCleanup(shutil.rmtree, self.dir, True)
+
+    def write(self, name, content):
+        with open(os.path.join(self.base, name), mode="wb") as f:
+            f.write(content)
+
+    def read(self, name):
+        with open(os.path.join(self.base, name), mode="rb") as f:
+            return f.read()
+
+    def test_lru_eviction(self):
+        # 上限サイズを超えると最後に使われた日時が古いものから外す
+        cache = results.ResultCache(max_bytes=10)
+        cache.put("a", {"x": b"1234"})
+        cache.put("b", {"x": b"1234"})
+        cache.get("a")
+        cache.put("c", {"x": b"1234"})
+        self.assertEqual(list(cache.entries), ["a", "c"])
+        self.assertEqual(cache.size, 8)
+        self.assertIsNone(cache.get("b"))
+
+    def test_disk_tier(self):
+        # メモリから外れたものはディスクから読み込む(別のインスタンスからも使える)
+        directory = os.path.join(self.dir, "results")
+        cache = results.ResultCache(max_bytes=10, directory=directory)
+        cache.put("a", {"temp/a.csv": b"12345678"})
+        cache.put("b", {"temp/b.csv": b"12345678"})
+        self.assertNotIn("a", cache.entries)
+        self.assertEqual(cache.get("a"), {"temp/a.csv": b"12345678"})
+        other = results.ResultCache(directory=directory)
+        self.assertEqual(other.get("b"), {"temp/b.csv": b"12345678"})
+
+    def test_disk_eviction(self):
+        directory = os.path.join(self.dir, "results")
+        cache = results.ResultCache(directory=directory)
+        for key in ["a", "b", "c"]:
+            cache.put(key, {"x": b"0" * 100})
+        os.utime(os.path.join(directory, "a", results.META_FILE), (1, 1))
+        cache.evict(250)
+        self.assertEqual(sorted(os.listdir(directory)), ["b", "c"])
+
+    def test_store_and_restore(self):
+        # 出力ファイルを保持し、別の分析で上書きされても書き戻せる
+        cache = results.ResultCache(directory=os.path.join(self.dir, "results"))
+        names = ["temp/result.csv", "html/001.html.html"]
+        self.write(names[0], b"meshcode,value\n1,2\n")
+        self.write(names[1], b"<html>1</html>")
+        cache.store("key", names)
+        self.write(names[0], b"other")
+        self.write(names[1], b"other")
+        self.assertTrue(cache.restore("key"))
+        self.assertEqual(self.read(names[0]), b"meshcode,value\n1,2\n")
+        self.assertEqual(self.read(names[1]), b"<html>1</html>")
+        self.assertFalse(cache.restore("missing"))
+        self.assertFalse(cache.restore(None))
+
+    def test_store_skips_missing_files(self):
+        cache = results.ResultCache()
+        cache.store("key", ["temp/missing.csv"])
+        self.assertIsNone(cache.get("key"))
+
+    def test_key_includes_templates(self):
+        # テンプレートを変更すると別のキーになる(作成したHTMLの変更は影響しない)
+        key = results.make_key("001", "data", ("ALL",), "")
+        self.assertEqual(results.make_key("001", "data", ("ALL",), ""), key)
+        self.assertNotEqual(results.make_key("001", "data", ("2020",), ""), key)
+        self.write("html/001.html.html", b"<html>output</html>")
+        self.assertEqual(results.make_key("001", "data", ("ALL",), ""), key)
+        self.write("html/001.html", b"<html>changed</html>")
+        self.assertNotEqual(results.make_key("001", "data", ("ALL",), ""), key)
+
+    def test_normalize_filters(self):
+        self.assertEqual(results.normalize_filters([" 2020 ", "", "ALL"]), ("2020", "ALL", "ALL"))
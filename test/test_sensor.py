@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeopleFlowVisualization
+                                 A QGIS plugin
+ This plugin visualize people flow
+                             -------------------
+        begin                : 2022-10-07
+        copyright            : (C) 2022 by MLIT
+        email                : trial@MILT
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ 計測データ(002)の日時の項目(compose_datetime)のテスト
+"""
+
+import datetime
+import unittest
+
+import numpy as np
+
+from ..dataset import DATETIME, SENSOR, compose_datetime, concat, encode, format_datetime, is_category
+
+FIELDS = ("year", "month", "day", "hour", "minute")
+
+
+def reference(row):
+    """変更前と同じく1行ずつ datetime に変換する(変換できなければNone)"""
+    try:
+        return datetime.datetime(*[int(value) for value in row])
+    except ValueError:
+        return None
+
+
+class ComposeDatetimeTest(unittest.TestCase):
+
+    def compose(self, rows):
+        return compose_datetime(*[np.array(values, dtype=object) for values in zip(*rows)])
+
+    def test_valid_rows(self):
+        rows = [("2023", "1", "31", "0", "0"), ("2024", "02", "29", "23", "59"), ("1999", "12", "31", "12", "30"),
+                ("2000", "2", "29", "7", "5")]
+        result, valid = self.compose(rows)
+        self.assertTrue(valid.all())
+        self.assertEqual(result.dtype, np.dtype("datetime64[m]"))
+        self.assertEqual(result.astype(datetime.datetime).tolist(), [reference(row) for row in rows])
+
+    def test_invalid_rows(self):
+        # 存在しない日付・範囲外の時刻・数値でない値は無効(NaT)
+        rows = [("2023", "2", "29", "0", "0"), ("1900", "2", "29", "0", "0"), ("2023", "13", "1", "0", "0"),
+                ("2023", "4", "31", "0", "0"), ("2023", "1", "1", "24", "0"), ("2023", "1", "1", "0", "60"),
+                ("2023", "1", "0", "0", "0"), ("2023", "1", "1.5", "0", "0"), ("", "1", "1", "0", "0"),
+                ("2023", "abc", "1", "0", "0"), ("2023", "1", "1", "-1", "0")]
+        result, valid = self.compose(rows + [("2023", "1", "1", "0", "0")])
+        self.assertEqual(valid.tolist(), [False] * len(rows) + [True])
+        self.assertTrue(np.isnat(result[:-1]).all())
+        self.assertTrue(all(reference(row) is None for row in rows))
+
+    def test_random_rows(self):
+        # 無作為な値で1行ずつ変換した結果と一致する
+        rng = np.random.default_rng(0)
+        rows = [tuple(str(value) for value in values) for values in zip(
+            rng.integers(1999, 2026, 2000), rng.integers(0, 14, 2000), rng.integers(0, 33, 2000),
+            rng.integers(-1, 26, 2000), rng.integers(-1, 62, 2000))]
+        result, valid = self.compose(rows)
+        expected = [reference(row) for row in rows]
+        self.assertEqual(valid.tolist(), [value is not None for value in expected])
+        self.assertEqual(result[valid].astype(datetime.datetime).tolist(), [value for value in expected if value is not None])
+
+
+class SensorDatetimeTest(unittest.TestCase):
+
+    def make_data(self, rows):
+        header = ["place_id"] + list(FIELDS) + ["value"]
+        columns = {"place_id": np.array(["1"] * len(rows), dtype=object), "value": np.ones(len(rows), dtype=np.float64)}
+        for name, values in zip(FIELDS, zip(*rows)):
+            columns[name] = np.array(values, dtype=object)
+        chunk = {name: encode(values) if is_category(name) else values for name, values in columns.items()}
+        return concat(SENSOR, header, [chunk])
+
+    def test_add_datetime(self):
+        data = self.make_data([("2023", "3", "1", "10", "0"), ("2023", "2", "28", "9", "30")])
+        self.assertTrue(data.add_datetime())
+        self.assertEqual(data.datetime_range(), (datetime.datetime(2023, 2, 28, 9, 30), datetime.datetime(2023, 3, 1, 10, 0)))
+        self.assertEqual(list(format_datetime(data.columns[DATETIME], "%Y/%m/%d %H:%M")),
+                         ["2023/03/01 10:00", "2023/02/28 09:30"])
+
+    def test_add_datetime_invalid(self):
+        # 無効な日時の行があれば項目を作成しない
+        data = self.make_data([("2023", "3", "1", "10", "0"), ("2023", "2", "30", "9", "30")])
+        self.assertFalse(data.add_datetime())
+        self.assertNotIn(DATETIME, data.columns)
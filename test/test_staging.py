@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeopleFlowVisualization
+                                 A QGIS plugin
+ This plugin visualize people flow
+                             -------------------
+        begin                : 2022-10-07
+        copyright            : (C) 2022 by MLIT
+        email                : trial@MILT
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ 大きなデータの一時保存(staging)のテスト
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from .. import staging
+from .mesh_data import make_dataset, make_frame
+
+
+class StagingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        original = staging.STAGING_DIR
+        staging.STAGING_DIR = os.path.join(self.dir, "staging")
+        self.addCleanup(setattr, staging, "STAGING_DIR", original)
+        self.addCleanup(shutil.rmtree, self.dir, True)
+
+    def make_data(self, rows=3000, meshes=60, seed=0, key="mesh"):
+        data = make_dataset(make_frame(rows, meshes, seed))
+        data.fingerprint = key
+        return data
+
+
+class StagedDatasetTest(StagingTestCase):
+
+    def test_same_results_as_dataset(self):
+        # 一時保存したデータはSQLで同じ集計・抽出結果を返す
+        data = self.make_data()
+        staged = staging.stage_dataset(data)
+        self.assertEqual(len(staged), len(data))
+        self.assertEqual(staged.unique("option2"), sorted(data.unique("option2")))
+
+        filters = {"option1": "2020"}
+        pd.testing.assert_series_equal(staged.aggregate(["meshcode"], "sum", staged.mask(filters)),
+                                       data.aggregate(["meshcode"], "sum", data.mask(filters)),
+                                       check_dtype=False, check_index_type=False)
+        expected = data.aggregate_rows("meshcode", "sum", data.mask(filters))
+        actual = staged.aggregate_rows("meshcode", "sum", staged.mask(filters))
+        for name in data.header:
+            np.testing.assert_array_equal(actual.column(name), expected.column(name))
+
+    def test_to_frame_by_row_numbers(self):
+        data = self.make_data()
+        staged = staging.stage_dataset(data)
+        rows = np.array([0, 7, 2999])
+        pd.testing.assert_frame_equal(staged.to_frame(rows), data.to_frame(rows), check_dtype=False)
+        self.assertEqual(len(staged.to_frame(np.array([], dtype=np.int64))), 0)
+
+    def test_stage_once(self):
+        # 同じキーのデータは書き込み済みのものを開く
+        data = self.make_data()
+        staged = staging.stage_dataset(data)
+        self.assertEqual(staging.stage_dataset(data).path, staged.path)
+        self.assertEqual(staging.open_store("mesh").path, staged.path)
+
+    def test_exclude_rows(self):
+        data = self.make_data()
+        staged = staging.stage_dataset(data)
+        excluded = staging.exclude_rows(staged, np.array([0, 1, 10]))
+        self.assertEqual(len(excluded), len(data) - 3)
+        keep = np.ones(len(data), dtype=bool)
+        keep[[0, 1, 10]] = False
+        np.testing.assert_array_equal(excluded.column("meshcode"), data.column("meshcode", keep))
+
+    def test_merge(self):
+        # 先頭の一時保存したファイルの複製に、残りのデータ(一時保存・メモリ上)の行を順に追加する
+        parts = [self.make_data(400, 20, seed, "key" + str(seed)) for seed in range(3)]
+        first = staging.stage_dataset(parts[0])
+        last = staging.stage_dataset(parts[2])
+        merged = staging.merge([first, parts[1], last])
+        self.assertEqual(len(merged), 1200)
+        self.assertEqual(merged.sources, ["key0", "key1", "key2"])
+        expected = np.concatenate([data.column("meshcode") for data in parts])
+        np.testing.assert_array_equal(merged.column("meshcode"), expected)
+        self.assertEqual(len(first), 400)
+        with self.assertRaises(ValueError):
+            staging.merge([merged, parts[1]])
+
+
+class StagingSizeTest(StagingTestCase):
+
+    def test_should_stage(self):
+        # 一時保存するファイルサイズの下限は設定(QGIS外では既定値)で決まる
+        path = os.path.join(self.dir, "data.csv")
+        with open(path, "w") as f:
+            f.write("x" * 100)
+        self.assertFalse(staging.should_stage(path))
+        original = staging.STAGE_MIN_BYTES
+        staging.STAGE_MIN_BYTES = 100
+        self.addCleanup(setattr, staging, "STAGE_MIN_BYTES", original)
+        self.assertTrue(staging.should_stage(path))
+
+    def test_evict_oldest(self):
+        # 上限サイズを超えた分は最後に使われた日時が古いものから削除する
+        paths = [staging.stage_dataset(self.make_data(500, 20, seed, "key" + str(seed))).path for seed in range(3)]
+        now = time.time()
+        for i, path in enumerate(paths):
+            os.utime(path, (now - 100 + i, now - 100 + i))
+        size = os.path.getsize(paths[2])
+        staging.evict(size * 2 + size // 2)
+        self.assertEqual([os.path.exists(path) for path in paths], [False, True, True])
+        self.assertIsNone(staging.open_store("key0"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeopleFlowVisualization
+                                 A QGIS plugin
+ This plugin visualize people flow
+                             -------------------
+        begin                : 2022-10-07
+        copyright            : (C) 2022 by MLIT
+        email                : trial@MILT
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ 読み込み後の確認(validation)のテスト
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from .. import loader, validation
+from ..dataset import LOG, OD, SENSOR
+
+
+class ValidationTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def write_csv(self, text, name="data.csv"):
+        path = os.path.join(self.dir, name)
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            f.write(text)
+        return path
+
+    def read(self, text, kind):
+        data, stats = loader.read_csv(self.write_csv(text), kind, "utf-8")
+        loader.add_derived_columns(data)
+        return data
+
+    def error_rows(self, report):
+        """確認項目のメッセージごとのエラー行の番号"""
+        return {rule.message: rows.tolist() for rule, rows, counts in report.errors}
+
+
+class MeshRulesTest(ValidationTestCase):
+
+    TEXT = ("meshcode,option1,value\n"
+            "53393599,a,1\n"
+            "5339AB99,a,2\n"
+            "5339359,b,3\n"
+            "53393600,b,\n"
+            "53393601,c,x\n"
+            "53393599,c,6\n")
+
+    def test_mesh_csv_is_read_without_stopping(self):
+        # 数値に変換できない値・空欄は読み込みを中止せずNaNにする
+        data, meshcode_list, stats = loader.load_mesh_csv(self.write_csv(self.TEXT))
+        self.assertEqual(stats.rows, 6)
+        values = data.column("value")
+        self.assertTrue(np.isnan(values[3]))
+        self.assertTrue(np.isnan(values[4]))
+        self.assertEqual(values[5], 6.0)
+
+    def test_errors_of_all_rows(self):
+        data, meshcode_list, stats = loader.load_mesh_csv(self.write_csv(self.TEXT))
+        report = validation.check(data, validation.mesh_rules(1))
+        self.assertEqual(self.error_rows(report), {
+            "メッシュコードに文字列が含まれています": [1],
+            "メッシュコードの桁数が一致しません": [2],
+            "valueが数値ではありません": [3, 4],
+        })
+        self.assertEqual(report.invalid_rows().tolist(), [1, 2, 3, 4])
+        self.assertEqual(report.valid_count(), 2)
+        self.assertIn("メッシュコードに文字列が含まれています(1種類 1件: 5339AB99(1件))", report.messages())
+
+    def test_meshcode_length_depends_on_mesh_index(self):
+        data = self.read("meshcode,option1,value\n533935991,a,1\n53393599,a,2\n", SENSOR)
+        report = validation.check(data, validation.meshcode_rules(2))
+        self.assertEqual(self.error_rows(report), {"メッシュコードの桁数が一致しません": [1]})
+
+    def test_check_result(self):
+        # エラー行の一覧を出力し、エラー行を除いたデータ(値の候補からも除く)を作成しておく
+        result = loader.load_mesh_csv(self.write_csv(self.TEXT))
+        path = os.path.join(self.dir, "errors.csv")
+        data, meshcode_list, stats, report = validation.check_result(result, validation.mesh_rules(1), path)
+
+        valid = report.valid_data
+        self.assertEqual(len(valid), 2)
+        self.assertEqual(valid.unique("meshcode"), ["53393599"])
+        self.assertEqual(valid.unique("option1"), ["a", "c"])
+        self.assertEqual(list(valid.column("value")), [1.0, 6.0])
+
+        errors = pd.read_csv(path, dtype=str, encoding="utf-8-sig", keep_default_na=False)
+        self.assertEqual(errors[validation.RECORD_NUMBER].tolist(), ["2", "3", "4", "5"])
+        self.assertEqual(errors["meshcode"].tolist(), ["5339AB99", "5339359", "53393600", "53393601"])
+
+    def test_check_result_without_errors(self):
+        result = loader.load_mesh_csv(self.write_csv("meshcode,option1,value\n53393599,a,1\n"))
+        data, meshcode_list, stats, report = validation.check_result(result, validation.mesh_rules(1))
+        self.assertEqual(report.errors, [])
+        self.assertIsNone(report.valid_data)
+
+    def test_no_valid_rows(self):
+        result = loader.load_mesh_csv(self.write_csv("meshcode,option1,value\nabc,a,1\n"))
+        data, meshcode_list, stats, report = validation.check_result(result, validation.mesh_rules(1))
+        self.assertEqual(report.valid_count(), 0)
+        self.assertIsNone(report.valid_data)
+
+    def test_check_in_chunks(self):
+        # 行のまとまりをまたいでも行番号は全体の件数目になり、進捗は件数で通知する
+        data, meshcode_list, stats = loader.load_mesh_csv(self.write_csv(self.TEXT))
+        progress = []
+        original = validation.CHECK_ROWS
+        validation.CHECK_ROWS = 4
+        try:
+            report = validation.check(data, validation.mesh_rules(1), lambda pos, total, rows: progress.append(pos))
+        finally:
+            validation.CHECK_ROWS = original
+        self.assertEqual(report.invalid_rows().tolist(), [1, 2, 3, 4])
+        self.assertEqual(progress, [4, 6])
+
+
+class SensorRulesTest(ValidationTestCase):
+
+    def test_sensor_rules(self):
+        data = self.read("place_id,year,month,day,hour,minute,value\n"
+                         "P1,2022,1,1,0,0,1\n"
+                         "P9,2022,1,1,0,0,2\n"
+                         ",2022,1,1,0,0,3\n"
+                         "P1,2022,13,1,0,0,4\n"
+                         "P1,2022,2,30,0,0,5\n"
+                         "P1,2022,1,1,0,0,abc\n", SENSOR)
+        report = validation.check(data, validation.sensor_rules(["P1", "P2"]))
+        self.assertEqual(self.error_rows(report), {
+            "place_idが指定されていません": [2],
+            "place_idがセンサーと一致しません": [1],
+            "無効な日付、または日付以外が入力されています": [3, 4],
+            "valueが数値ではありません": [5],
+        })
+
+
+class OdRulesTest(ValidationTestCase):
+
+    def test_od_rules(self):
+        data = self.read("time_o,time_d,origin,destination,id,value\n"
+                         "2022-01-01 00:00,2022-01-01 01:00,A,B,1,1\n"
+                         "xxx,2022-01-01 01:00,A,B,2,1\n"
+                         "2022-01-01 00:00,2022-01-01 01:00,,C,3,1\n"
+                         "2022-01-01 00:00,2022-01-01 01:00,A,B,4,\n", OD)
+        report = validation.check(data, validation.od_rules(["A", "B"]))
+        self.assertEqual(self.error_rows(report), {
+            "time_oが日時ではありません": [1],
+            "originが指定されていません": [2],
+            "destinationがエリアと一致しません": [2],
+            "valueが数値ではありません": [3],
+        })
+
+
+class LogRulesTest(ValidationTestCase):
+
+    def test_log_rules(self):
+        data = self.read("id,timestamp,lat,lon\n"
+                         "1,2022-01-01 00:00:00,35.6,139.7\n"
+                         ",2022-01-01 00:00:00,35.6,139.7\n"
+                         "3,abc,35.6,139.7\n"
+                         "4,2022-01-01 00:00:00,95,139.7\n"
+                         "5,2022-01-01 00:00:00,35.6,\n", LOG)
+        report = validation.check(data, validation.log_rules())
+        self.assertEqual(self.error_rows(report), {
+            "idが指定されていません": [1],
+            "timestampが日時ではありません": [2],
+            "latが範囲外です(-90～90)": [3],
+            "lonが範囲外です(-180～180)": [4],
+        })
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeopleFlowVisualization
+                                 A QGIS plugin
+ This plugin visualize people flow
+                             -------------------
+        begin                : 2022-10-07
+        copyright            : (C) 2022 by MLIT
+        email                : trial@MILT
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ worldmesh の配列版の関数がスカラー版の関数と同じ結果になることのテスト
+"""
+
+import unittest
+
+import numpy as np
+
+from .. import worldmesh
+
+# (桁数, 拡張コード)
+GRID_LENGTHS = [(6, False), (8, False), (10, False), (11, False), (12, False), (13, False),
+                (6, True), (8, True), (10, True), (12, True), (13, True), (14, True), (16, True)]
+
+
+def random_meshcodes(length, extension, count, seed=0):
+    """桁数・種類ごとの取りうる数字の範囲で作ったメッシュコード(文字列)"""
+    rng = np.random.default_rng(seed)
+    columns = [rng.integers(1, 9, count).astype(str)]
+    for i in range(1, length):
+        if i in (6, 7):
+            low, high = 0, 8
+        elif i >= 10 and not extension:
+            low, high = 1, 5
+        elif extension and length == 13 and i == 10:
+            low, high = 1, 5
+        elif extension and length == 13 and i > 10:
+            low, high = 0, 5
+        else:
+            low, high = 0, 10
+        columns.append(rng.integers(low, high, count).astype(str))
+    return ["".join(digits) for digits in zip(*columns)]
+
+
+class MeshcodeToLatlongGridArrayTest(unittest.TestCase):
+
+    def assert_same(self, codes, extension):
+        result = worldmesh.meshcode_to_latlong_grid_array(np.array(codes).astype(np.int64), extension)
+        for i, code in enumerate(codes):
+            expected = worldmesh.meshcode_to_latlong_grid(code, extension)
+            for name in ("lat0", "long0", "lat1", "long1"):
+                # 丸めた値がスカラー版と完全に一致すること
+                self.assertEqual(result[name][i], expected[name], (code, extension, name))
+
+    def test_same_as_scalar(self):
+        for length, extension in GRID_LENGTHS:
+            with self.subTest(length=length, extension=extension):
+                self.assert_same(random_meshcodes(length, extension, 2000, seed=length), extension)
+
+    def test_mixed_lengths(self):
+        codes = random_meshcodes(10, False, 100) + random_meshcodes(13, False, 100) + random_meshcodes(8, False, 100)
+        self.assert_same(codes, False)
+
+    def test_string_input(self):
+        codes = random_meshcodes(13, False, 10)
+        result = worldmesh.meshcode_to_latlong_grid_array(codes)
+        expected = worldmesh.meshcode_to_latlong_grid_array(np.array(codes).astype(np.int64))
+        for name in result:
+            np.testing.assert_array_equal(result[name], expected[name])
+
+    def test_unsupported_codes(self):
+        # 6桁未満(スカラー版はNone)、対応していない桁数(スカラー版は例外)は 99999
+        codes = [12345, 1234567, 123456789, 12345678901234, 1234567890123456, 12345678901, 123456789012345]
+        extension = [False, False, False, False, False, True, True]
+        for code, ext in zip(codes, extension):
+            result = worldmesh.meshcode_to_latlong_grid_array([code], ext)
+            for name in ("lat0", "long0", "lat1", "long1"):
+                self.assertEqual(result[name][0], 99999, (code, ext))
+        self.assertIsNone(worldmesh.meshcode_to_latlong_grid("12345"))
+
+    def test_empty(self):
+        result = worldmesh.meshcode_to_latlong_grid_array(np.array([], dtype=np.int64))
+        self.assertEqual(len(result["lat0"]), 0)
+
+
+def random_points(count, seed=0):
+    """世界全体・日本周辺の位置と、メッシュの境界に一致する位置"""
+    rng = np.random.default_rng(seed)
+    latitude = [rng.uniform(-90, 90, count), rng.uniform(20, 46, count)]
+    longitude = [rng.uniform(-180, 180, count), rng.uniform(122, 154, count)]
+    # 各階層の境界(緯度は 40分/5分/30秒/15秒/7.5秒/3.75秒/3秒、経度は 1度/7.5分/45秒/22.5秒/11.25秒/5.625秒/4.5秒)
+    for lat_step, long_step in ((120, 80), (960, 640), (1200, 800), (12000, 8000)):
+        latitude.append(np.round(rng.uniform(20, 46, count) * lat_step) / lat_step)
+        longitude.append(np.round(rng.uniform(122, 154, count) * long_step) / long_step)
+    return np.concatenate(latitude), np.concatenate(longitude)
+
+
+class CalMeshcodeArrayTest(unittest.TestCase):
+
+    def assert_same(self, latitude, longitude, level):
+        func, length = worldmesh._MESHCODE_LEVELS[level]
+        result = worldmesh.cal_meshcode_array(latitude, longitude, level)
+        for i in range(len(latitude)):
+            expected = int(func(float(latitude[i]), float(longitude[i])))
+            self.assertEqual(int(result[i]), expected, (level, latitude[i], longitude[i]))
+
+    def test_same_as_scalar(self):
+        latitude, longitude = random_points(1000)
+        for level in worldmesh._MESHCODE_LEVELS:
+            with self.subTest(level=level):
+                self.assert_same(latitude, longitude, level)
+
+    def test_edges(self):
+        latitude = np.array([90, -90, 0, -0.0, 45, 35.0, -35.5])
+        longitude = np.array([180, -180, 0, 100, -100, 139.0, -0.0])
+        for level in worldmesh._MESHCODE_LEVELS:
+            with self.subTest(level=level):
+                self.assert_same(latitude, longitude, level)
+
+    def test_invalid_positions(self):
+        # 範囲外(スカラー版は 9 を並べたコード)、NaN・無限大(スカラー版は例外)は 9 を並べたコード
+        for level, (func, length) in worldmesh._MESHCODE_LEVELS.items():
+            result = worldmesh.cal_meshcode_array([np.nan, 35.0], [139.0, np.inf], level)
+            self.assertEqual(result.tolist(), [int("9" * length)] * 2, level)
+        for level in (1, 2, 3, 4, 5, 6):
+            result = worldmesh.cal_meshcode_array([91.0, 35.0], [139.0, 181.0], level)
+            expected = [int(worldmesh._MESHCODE_LEVELS[level][0](91.0, 139.0)),
+                        int(worldmesh._MESHCODE_LEVELS[level][0](35.0, 181.0))]
+            self.assertEqual(result.tolist(), expected, level)
+
+    def test_shape(self):
+        result = worldmesh.cal_meshcode_array([[35.68], [36.0]], [139.76, 139.0], 3)
+        self.assertEqual(result.shape, (2, 2))
+        self.assertEqual(result.dtype, np.int64)
+        self.assertEqual(int(result[0, 0]), int(worldmesh.cal_meshcode3(35.68, 139.76)))
+        self.assertEqual(len(worldmesh.cal_meshcode_array([], [], 1)), 0)
+
+    def test_unsupported_level(self):
+        with self.assertRaises(ValueError):
+            worldmesh.cal_meshcode_array([35.0], [139.0], 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
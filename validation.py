@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PeopleFlowVisualization
+                                 A QGIS plugin
+ This plugin visualize people flow
+                             -------------------
+        begin                : 2022-10-07
+        copyright            : (C) 2022 by MLIT
+        email                : trial@MILT
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ 読み込んだデータの確認処理(列単位でまとめて確認する)
+
+ 最初のエラーで止めずに全行を確認し、確認項目ごとの件数とエラー行の一覧を作成する
+"""
+
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from . import staging
+from .dataset import EPOCH_MS, INVALID_EPOCH_MS, compose_datetime, source_keys
+
+# メッセージに表示する値の最大数
+MAX_LISTED_VALUES = 10
+# 1回に確認する行数
+CHECK_ROWS = 200000
+# エラー行の一覧の番号の列名(ファイルの行番号ではなく、ヘッダーを除いたデータの件数目)
+RECORD_NUMBER = "データ番号(ヘッダー除く)"
+# メッシュコードの種類(cmb_meshcodeのindex)ごとの桁数
+MESHCODE_LENGTH = {1: 8, 2: 9, 3: 10, 4: 11, 5: 10, 6: 11}
+
+
+def format_counts(counts):
+    """値ごとの件数を「A(3件), B(1件) ほか2種類」の形式にする"""
+    counts = counts.sort_values(ascending=False, kind="mergesort")
+    items = ["{}({:,}件)".format(value, count) for value, count in counts.iloc[:MAX_LISTED_VALUES].items()]
+    text = ", ".join(items)
+    if len(counts) > MAX_LISTED_VALUES:
+        text += " ほか{:,}種類".format(len(counts) - MAX_LISTED_VALUES)
+    return text
+
+
+class Rule(object):
+    """確認項目
+
+    check(列の辞書) は問題のある行をTrueとした配列を返す。
+    detail を指定した場合は、問題のあった行のその項目の値と件数をメッセージに加える
+    """
+
+    def __init__(self, message, columns, check, detail=None):
+        self.message = message
+        self.columns = columns
+        self.check = check
+        self.detail = detail
+
+
+def empty_rule(name):
+    return Rule(name + "が指定されていません", [name], lambda c: c[name] == "")
+
+
+def key_rule(name, keys, master):
+    """値がマスタ(keys)に含まれること(未指定は empty_rule で確認する)"""
+    keys = pd.Index(list(keys), dtype=object)
+    return Rule(name + "が" + master + "と一致しません", [name],
+                lambda c: (c[name] != "") & ~pd.Index(c[name], dtype=object).isin(keys), detail=name)
+
+
+def number_rule(name):
+    """数値に変換できること(変換できなかった値は読み込み時にNaNにしている)"""
+    return Rule(name + "が数値ではありません", [name], lambda c: np.isnan(c[name]))
+
+
+def datetime_rule(name):
+    """日時として解釈できること"""
+    return Rule(name + "が日時ではありません", [name],
+                lambda c: pd.to_datetime(pd.Series(c[name], dtype=object), errors="coerce").isna().to_numpy())
+
+
+def epoch_rule():
+    """ログデータの timestamp が日時として解釈できること(読み込み時に作成したUNIX時間で確認する)"""
+    return Rule("timestampが日時ではありません", ["timestamp", EPOCH_MS],
+                lambda c: (c["timestamp"] != "") & (c[EPOCH_MS] == INVALID_EPOCH_MS))
+
+
+def date_parts_rule():
+    """計測データの year,month,day,hour,minute が有効な日時であること"""
+    names = ["year", "month", "day", "hour", "minute"]
+    return Rule("無効な日付、または日付以外が入力されています", names,
+                lambda c: ~compose_datetime(*[c[name] for name in names])[1])
+
+
+def range_rule(name, low, high):
+    """low < 値 < high であること(数値でない値もエラーにする)"""
+    return Rule("{}が範囲外です({}～{})".format(name, low, high), [name],
+                lambda c: ~((c[name] > low) & (c[name] < high)))
+
+
+def meshcode_rules(mesh_index):
+    """メッシュコードが数字のみで、メッシュコードの種類(mesh_index)の桁数であること"""
+    rules = [Rule("メッシュコードに文字列が含まれています", ["meshcode"],
+                  lambda c: ~np.char.isdigit(c["meshcode"].astype(str)), detail="meshcode")]
+    length = MESHCODE_LENGTH.get(mesh_index)
+    if length is not None:
+        rules.append(Rule("メッシュコードの桁数が一致しません", ["meshcode"],
+                          lambda c: np.char.str_len(c["meshcode"].astype(str)) != length, detail="meshcode"))
+    return rules
+
+
+def mesh_rules(mesh_index):
+    """メッシュ人流データ(001)の確認項目"""
+    return meshcode_rules(mesh_index) + [number_rule("value")]
+
+
+def sensor_rules(place_ids):
+    """計測データ(002)の確認項目"""
+    return [empty_rule("place_id"), key_rule("place_id", place_ids, "センサー"), date_parts_rule(),
+            number_rule("value")]
+
+
+def od_rules(area_ids):
+    """移動滞在ログデータ(003)の確認項目"""
+    return [datetime_rule("time_o"), datetime_rule("time_d"),
+            empty_rule("origin"), key_rule("origin", area_ids, "エリア"),
+            empty_rule("destination"), key_rule("destination", area_ids, "エリア"),
+            number_rule("value")]
+
+
+def log_rules():
+    """ログデータ(003-2)の確認項目"""
+    return [empty_rule("id"), empty_rule("timestamp"), epoch_rule(),
+            range_rule("lat", -90, 90), range_rule("lon", -180, 180)]
+
+
+class Report(object):
+    """確認結果(確認項目ごとのエラー行の番号)"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.errors = []        # (確認項目, 行番号(0から)の配列, 値ごとの件数) のリスト
+        self.valid_data = None  # エラー行を除いたデータ(check_result で作成する)
+
+    def add(self, rule, rows, counts=None):
+        self.errors.append((rule, rows, counts))
+
+    def invalid_rows(self):
+        """いずれかの確認項目でエラーになった行の番号"""
+        if len(self.errors) == 0:
+            return np.array([], dtype=np.int64)
+        return np.unique(np.concatenate([rows for rule, rows, counts in self.errors]))
+
+    def valid_count(self):
+        return self.rows - len(self.invalid_rows())
+
+    def messages(self):
+        """確認項目ごとの件数のメッセージ"""
+        messages = []
+        for rule, rows, counts in self.errors:
+            if counts is None:
+                messages.append("{}({:,}件)".format(rule.message, len(rows)))
+            else:
+                messages.append("{}({:,}種類 {:,}件: {})".format(
+                    rule.message, len(counts), len(rows), format_counts(counts)))
+        return messages
+
+    def write_errors(self, path, data):
+        """エラー行の一覧をCSVに出力する
+
+        番号はヘッダーを除いたデータの何件目か(1から)。空行は数えず、複数行にわたる値も1件と数えるため、
+        ファイルの行番号とは一致しない場合がある
+        """
+        frames = []
+        for rule, rows, counts in self.errors:
+            frame = data.to_frame(rows)
+            frame.insert(0, "エラー内容", rule.message)
+            frame.insert(0, RECORD_NUMBER, rows + 1)
+            frames.append(frame)
+        result = pd.concat(frames, ignore_index=True).sort_values(RECORD_NUMBER, kind="mergesort")
+        result.to_csv(path, index=False, encoding="utf-8-sig")
+
+
+def check(data, rules, callback=None):
+    """全行を行のまとまりごとに確認し、Report を返す
+
+    callback(確認済件数, 全件数, 確認済件数) は行のまとまりごとに呼ばれる(読み込みと同じ形式)
+    """
+    names = []
+    for rule in rules:
+        names += [name for name in rule.columns if name not in names]
+
+    found = [[] for rule in rules]
+    for start, columns in data.iter_rows(names, CHECK_ROWS):
+        for rule, parts in zip(rules, found):
+            bad = np.asarray(rule.check(columns), dtype=bool)
+            if bad.any():
+                parts.append((start + np.flatnonzero(bad), columns[rule.detail][bad] if rule.detail else None))
+        if callback is not None:
+            done = min(start + CHECK_ROWS, len(data))
+            callback(done, len(data), done)
+
+    report = Report(len(data))
+    for rule, parts in zip(rules, found):
+        if len(parts) == 0:
+            continue
+        rows = np.concatenate([rows for rows, values in parts])
+        counts = None
+        if rule.detail is not None:
+            counts = pd.Series(np.concatenate([values for rows, values in parts]), dtype=object).value_counts(sort=False)
+        report.add(rule, rows, counts)
+    return report
+
+
+def exclude_invalid(data, report):
+    """エラー行を除いたデータを返す(エラー行にだけあった値は項目の候補から除く)"""
+    rows = report.invalid_rows()
+    if isinstance(data, staging.StagedDataset):
+        return staging.exclude_rows(data, rows)
+    keep = np.ones(len(data), dtype=bool)
+    keep[rows] = False
+    result = data.take(keep).drop_unused()
+    if data.fingerprint is not None:
+        result.fingerprint = hashlib.sha1(data.fingerprint.encode("ascii") + rows.tobytes()).hexdigest()
+    result.sources = source_keys(data)
+    return result
+
+
+def check_result(result, rules, error_path=None, callback=None):
+    """読み込み結果 (Dataset, ...) の全行を確認し、末尾に Report を加えたタプルを返す
+
+    読み込みタスクの中で呼び、エラー行の一覧の出力(error_path)とエラー行を除いたデータ(Report.valid_data)の
+    作成まで済ませておく(画面側は確認結果の表示と続行するかの問い合わせのみ行う)
+    """
+    data = result[0]
+    report = check(data, rules, callback)
+    if len(report.errors) > 0:
+        if error_path is not None:
+            report.write_errors(error_path, data)
+        if report.valid_count() > 0:
+            report.valid_data = exclude_invalid(data, report)
+    return tuple(result) + (report,)
@@ -59,6 +59,8 @@
 # : calculate sourthern eastern geographic position of the grid (latitude, longitude) from meshcode
 # meshcode_to_latlong_grid(meshcode, extension=False)
 # : calculate northern western and sourthern eastern geographic positions of the grid (latitude0, longitude0, latitude1, longitude1) from meshcode
+# meshcode_to_latlong_grid_array(meshcode, extension=False)
+# : array version of meshcode_to_latlong_grid() for an array of integer meshcodes (arrays of lat0, long0, lat1, and long1 with the identical values)
 #
 # 2.
 #
@@ -94,6 +96,10 @@
 # : calculate an extended 1m (10m (14digits) / 10) grid square code (16 digits) from a geographical position (latitude, longitude)
 # - 0.03 arc-second for latitude and 0.045 arc-second for longitude
 #
+# cal_meshcode_array(latitude,longitude,level=3)
+# : array version of cal_meshcode1() - cal_meshcode6() and cal_meshcode_ex*() for arrays of latitude and longitude (int64 grid square codes identical to the scalar functions)
+# - level takes 1 to 6, "ex100m_12", "ex100m_13", "ex10m_14", or "ex1m_16"
+#
 # Structure of the world grid square code with compatibility to JIS X0410
 # A : area code (1 digit) A takes 1 to 8
 # ABBBBB : 80km grid square code (40 arc-minutes for latitude, 1 arc-degree for longitude) (6 digits)
@@ -124,6 +130,10 @@
 #
 
 import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 
 def meshcode_to_latlong(meshcode, extension=False):
     res=meshcode_to_latlong_grid(meshcode, extension)
@@ -493,6 +503,189 @@ def meshcode_to_latlong_grid(meshcode, extension=False):
     xx = {"lat0":int("99999"), "long0":int("99999"), "lat1":int("99999"), "long1":int("99999")}
     return xx
 
+# Array version of meshcode_to_latlong_grid()
+#
+# The integer grid square codes are split into digits by integer division and the
+# positions are computed with the same floating point operations (in the same order)
+# as meshcode_to_latlong_grid(), so that the results are identical.
+
+_POWERS_OF_10 = 10 ** np.arange(19, dtype=np.int64)
+# value of unsupported codes (same as meshcode_to_latlong_grid())
+_INVALID_LATLONG = 99999
+
+def _round_fixed(values, decimals):
+    # float("%.Nf" % value) for each value
+    # values * 10**N is rounded to an integer and divided again, which gives the same double
+    # when the integer is exact. Values which may round the other way (near a tie, or too large
+    # for an exact integer) are formatted one by one.
+    scale = float(10 ** decimals)
+    scaled = values * scale
+    rounded = np.rint(scaled)
+    unsure = (np.abs(np.abs(scaled - rounded) - 0.5) <= np.abs(np.spacing(scaled))) | (np.abs(scaled) >= 2.0 ** 52)
+    result = rounded / scale
+    for i in np.flatnonzero(unsure):
+        result[i] = float("%.*f" % (decimals, values[i]))
+    return result
+
+def _latlong_grid_of_length(codes, length, extension):
+    # north-western position, size and number of decimals of the grid squares with the given number of digits
+    # returns None for unsupported lengths
+    def digit(i):
+        return ((codes // _POWERS_OF_10[length-1-i]) % 10).astype(np.float64)
+    code0 = (codes // _POWERS_OF_10[length-1] - 1).astype(np.float64)
+    code12 = ((codes // _POWERS_OF_10[length-4]) % 1000).astype(np.float64)
+    code34 = ((codes // _POWERS_OF_10[length-6]) % 100).astype(np.float64)
+    z = code0 % 2
+    y = ((code0-z)/2) % 2
+    x = (code0-2*y-z)/4
+
+    if length==6:
+        lat0  = (code12-x+1) * 2.0 / 3.0
+        long0 = (code34+y) + 100*z
+        lat0  = (1-2*x)*lat0
+        long0 = (1-2*y)*long0
+        return lat0, long0, 2.0/3.0, 1.0, 8
+    code5 = digit(6)
+    code6 = digit(7)
+    if length==8:
+        lat0  = code12 * 2.0 / 3.0
+        long0 = code34 + 100*z
+        lat0  = lat0  + ((code5-x+1) * 2.0 / 3.0) / 8.0
+        long0 = long0 +  (code6+y) / 8.0
+        lat0 = (1-2*x) * lat0
+        long0 = (1-2*y) * long0
+        return lat0, long0, 2.0/3.0/8.0, 1.0/8.0, 8
+    code7 = digit(8)
+    code8 = digit(9)
+    if length==10:
+        lat0  = code12 * 2.0 / 3.0
+        long0 = code34 + 100*z
+        lat0  = lat0  + (code5 * 2.0 / 3.0) / 8.0
+        long0 = long0 +  code6 / 8.0
+        lat0  = lat0  + ((code7-x+1) * 2.0 / 3.0) / 8.0 / 10.0
+        long0 = long0 +  (code8+y) / 8.0 / 10.0
+        lat0 = (1-2*x)*lat0
+        long0 = (1-2*y)*long0
+        return lat0, long0, 2.0/3.0/8.0/10.0, 1/8.0/10.0, 8
+    code9 = digit(10)
+    if not extension and length in (11, 12, 13):
+        lat0  = code12 * 2.0 / 3.0
+        long0 = code34 + 100*z
+        lat0  = lat0  + (code5 * 2.0 / 3.0) / 8.0
+        long0 = long0 +  code6 / 8.0
+        lat0  = lat0  + ((code7-x+1) * 2.0 / 3.0) / 8.0 / 10.0
+        long0 = long0 +  (code8+y) / 8.0 / 10.0
+        lat0  = lat0  + (np.floor((code9-1)/2)+x-1) * 2.0 / 3.0 / 8.0 / 10.0 / 2.0
+        long0 = long0 + ((code9-1)%2-y) / 8.0 / 10.0 / 2.0
+        if length==11:
+            lat0 = (1-2*x)*lat0
+            long0 = (1-2*y)*long0
+            return lat0, long0, 2.0/3.0/8.0/10.0/2.0, 1.0/8.0/10.0/2.0, 8
+        code10 = digit(11)
+        lat0  = lat0  + (np.floor((code10-1)/2)+x-1) * 2.0 / 3.0 / 8.0 / 10.0 / 2.0 / 2.0
+        long0 = long0 + ((code10-1)%2-y) / 8.0 / 10.0 / 2.0 / 2.0
+        if length==12:
+            lat0 = (1-2*x)*lat0
+            long0 = (1-2*y)*long0
+            return lat0, long0, 2.0/3.0/8.0/10.0/2.0/2.0, 1.0/8.0/10.0/2.0/2.0, 10
+        code11 = digit(12)
+        lat0  = lat0  + (np.floor((code11-1)/2)+x-1) * 2.0 / 3.0 / 8.0 / 10.0 / 2.0 / 2.0 / 2.0
+        long0 = long0 + ((code11-1)%2-y) / 8.0 / 10.0 / 2.0 / 2.0 / 2.0
+        lat0 = (1-2*x)*lat0
+        long0 = (1-2*y)*long0
+        return lat0, long0, 2.0/3.0/8.0/10.0/2.0/2.0/2.0, 1.0/8.0/10.0/2.0/2.0/2.0, 10
+    if not extension or length < 12:
+        return None
+    codeex10 = digit(11)
+    if length==12:
+        # Extended 100m grid square code (12 digits)
+        codeex9 = code9
+        lat0  = code12 * 2.0 / 3.0
+        long0 = code34 + 100*z
+        lat0  = lat0 + code5 * 2.0 / 3.0 / 8.0
+        long0 = long0 + code6 / 8.0
+        lat0  = lat0 + code7 * 2.0 / 3.0 / 8.0 / 10.0
+        long0 = long0 + code8 / 8.0 / 10.0
+        lat0  = lat0 + ((codeex9-x+1) * 2.0 / 3.0) / 8.0 / 10.0 / 10.0
+        long0 = long0 + (codeex10+y) / 8.0 / 10.0 / 10.0
+        lat0 = (1-2*x)*lat0
+        long0 = (1-2*y)*long0
+        return lat0, long0, 2.0/3.0/8.0/10.0/10.0, 1.0/8.0/10.0/10.0, 10
+    codeex11 = digit(12)
+    if length==13:
+        # Extended 100m grid square code (13 digits)
+        lat0 = code12*2.0 / 3.0
+        long0 = code34 + 100.0*z
+        lat0 = lat0 + (code5*2.0/3.0) / 8.0
+        long0 = long0 + code6 / 8.0
+        lat0 = lat0 + ((code7-x+1)*2.0/3.0) / 8.0 / 10.0
+        long0 = long0 + (code8+y) / 8.0 / 10.0
+        lat0 = lat0 + (np.floor((code9-1)/2)+2*x-2) * 2.0 / 3.0 / 8.0 / 10.0 / 2.0
+        long0 = long0 + ((code9-1)%2-2*y) / 8.0 / 10.0 / 2.0
+        lat0 = lat0 + (codeex10-x+1)*2.0 / 3.0 / 8.0 / 10.0 / 2.0 / 5.0
+        long0 = long0 + (codeex11+y) / 8.0 / 10.0 / 2.0 / 5.0
+        lat0 = (1-2*x)*lat0
+        long0 = (1-2*y)*long0
+        return lat0, long0, 2.0/3.0/8.0/10.0/2.0/5.0, 1.0/8.0/10.0/2.0/5.0, 10
+    codeex9 = code9
+    codeex12 = digit(13)
+    if length==14:
+        # Extended 10m grid square code (14 digits)
+        lat0  = code12 * 2.0 / 3.0
+        long0 = code34 + 100*z
+        lat0  = lat0  + (code5 * 2.0 / 3.0) / 8.0
+        long0 = long0 +  code6 / 8.0
+        lat0 = lat0  + code7 * 2.0 / 3.0 / 8.0 / 10.0
+        long0 = long0 + code8 / 8.0 / 10.0
+        lat0  = lat0  + (codeex9 * 2.0 / 3.0) / 8.0 / 10.0 / 10.0
+        long0 = long0 + codeex10 / 8.0 / 10.0 / 10.0
+        lat0  = lat0  + ((codeex11-x+1) * 2.0 / 3.0) / 8.0 / 10.0 / 10.0 / 10.0
+        long0 = long0 + (codeex12+y) / 8.0 / 10.0 / 10.0 / 10.0
+        lat0 = (1-2*x)*lat0
+        long0 = (1-2*y)*long0
+        return lat0, long0, 2.0/3.0/8.0/10.0/10.0/10.0, 1.0/8.0/10.0/10.0/10.0, 12
+    if length==16:
+        # Extended 1m grid square code (16 digits)
+        codeex13 = digit(14)
+        codeex14 = digit(15)
+        lat0  = code12 * 2.0 / 3.0
+        long0 = code34 + 100*z
+        lat0  = lat0  + (code5 * 2.0 / 3.0) / 8.0
+        long0 = long0 +  code6 / 8.0
+        lat0  = lat0  + (code7 * 2.0 / 3.0) / 8.0 / 10.0
+        long0 = long0 + code8 / 8.0 / 10.0
+        lat0  = lat0  + (codeex9 * 2.0 / 3.0) / 8.0 / 10.0 / 10.0
+        long0 = long0 + codeex10 / 8.0 / 10.0 / 10.0
+        lat0 = lat0  + (codeex11 * 2.0 / 3.0) / 8.0 / 10.0 / 10.0 / 10.0
+        long0 = long0 + codeex12 / 8.0 / 10.0 / 10.0 / 10.0
+        lat0 = lat0  + ((codeex13-x+1) * 2.0 / 3.0) / 8.0 / 10.0 / 10.0 / 10.0 / 10.0
+        long0 = long0 + (codeex14+y) / 8.0 / 10.0 / 10.0 / 10.0 / 10.0
+        lat0 = (1-2*x)*lat0
+        long0 = (1-2*y)*long0
+        return lat0, long0, 2.0/3.0/8.0/10.0/10.0/10.0/10.0, 1.0/8.0/10.0/10.0/10.0/10.0, 14
+    return None
+
+def meshcode_to_latlong_grid_array(meshcode, extension=False):
+    codes = np.asarray(meshcode)
+    if codes.dtype.kind in "USO":
+        codes = codes.astype(str).astype(np.int64)
+    codes = codes.astype(np.int64)
+    lengths = np.searchsorted(_POWERS_OF_10, codes, side="right")
+    xx = {name: np.full(codes.shape, _INVALID_LATLONG, dtype=np.float64) for name in ("lat0", "long0", "lat1", "long1")}
+    for length in np.unique(lengths):
+        if length < 6:
+            continue
+        selected = (lengths==length)
+        res = _latlong_grid_of_length(codes[selected], int(length), extension)
+        if res is None:
+            continue
+        lat0, long0, dlat, dlong, decimals = res
+        xx["lat1"][selected] = _round_fixed(lat0-dlat, decimals)
+        xx["long1"][selected] = _round_fixed(long0+dlong, decimals)
+        xx["lat0"][selected] = _round_fixed(lat0, decimals)
+        xx["long0"][selected] = _round_fixed(long0, decimals)
+    return xx
+
 # calculate 3rd mesh code
 def cal_meshcode(latitude, longitude):
   return cal_meshcode3(latitude,longitude)
@@ -1114,6 +1307,175 @@ def cal_meshcode_ex1m_16(latitude, longitude):
     return(mesh)
 
 
+# Array versions of cal_meshcode1() - cal_meshcode6() and cal_meshcode_ex*()
+#
+# The digits are computed with the same floating point operations (in the same order)
+# as the scalar functions and composed into int64 codes by integer arithmetic, so that
+# the codes are identical to int() of the codes of the scalar functions.
+
+# number of points computed at once
+_BLOCK_SIZE = 16384
+# scalar function and number of digits of each level
+_MESHCODE_LEVELS = {
+    1: (cal_meshcode1, 6),
+    2: (cal_meshcode2, 8),
+    3: (cal_meshcode3, 10),
+    4: (cal_meshcode4, 11),
+    5: (cal_meshcode5, 12),
+    6: (cal_meshcode6, 13),
+    "ex100m_12": (cal_meshcode_ex100m_12, 12),
+    "ex100m_13": (cal_meshcode_ex100m_13, 13),
+    "ex10m_14": (cal_meshcode_ex10m_14, 14),
+    "ex1m_16": (cal_meshcode_ex1m_16, 16),
+}
+
+def _meshcode_digits(latitude, longitude, level):
+    # o, p, u and the following digits (float arrays) of the level
+    o = (latitude < 0)*4.0 + (longitude < 0)*2.0 + (np.abs(longitude) >= 100)*1.0
+    z = o % 2
+    y = ((o - z)/2) % 2
+    x = (o - 2*y - z)/4
+    #
+    o = o + 1
+    #
+    latitude = (1-2*x)*latitude
+    longitude = (1-2*y)*longitude
+    #
+    p = np.floor(latitude*60/40)
+    u = np.floor(longitude-100*z)
+    f = longitude-100*z-u
+    if level==1:
+        return o, p, u, []
+    if level in (2, 3, 4, 5):
+        a = (latitude*60/40-p)*40
+        q = np.floor(a/5)
+        v = np.floor(f*60/7.5)
+        if level==2:
+            return o, p, u, [q, v]
+        b = (a/5-q)*5
+        r = np.floor(b*60/30)
+        g = (f*60/7.5-v)*7.5
+        w = np.floor(g*60/45)
+        if level==3:
+            return o, p, u, [q, v, r, w]
+        c = (b*60/30-r)*30
+        s2u = np.floor(c/15)
+        h = (g*60/45-w)*45
+        s2l = np.floor(h/22.5)
+        s2 = s2u*2+s2l+1
+        if level==4:
+            return o, p, u, [q, v, r, w, s2]
+        d = (c/15-s2u)*15
+        s4u = np.floor(d/7.5)
+        i = (h/22.5-s2l)*22.5
+        s4l = np.floor(i/11.25)
+        s4 = s4u*2+s4l+1
+        return o, p, u, [q, v, r, w, s2, s4]
+    # refined calculation of cal_meshcode6() and cal_meshcode_ex*()
+    a = latitude*60-p*40
+    q = np.floor(a/5)
+    b = a-q*5
+    r = np.floor(b*60/30)
+    c = b*60-r*30
+    v = np.floor(f*60/7.5)
+    g = f*60-v*7.5
+    w = np.floor(g*60/45)
+    h = g*60-w*45
+    if level in (6, "ex100m_13"):
+        s2u = np.floor(c/15)
+        d = c-s2u*15
+        s2l = np.floor(h/22.5)
+        i = h-s2l*22.5
+        s2 = s2u*2+s2l+1
+        if level=="ex100m_13":
+            et = np.floor(d/3)
+            jt = np.floor(i/4.5)
+            return o, p, u, [q, v, r, w, s2, et, jt]
+        s4u = np.floor(d/7.5)
+        e = d-s4u*7.5
+        s8u = np.floor(e/3.75)
+        s4l = np.floor(i/11.25)
+        j = i-s4l*11.25
+        s8l = np.floor(j/5.625)
+        s4 = s4u*2+s4l+1
+        s8 = s8u*2+s8l+1
+        return o, p, u, [q, v, r, w, s2, s4, s8]
+    s = np.floor(c/3)
+    d = c-s*3
+    xx = np.floor(h/4.5)
+    i = h-xx*4.5
+    if level=="ex100m_12":
+        return o, p, u, [q, v, r, w, s, xx]
+    t = np.floor(d/0.3)
+    yy = np.floor(i/0.45)
+    if level=="ex10m_14":
+        return o, p, u, [q, v, r, w, s, xx, t, yy]
+    # tt of cal_meshcode_ex1m_16() is computed from d and may have two digits
+    tt = np.floor(d/0.03)
+    j = i-yy*0.45
+    zz = np.floor(j/0.045)
+    return o, p, u, [q, v, r, w, s, xx, t, yy, tt, zz]
+
+def _compose_meshcode(o, p, u, digits, level):
+    # int64 codes and the mask of the codes composed correctly
+    # (floored values are converted to integers and checked as unsigned, which also rejects negative values and NaN)
+    p = p.astype(np.int64)
+    u = u.astype(np.int64)
+    valid = (p.view(np.uint64) < 1000) & (u.view(np.uint64) < 100)
+    code = (o.astype(np.int64)*1000 + p)*100 + u
+    for cnt, digit in enumerate(digits):
+        digit = digit.astype(np.int64)
+        if level=="ex1m_16" and cnt==8:
+            valid &= digit.view(np.uint64) < 100
+            code = code*np.where(digit >= 10, 100, 10) + digit
+        else:
+            valid &= digit.view(np.uint64) < 10
+            code = code*10 + digit
+    return code, valid
+
+def cal_meshcode_array(latitude, longitude, level=3):
+    # level: 1 - 6 (cal_meshcode1() - cal_meshcode6()), "ex100m_12", "ex100m_13", "ex10m_14", or "ex1m_16"
+    if level not in _MESHCODE_LEVELS:
+        raise ValueError("unsupported level: " + str(level))
+    func, length = _MESHCODE_LEVELS[level]
+    invalid = int("9" * length)
+    latitude, longitude = np.broadcast_arrays(np.asarray(latitude, dtype=np.float64), np.asarray(longitude, dtype=np.float64))
+    shape = latitude.shape
+    latitude = latitude.ravel()
+    longitude = longitude.ravel()
+    code = np.empty(len(latitude), dtype=np.int64)
+    valid = np.empty(len(latitude), dtype=bool)
+
+    # computed in blocks which fit in the CPU cache (in threads when several CPUs are available)
+    # codes are composed with fixed widths, which is the same as the concatenation of the
+    # scalar functions when every digit is within its width (0 <= p < 1000, 0 <= u < 100, ...)
+    def compute_block(start):
+        block = slice(start, start + _BLOCK_SIZE)
+        with np.errstate(invalid="ignore", over="ignore"):
+            o, p, u, digits = _meshcode_digits(latitude[block], longitude[block], level)
+            code[block], valid[block] = _compose_meshcode(o, p, u, digits, level)
+    starts = range(0, len(latitude), _BLOCK_SIZE)
+    workers = min(len(starts), os.cpu_count() or 1)
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(compute_block, starts))
+    else:
+        for start in starts:
+            compute_block(start)
+
+    if level in (1, 2, 3, 4, 5, 6):
+        outside = (latitude < -90) | (latitude > 90) | (longitude < -180) | (longitude > 180)
+        code[outside] = invalid
+        valid |= outside
+    # the others (a negative digit or an invalid position) are computed one by one
+    for i in np.flatnonzero(~valid):
+        try:
+            code[i] = int(func(float(latitude[i]), float(longitude[i])))
+        except (ValueError, OverflowError):
+            code[i] = invalid
+    return code.reshape(shape)
+
+
 def Vincenty(latitude1,longitude1,latitude2,longitude2):
     # WGS84
     f = 1.0/298.257223563